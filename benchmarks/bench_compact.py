@@ -0,0 +1,33 @@
+"""Memory of a WHO-shaped dataset before and after compact, and the cost of compacting it and of fetching a frame
+from a date index keyed by text dates against one keyed by int32 day offsets.
+
+Run from the repository root with ``python -m benchmarks.bench_compact``.
+"""
+import timeit
+
+from epispread.data_classes.compact import compact, memory_report, to_day
+from epispread.graph_classes.date_index import DateIndex
+from benchmarks.bench_date_index import make_frame
+
+
+def main(sizes=(400, 1600, 6400), repeat=200):
+    print(f"{'rows':>10} {'MB before':>10} {'MB after':>10} {'compact ms':>11} {'text us':>9} {'days us':>9}")
+    for n_dates in sizes:
+        df = make_frame(n_dates, 240)
+        seconds = timeit.timeit(lambda: compact(df), number=1)
+        small = compact(df)
+        total = memory_report(df, small).loc['total']
+        date = df['Date_reported'].iloc[len(df) // 2]
+        text_index = DateIndex(df, 'Date_reported')
+        day_index = DateIndex(small, 'Date_reported')
+        text = timeit.timeit(lambda: text_index.frame(date), number=repeat) / repeat
+        day = to_day(date)
+        days = timeit.timeit(lambda: day_index.frame(day), number=repeat) / repeat
+        print(
+            f"{len(df):>10} {total['bytes_before'] / 2**20:>10.1f} {total['bytes_after'] / 2**20:>10.1f}"
+            f" {seconds * 1e3:>11.1f} {text * 1e6:>9.1f} {days * 1e6:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Frame fetch latency of HeatMap's date index versus a boolean scan, as the number of dates grows.
+
+Run from the repository root with ``python -m benchmarks.bench_date_index``.
+"""
+import datetime
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from epispread.graph_classes.date_index import DateIndex
+
+
+def make_frame(n_dates, n_places=200):
+    """Builds a WHO-shaped long DataFrame with one row per (place, date).
+
+    Args:
+        n_dates (int): number of distinct dates.
+        n_places (int, optional): number of places reporting on each date.
+
+    Returns:
+        DataFrame: the synthetic dataset.
+    """
+    start = datetime.date(2020, 1, 3)
+    dates = [(start + datetime.timedelta(days=i)).strftime('%Y-%m-%d') for i in range(n_dates)]
+    return pd.DataFrame(
+        {
+            'Date_reported': np.repeat(dates, n_places),
+            'Country_code': np.tile(['P%03d' % i for i in range(n_places)], n_dates),
+            'New_cases': np.random.default_rng(0).integers(0, 1000, n_dates * n_places),
+        }
+    )
+
+
+def main(sizes=(100, 400, 1600, 6400), repeat=200):
+    print(f"{'dates':>8} {'rows':>10} {'build ms':>10} {'index us':>10} {'scan us':>10}")
+    for n_dates in sizes:
+        df = make_frame(n_dates)
+        date = df['Date_reported'].iloc[len(df) // 2]
+
+        build = timeit.timeit(lambda: DateIndex(df, 'Date_reported'), number=1)
+        index = DateIndex(df, 'Date_reported')
+        fetch = timeit.timeit(lambda: index.frame(date).copy(), number=repeat) / repeat
+        scan = timeit.timeit(lambda: df.loc[df['Date_reported'] == date].copy(), number=repeat) / repeat
+        print(f"{n_dates:>8} {len(df):>10} {build * 1e3:>10.1f} {fetch * 1e6:>10.1f} {scan * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""End-to-end benchmark on a synthetic WHO-shaped dataset (see benchmarks.synthetic) at a chosen scale.
+The daily file and a case-level line listing are served from a local HTTP stand-in for covid19.who.int, then
+every stage a session goes through is timed: download, load, schema parse, heat map setup, frame fetch,
+frame render (slider step and the merge path), time series and line-listing ingestion. Each stage is run a
+second time under tracemalloc for its peak memory, so tracing does not skew the timings.
+
+Results are written as JSON; pass an earlier result to --compare to list the stages that got slower.
+
+Run from the repository root with ``python -m benchmarks.bench_end_to_end``, e.g.
+``python -m benchmarks.bench_end_to_end --scale medium --out e2e.json`` on one commit and
+``python -m benchmarks.bench_end_to_end --scale medium --compare e2e.json`` on the next.
+"""
+import argparse
+import contextlib
+import datetime
+import functools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import matplotlib
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+
+from epispread import EpiSpread  # noqa: E402
+from epispread.data_classes.compact import to_day  # noqa: E402
+from epispread.data_classes.downloader import Downloader  # noqa: E402
+from epispread.data_classes.incremental import IncrementalCache  # noqa: E402
+from epispread.data_classes.line_listing import LineListingAggregator  # noqa: E402
+from epispread.data_classes.schema import SchemaInference  # noqa: E402
+from epispread.data_classes.world_cache import WorldCache  # noqa: E402
+from epispread.graph_classes.heat_map import HeatMap  # noqa: E402
+from epispread.graph_classes.time_series import TimeSeries  # noqa: E402
+from benchmarks.synthetic import who_frame, write_line_listing  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+scales = {
+    'tiny': {'countries': 10, 'days': 30, 'extra_columns': 0, 'cases': 10_000},
+    'small': {'countries': 60, 'days': 300, 'extra_columns': 2, 'cases': 200_000},
+    'medium': {'countries': 240, 'days': 1000, 'extra_columns': 4, 'cases': 2_000_000},
+    'large': {'countries': 240, 'days': 3000, 'extra_columns': 20, 'cases': 10_000_000},
+}
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """Serves a directory like covid19.who.int serves its files, with Last-Modified, without logging."""
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def stand_in(directory):
+    """Serves directory over HTTP on a free local port.
+
+    Yields:
+        str: the base URL.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=directory))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextlib.contextmanager
+def fresh_caches(cache_dir):
+    """Points EpiSpread's dataset, world and schema caches at an empty directory, as on a first session."""
+    saved = EpiSpread.columnar_cache, EpiSpread.world_cache, EpiSpread.schema_inference
+    EpiSpread.columnar_cache = IncrementalCache(cache_dir)
+    EpiSpread.world_cache = WorldCache(cache_dir)
+    EpiSpread.schema_inference = SchemaInference(cache_dir)
+    try:
+        yield
+    finally:
+        EpiSpread.columnar_cache, EpiSpread.world_cache, EpiSpread.schema_inference = saved
+
+
+def measure(run, prepare=None, memory=True):
+    """Times one stage, then runs it again under tracemalloc for its peak memory.
+
+    Args:
+        run (callable): the stage; takes what prepare returned and may return a dict of extra figures.
+        prepare (callable, optional): untimed setup run before each pass, e.g. emptying a cache.
+        memory (bool, optional): whether to do the traced pass.
+
+    Returns:
+        dict: seconds, peak_bytes (None without the traced pass) and the stage's extra figures.
+    """
+    state = prepare() if prepare else None
+    start = time.perf_counter()
+    extra = run(state) or {}
+    result = {'seconds': time.perf_counter() - start, 'peak_bytes': None}
+    if memory:
+        state = prepare() if prepare else None
+        tracemalloc.start()
+        try:
+            run(state)
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    result.update(extra)
+    return result
+
+
+def _commit():
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def run_suite(countries, days, extra_columns=0, cases=100_000, frames=30, memory=True, work_dir=None):
+    """Generates the data, serves it and measures every stage.
+
+    Args:
+        countries (int): number of countries; the first ones carry real iso_a3 codes of the world map.
+        days (int): number of days.
+        extra_columns (int, optional): additional numeric columns of the daily file.
+        cases (int, optional): rows of the line listing.
+        frames (int, optional): number of slider positions fetched and rendered, spread over the dates.
+        memory (bool, optional): whether to measure the peak memory of every stage.
+        work_dir (str, optional): where files and caches go. Defaults to a temporary directory.
+
+    Returns:
+        dict: 'meta', 'scale' and one entry per stage, see measure.
+    """
+    owned = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='epispread-e2e-')
+    stages = {}
+    try:
+        served = os.path.join(work_dir, 'served')
+        os.makedirs(served, exist_ok=True)
+        world = WorldCache.shared().load()
+        start = time.perf_counter()
+        df = who_frame(countries, days, extra_columns, codes=list(world['iso_a3']))
+        df.to_csv(os.path.join(served, 'WHO-COVID-19-global-data.csv'), index=False)
+        write_line_listing(os.path.join(served, 'line-listing.csv'), cases, df['Country_code'].unique(), days)
+        generate_seconds = time.perf_counter() - start
+        del df
+
+        downloads = os.path.join(work_dir, 'downloads')
+        with stand_in(served) as base_url:
+            urls = [f"{base_url}/WHO-COVID-19-global-data.csv", f"{base_url}/line-listing.csv"]
+            downloader = Downloader(dest_dir=downloads)
+
+            def download(state):
+                report = downloader.fetch(urls)
+                return {'bytes': report.bytes_transferred, 'cache_hits': len(report.cache_hits)}
+
+            stages['download'] = measure(download, lambda: shutil.rmtree(downloads, ignore_errors=True), memory)
+            stages['download_cached'] = measure(download, memory=memory)
+        daily = os.path.join(downloads, 'WHO-COVID-19-global-data.csv')
+        listing = os.path.join(downloads, 'line-listing.csv')
+
+        cache_dir = os.path.join(work_dir, 'cache')
+        loaded = {}
+        with fresh_caches(cache_dir):
+
+            def load(state):
+                loaded.update(zip(('df', 'world'), EpiSpread._read_data(daily)))
+                return {'rows': len(loaded['df'])}
+
+            def parse(state):
+                columns = EpiSpread._parse_columns(loaded['df'], daily)
+                return {'time_series': len(columns[3])}
+
+            def empty_cache():
+                shutil.rmtree(cache_dir, ignore_errors=True)
+                EpiSpread.columnar_cache = IncrementalCache(cache_dir)
+                EpiSpread.world_cache = WorldCache(cache_dir)
+                EpiSpread.schema_inference = SchemaInference(cache_dir)
+
+            stages['load_cold'] = measure(load, empty_cache, memory)
+            stages['load_warm'] = measure(load, memory=memory)
+            stages['schema_parse_cold'] = measure(
+                parse, lambda: setattr(EpiSpread, 'schema_inference', SchemaInference(None)), memory
+            )
+            stages['schema_parse_warm'] = measure(parse, memory=memory)
+        df, world = loaded['df'], loaded['world']
+
+        first_day = to_day(df['Date_reported'].iloc[0])
+        offsets = np.linspace(0, days - 1, min(frames, days)).astype(int)
+
+        def heat_map(engine='frames', render_mode='collection'):
+            built = HeatMap(
+                df,
+                world,
+                'New_cases',
+                first_day,
+                'Country_code',
+                'Date_reported',
+                1,
+                render_mode=render_mode,
+                engine=engine,
+                frame_cache_size=0,
+                prefetch=0,
+            )
+            built._prepare()
+            built.time_slider.valmax = days - 1
+            built.fig.canvas.draw()
+            return built
+
+        maps = {}
+
+        def setup(state):
+            plt.close('all')
+            maps['frames'] = heat_map()
+            return {'regions': maps['frames'].choropleth.n_regions}
+
+        stages['heat_map_setup'] = measure(setup, memory=memory)
+        maps['cube'] = heat_map(engine='cube')
+
+        def fetch(engine):
+            def run(state):
+                for offset in offsets:
+                    maps[engine]._frame_values(first_day + int(offset))
+                return {'frames': len(offsets)}
+
+            return run
+
+        def render(state):
+            for offset in offsets:
+                maps['frames']._update(int(offset))
+            return {'frames': len(offsets)}
+
+        stages['frame_fetch'] = measure(fetch('frames'), memory=memory)
+        stages['frame_fetch_cube'] = measure(fetch('cube'), memory=memory)
+        stages['frame_render'] = measure(render, memory=memory)
+        plt.close('all')
+
+        merge_offsets = offsets[:3]
+
+        def render_merge(state):
+            merged = HeatMap(df, world, 'New_cases', first_day, 'Country_code', 'Date_reported', 1, render_mode='merge')
+            for offset in merge_offsets:
+                merged._render(first_day + int(offset))
+            plt.close(merged.fig)
+            return {'frames': len(merge_offsets)}
+
+        stages['frame_render_merge'] = measure(render_merge, memory=memory)
+
+        def time_series(state):
+            TimeSeries(df, 'Date_reported', 'Country', 'New_cases').save(os.path.join(work_dir, 'time_series.png'))
+            plt.close('all')
+
+        stages['time_series'] = measure(time_series, memory=memory)
+
+        def ingest(state):
+            aggregator = LineListingAggregator('Onset', 'Country_code', ['Age'], chunk_size=250_000)
+            aggregator.aggregate(listing)
+            return {'rows': aggregator.rows, 'rows_per_second': aggregator.rows_per_second}
+
+        stages['line_listing'] = measure(ingest, memory=memory)
+    finally:
+        plt.close('all')
+        if owned:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    for name in ('frame_fetch', 'frame_fetch_cube', 'frame_render', 'frame_render_merge'):
+        stages[name]['per_frame_ms'] = stages[name]['seconds'] / stages[name]['frames'] * 1e3
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else None
+    return {
+        'meta': {
+            'commit': _commit(),
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'max_rss_bytes': max_rss,
+            'generate_seconds': generate_seconds,
+        },
+        'scale': {'countries': countries, 'days': days, 'extra_columns': extra_columns, 'cases': cases},
+        'stages': stages,
+    }
+
+
+def format_results(results):
+    """One line per stage: seconds, peak memory and per-frame time where it applies."""
+    lines = [f"{'stage':<20} {'seconds':>9} {'peak MB':>9} {'ms/frame':>9}"]
+    for name, stage in results['stages'].items():
+        peak = '' if stage['peak_bytes'] is None else f"{stage['peak_bytes'] / 2**20:.1f}"
+        per_frame = f"{stage['per_frame_ms']:.2f}" if 'per_frame_ms' in stage else ''
+        lines.append(f"{name:<20} {stage['seconds']:>9.3f} {peak:>9} {per_frame:>9}")
+    return "\n".join(lines)
+
+
+def compare(base, current, threshold=1.2, min_seconds=0.005):
+    """Compares the stage timings of two results.
+
+    Args:
+        base (dict): the earlier result.
+        current (dict): the new result.
+        threshold (float, optional): a stage that takes more than threshold times as long counts as a regression.
+        min_seconds (float, optional): slowdowns smaller than this are timer noise, not regressions.
+
+    Returns:
+        (str, list[str]): a table of the ratios, and the names of the regressed stages.
+    """
+    lines = [f"{'stage':<20} {'base s':>9} {'now s':>9} {'ratio':>7}"]
+    regressed = []
+    for name, stage in current['stages'].items():
+        if name not in base['stages']:
+            continue
+        before = base['stages'][name]['seconds']
+        ratio = stage['seconds'] / before if before else float('inf')
+        slower = ratio > threshold and stage['seconds'] - before > min_seconds
+        if slower:
+            regressed.append(name)
+        flag = '  slower' if slower else ''
+        lines.append(f"{name:<20} {before:>9.3f} {stage['seconds']:>9.3f} {ratio:>7.2f}{flag}")
+    if base['scale'] != current['scale']:
+        lines.append(f"note: scales differ, {base['scale']} vs {current['scale']}")
+    return "\n".join(lines), regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark on a synthetic WHO-shaped dataset")
+    parser.add_argument('--scale', choices=sorted(scales), default='small', help="preset size of the dataset")
+    parser.add_argument('--countries', type=int, help="override the number of countries")
+    parser.add_argument('--days', type=int, help="override the number of days")
+    parser.add_argument('--extra-columns', type=int, help="override the number of extra numeric columns")
+    parser.add_argument('--cases', type=int, help="override the number of line-listing rows")
+    parser.add_argument('--frames', type=int, default=30, help="slider positions fetched and rendered")
+    parser.add_argument('--no-memory', action='store_true', help="skip the traced pass that measures peak memory")
+    parser.add_argument('--out', default='e2e-results.json', help="where to write the JSON results")
+    parser.add_argument('--compare', help="an earlier JSON result to compare the timings with")
+    parser.add_argument('--threshold', type=float, default=1.2, help="slowdown ratio that counts as a regression")
+    args = parser.parse_args(argv)
+
+    scale = dict(scales[args.scale])
+    for key in ('countries', 'days', 'extra_columns', 'cases'):
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+    results = run_suite(frames=args.frames, memory=not args.no_memory, **scale)
+    results['meta']['scale_name'] = args.scale
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(format_results(results))
+    print(f"results written to {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            table, regressed = compare(json.load(f), results, args.threshold)
+        print(table)
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
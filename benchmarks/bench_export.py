@@ -0,0 +1,34 @@
+"""Frames per second of the headless animation export as the number of rendering processes grows.
+
+Run from the repository root with ``python -m benchmarks.bench_export``.
+"""
+import os
+import tempfile
+import time
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+from epispread import EpiSpread  # noqa: E402
+from epispread.graph_classes.export import FrameExporter  # noqa: E402
+
+from .bench_heat_map import make_frame  # noqa: E402
+
+
+def main(n_dates=96):
+    _, world = EpiSpread._read_data("epispread/tests/test-db.csv")
+    df = make_frame(world, n_dates)
+    exporter = FrameExporter(df, world, 'New_cases', 'Country_code', 'Date_reported')
+    cpus = os.cpu_count() or 1
+    print(f"{'workers':>8} {'frames':>7} {'seconds':>8} {'frames/s':>9}")
+    for workers in sorted({1, 2, 4, cpus}):
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            frames = exporter.render_frames(tmp, workers=workers)
+            elapsed = time.perf_counter() - start
+        print(f"{workers:>8} {len(frames):>7} {elapsed:>8.2f} {len(frames) / elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
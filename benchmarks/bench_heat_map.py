@@ -0,0 +1,78 @@
+"""Slider-step latency and memory growth of HeatMap's render modes and frame engines.
+
+Run from the repository root with ``python -m benchmarks.bench_heat_map``.
+"""
+import datetime
+import time
+import tracemalloc
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from epispread import EpiSpread, HeatMap  # noqa: E402
+
+
+def make_frame(world, n_dates):
+    """Builds a WHO-shaped long DataFrame keyed on the world's ISO3 codes.
+
+    Args:
+        world (GeoDataFrame): the world polygons.
+        n_dates (int): number of distinct dates.
+
+    Returns:
+        DataFrame: the synthetic dataset.
+    """
+    codes = world.iso_a3.to_numpy()
+    start = datetime.date(2020, 1, 3)
+    dates = [(start + datetime.timedelta(days=i)).strftime('%Y-%m-%d') for i in range(n_dates)]
+    return pd.DataFrame(
+        {
+            'Date_reported': np.repeat(dates, len(codes)),
+            'Country_code': np.tile(codes, n_dates),
+            'New_cases': np.random.default_rng(0).integers(0, 1000, n_dates * len(codes)),
+        }
+    )
+
+
+def step_latency(heat_map, steps):
+    """Median wall time of a slider step, then (in a second pass, since tracing slows Python down)
+    how much traced memory the same steps leave behind.
+    """
+    heat_map._prepare()
+    heat_map.fig.canvas.draw()
+    timings = []
+    for offset in steps:
+        start = time.perf_counter()
+        heat_map.time_slider.set_val(offset)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for offset in steps:
+        heat_map.time_slider.set_val(offset)
+    growth = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return np.median(timings), growth
+
+
+def main(n_dates=600, n_steps=30):
+    _, world = EpiSpread._read_data("epispread/tests/test-db.csv")
+    df = make_frame(world, n_dates)
+    steps = [(i * 20) % n_dates for i in range(1, n_steps + 1)]
+    print(f"{'mode':>12} {'engine':>8} {'median ms':>10} {'growth KiB':>11}")
+    for mode, engine in (('collection', 'frames'), ('collection', 'cube'), ('merge', 'frames')):
+        heat_map = HeatMap(
+            df, world, 'New_cases', '2020-01-03', 'Country_code', 'Date_reported', 1, render_mode=mode, engine=engine
+        )
+        latency, growth = step_latency(heat_map, steps)
+        print(f"{mode:>12} {engine:>8} {latency * 1e3:>10.1f} {growth / 1024:>11.0f}")
+        plt.close(heat_map.fig)
+
+
+if __name__ == "__main__":
+    main()
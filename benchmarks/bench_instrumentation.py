@@ -0,0 +1,29 @@
+"""Cost of one instrumented stage per call: disabled (the default), enabled, and enabled with a latency histogram.
+
+Run from the repository root with ``python -m benchmarks.bench_instrumentation``.
+"""
+import timeit
+
+from epispread.data_classes.instrumentation import Instrumentation
+
+
+def run_stage(instrumentation, histogram=None):
+    with instrumentation.stage('update', histogram=histogram):
+        pass
+
+
+def main(number=200_000):
+    print(f"{'mode':>12} {'ns/call':>9}")
+    bare = timeit.timeit(lambda: None, number=number) / number
+    modes = {
+        'disabled': (Instrumentation(), None),
+        'enabled': (Instrumentation(enabled=True), None),
+        'histogram': (Instrumentation(enabled=True), 'frame_latency'),
+    }
+    for name, (instrumentation, histogram) in modes.items():
+        seconds = timeit.timeit(lambda: run_stage(instrumentation, histogram), number=number) / number
+        print(f"{name:>12} {(seconds - bare) * 1e9:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
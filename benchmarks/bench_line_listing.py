@@ -0,0 +1,64 @@
+"""Throughput and peak memory of chunked line-listing ingestion versus reading the whole file, as the file grows.
+
+Run from the repository root with ``python -m benchmarks.bench_line_listing``.
+"""
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from epispread.data_classes.line_listing import LineListingAggregator
+
+
+def write_listing(path, n_rows, n_dates=365, n_regions=200, block=1_000_000):
+    """Writes a synthetic line listing, one row per case, in blocks so the generator itself stays small."""
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2020-01-03', periods=n_dates).strftime('%Y-%m-%d').to_numpy()
+    regions = np.array(['R%03d' % i for i in range(n_regions)])
+    for first in range(0, n_rows, block):
+        size = min(block, n_rows - first)
+        pd.DataFrame(
+            {
+                'Onset': dates[rng.integers(0, n_dates, size)],
+                'Region': regions[rng.integers(0, n_regions, size)],
+                'Age': rng.integers(0, 90, size),
+                'Note': 'x' * 20,
+            }
+        ).to_csv(path, mode='a', header=first == 0, index=False)
+
+
+def measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def whole_file(path):
+    df = pd.read_csv(path)
+    return df.groupby(['Onset', 'Region']).agg(Cases=('Age', 'size'), Age=('Age', 'sum'))
+
+
+def main(sizes=(500_000, 2_000_000), chunk_size=250_000):
+    print(f"{'rows':>10} {'chunked s':>10} {'rows/s':>12} {'peak MB':>8} {'whole s':>8} {'peak MB':>8}")
+    for n_rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'listing.csv')
+            write_listing(path, n_rows)
+            aggregator = LineListingAggregator('Onset', 'Region', ['Age'], chunk_size=chunk_size)
+            chunked, chunked_peak = measure(lambda: aggregator.aggregate(path))
+            whole, whole_peak = measure(lambda: whole_file(path))
+        print(
+            f"{n_rows:>10} {chunked:>10.2f} {aggregator.rows_per_second:>12,.0f} {chunked_peak / 2**20:>8.0f}"
+            f" {whole:>8.2f} {whole_peak / 2**20:>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Time to derive rolling means, per-capita rates and week-over-week growth for every country of a WHO-shaped
+dataset: pandas groupby/rolling against DerivedMetrics, cold and memoized.
+
+Run from the repository root with ``python -m benchmarks.bench_metrics``.
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from epispread.data_classes.metrics import DerivedMetrics
+from benchmarks.bench_date_index import make_frame
+
+names = ['New_cases_avg7', 'New_cases_avg14', 'New_cases_per100k', 'New_cases_wow']
+
+
+def pandas_metrics(df, population):
+    ordered = df.sort_values(['Country_code', 'Date_reported'])
+    grouped = ordered.groupby('Country_code')['New_cases']
+    weekly = grouped.rolling(7).sum().reset_index(level=0, drop=True)
+    return {
+        'New_cases_avg7': grouped.rolling(7).mean(),
+        'New_cases_avg14': grouped.rolling(14).mean(),
+        'New_cases_per100k': ordered['New_cases'] / ordered['Country_code'].map(population) * 1e5,
+        'New_cases_wow': weekly / weekly.groupby(ordered['Country_code']).shift(7) - 1,
+    }
+
+
+def main(sizes=(400, 1600)):
+    print(f"{'rows':>10} {'pandas ms':>10} {'cold ms':>10} {'memo ms':>10}")
+    for n_dates in sizes:
+        df = make_frame(n_dates, 240)
+        population = pd.Series(np.linspace(1e5, 1e9, 240), index=sorted(df['Country_code'].unique()))
+        legacy = timeit.timeit(lambda: pandas_metrics(df, population), number=1)
+        metrics = DerivedMetrics(df, 'Date_reported', 'Country_code', population)
+        cold = timeit.timeit(lambda: [metrics.values(name) for name in names], number=1)
+        memo = timeit.timeit(lambda: [metrics.values(name) for name in names], number=10) / 10
+        print(f"{len(df):>10} {legacy * 1e3:>10.1f} {cold * 1e3:>10.1f} {memo * 1e3:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
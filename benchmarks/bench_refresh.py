@@ -0,0 +1,35 @@
+"""Cost of taking in one more day of a WHO-shaped file: a full rebuild versus an incremental refresh,
+for a file that grows by appending and for one sorted by place (new rows interleaved).
+
+Run from the repository root with ``python -m benchmarks.bench_refresh``.
+"""
+import os
+import tempfile
+import timeit
+
+from epispread.data_classes.incremental import IncrementalCache
+from benchmarks.bench_date_index import make_frame
+
+
+def main(n_dates=1000, n_places=240):
+    df = make_frame(n_dates + 1, n_places)
+    old, new = df.iloc[:-n_places], df
+    print(f"{'layout':>12} {'rows':>9} {'rebuild s':>10} {'refresh s':>10} {'mode':>8}")
+    for layout in ('appended', 'interleaved'):
+        if layout == 'interleaved':
+            old, new = (frame.sort_values('Country_code', kind='stable') for frame in (old, new))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'global.csv')
+            cache = IncrementalCache(os.path.join(tmp, 'cache'))
+            new.to_csv(path, index=False)
+            rebuild = timeit.timeit(lambda: cache.build(path), number=1)
+
+            old.to_csv(path, index=False)
+            cache.refresh(path, 'Date_reported')
+            new.to_csv(path, index=False)
+            report = cache.refresh(path, 'Date_reported')
+        print(f"{layout:>12} {len(new):>9} {rebuild:>10.3f} {report.seconds:>10.3f} {report.mode:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Regional and global curves of a WHO-shaped dataset by day, ISO week and month: an ad-hoc pivot_table over the
+rows per request against reading them from a Rollup built once, and the cost of adding one day to the Rollup.
+
+Run from the repository root with ``python -m benchmarks.bench_rollup``.
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from epispread.data_classes.compact import to_days
+from epispread.data_classes.rollup import Rollup, bucket_starts
+
+from .synthetic import who_frame
+
+columns = ['New_cases', 'Cumulative_cases', 'New_deaths', 'Cumulative_deaths']
+views = [(level, bucket) for level in ('WHO_region', 'global') for bucket in Rollup.buckets]
+
+
+def pivot(df, days, level, bucket):
+    """The curves of one view the way they were built before: grouping all rows."""
+    buckets = pd.Series(bucket_starts(days, bucket), index=df.index)
+    keys = df[level] if level != 'global' else pd.Series('global', index=df.index)
+    return df.pivot_table(index=buckets, columns=keys, values='New_cases', aggfunc='sum')
+
+
+def main(sizes=(240, 960), n_days=1800):
+    print(
+        f"{'rows':>10} {'build ms':>9} {'pivot ms':>9} {'rollup ms':>10} {'extend ms':>10} {'MB rows':>8} "
+        f"{'MB rollup':>10}"
+    )
+    for n_countries in sizes:
+        df = who_frame(n_countries, n_days + 1)
+        last = df['Date_reported'] == df['Date_reported'].max()
+        history, new_day = df[~last], df[last]
+        days = to_days(history['Date_reported']).to_numpy()
+        build = timeit.timeit(
+            lambda: Rollup(history, 'Date_reported', 'Country_code', columns, ['WHO_region']), number=1
+        )
+        rollup = Rollup(history, 'Date_reported', 'Country_code', columns, ['WHO_region'])
+        adhoc = timeit.timeit(lambda: [pivot(history, days, *view) for view in views], number=1) / len(views)
+        read = timeit.timeit(lambda: [rollup.wide('New_cases', *view) for view in views], number=10) / 10 / len(views)
+        extend = timeit.timeit(lambda: rollup.extend(new_day), number=1)
+        rows_mb = history.memory_usage(deep=True).sum() / 2**20
+        print(
+            f"{len(history):>10} {build * 1e3:>9.1f} {adhoc * 1e3:>9.1f} {read * 1e3:>10.3f} {extend * 1e3:>10.2f} "
+            f"{rows_mb:>8.1f} {rollup.nbytes / 2**20:>10.1f}"
+        )
+        np.testing.assert_allclose(
+            rollup.wide('New_cases', 'WHO_region', 'week').to_numpy()[:-1],
+            pivot(history, days, 'WHO_region', 'week').to_numpy()[:-1],
+            rtol=1e-5,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Schema inference time of a wide, long dataset: the old first-row parse, a cold inference and a cached lookup.
+
+Run from the repository root with ``python -m benchmarks.bench_schema``.
+"""
+import tempfile
+import timeit
+
+import numpy as np
+
+from epispread.data_classes.schema import SchemaInference
+from benchmarks.bench_date_index import make_frame
+
+
+def make_wide_frame(n_dates, n_places=200, n_numbers=45):
+    """Adds numeric and text columns to the WHO-shaped frame of bench_date_index until it is ~50 columns wide."""
+    df = make_frame(n_dates, n_places)
+    df['Country'] = np.tile(['Place %03d' % i for i in range(n_places)], n_dates)
+    df['WHO_region'] = np.tile(['R%d' % (i % 6) for i in range(n_places)], n_dates)
+    rng = np.random.default_rng(1)
+    for i in range(n_numbers):
+        df['Metric_%02d' % i] = rng.random(len(df))
+    return df
+
+
+def legacy_parse(df):
+    """The original first-row classification plus a per-column time-series scan."""
+    number_columns = [c for i, c in enumerate(df.columns) if isinstance(df.iloc[0, i], (np.int64, np.float64))]
+    date_columns = [c for c in df.columns if "date" in c.lower()]
+    iso_columns = [c for c in df.columns if "iso" in c.lower() or "code" in c.lower()]
+    series = []
+    for column in set(df.columns).difference(number_columns + date_columns + iso_columns):
+        single = df.loc[df[column] == df[column].iloc[0]]
+        for date_column in date_columns:
+            dates = list(single[date_column])
+            if len(set(dates)) == len(dates) > 1:
+                series.append([column, date_column])
+                break
+    return number_columns, date_columns, iso_columns, series
+
+
+def main(sizes=(1000, 10000)):
+    print(f"{'rows':>10} {'cols':>5} {'legacy ms':>10} {'infer ms':>10} {'cached ms':>10}")
+    for n_dates in sizes:
+        df = make_wide_frame(n_dates)
+        legacy = timeit.timeit(lambda: legacy_parse(df), number=1)
+        with tempfile.TemporaryDirectory() as tmp:
+            inference = SchemaInference(tmp)
+            cold = timeit.timeit(lambda: inference.schema(df, 'content-hash'), number=1)
+            cached = timeit.timeit(lambda: inference.schema(df, 'content-hash'), number=20) / 20
+        print(f"{len(df):>10} {len(df.columns):>5} {legacy * 1e3:>10.1f} {cold * 1e3:>10.1f} {cached * 1e3:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
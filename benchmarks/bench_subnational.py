@@ -0,0 +1,89 @@
+"""Slider-step latency of HeatMap on sub-national boundaries of 1k to 40k regions, drawn as polygons and as
+a raster of region ids, and the speed of locating geocoded cases in the regions.
+
+Run from the repository root with ``python -m benchmarks.bench_subnational``.
+"""
+import time
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from epispread import HeatMap  # noqa: E402
+from epispread.data_classes.regions import RegionLocator  # noqa: E402
+
+from .synthetic import admin_regions  # noqa: E402
+
+
+def admin_frame(regions, n_dates):
+    """Daily counts for every region."""
+    dates = pd.date_range('2021-01-01', periods=n_dates).strftime('%Y-%m-%d').to_numpy()
+    codes = regions['code'].to_numpy()
+    return pd.DataFrame(
+        {
+            'Date': np.repeat(dates, len(codes)),
+            'Region': np.tile(codes, n_dates),
+            'Cases': np.random.default_rng(0).poisson(20, n_dates * len(codes)),
+        }
+    )
+
+
+def step_latency(regions, df, raster_threshold, steps=5):
+    """Seconds to set up the map, and median seconds of a slider step (frame lookup, recolour and blit)."""
+    start = time.perf_counter()
+    heat_map = HeatMap(
+        df,
+        regions,
+        'Cases',
+        df['Date'].iloc[0],
+        'Region',
+        'Date',
+        1,
+        region_key='code',
+        lod=None,
+        engine='cube',
+        prefetch=0,
+        raster_threshold=raster_threshold,
+    )
+    heat_map._prepare()
+    heat_map.fig.canvas.draw()
+    setup = time.perf_counter() - start
+    timings = []
+    for step in range(1, steps + 1):
+        start = time.perf_counter()
+        heat_map._update(step)
+        heat_map._blit()
+        timings.append(time.perf_counter() - start)
+    plt.close(heat_map.fig)
+    return setup, float(np.median(timings))
+
+
+def main(sizes=(1_000, 10_000, 40_000), n_dates=30, n_points=1_000_000):
+    print(f"{'regions':>8} {'mode':>8} {'setup s':>9} {'step ms':>9}")
+    for n_regions in sizes:
+        regions = admin_regions(n_regions)
+        df = admin_frame(regions, n_dates)
+        for mode, threshold in (('polygons', None), ('raster', 0)):
+            setup, step = step_latency(regions, df, threshold)
+            print(f"{n_regions:>8} {mode:>8} {setup:>9.2f} {step * 1e3:>9.1f}")
+
+    regions = admin_regions(sizes[-1])
+    locator = RegionLocator(regions, 'code')
+    x0, y0, x1, y1 = regions.total_bounds
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(x0, x1, n_points), rng.uniform(y0, y1, n_points)
+    start = time.perf_counter()
+    located = locator.locate(x, y)
+    seconds = time.perf_counter() - start
+    print(
+        f"located {n_points:,} points in {len(regions):,} regions in {seconds:.2f}s "
+        f"({n_points / seconds:,.0f} points/s, {np.mean(located >= 0):.0%} inside a region)"
+    )
+
+
+if __name__ == "__main__":
+    main()
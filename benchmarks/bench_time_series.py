@@ -0,0 +1,80 @@
+"""Draw time of TimeSeries with every country of a WHO-shaped dataset: the original in-place to_datetime,
+pivot_table and pandas plot, against the cached pivot drawn as one decimated LineCollection.
+
+Run from the repository root with ``python -m benchmarks.bench_time_series``.
+"""
+import os
+import tempfile
+import time
+
+import matplotlib
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from epispread.graph_classes.time_series import TimeSeries  # noqa: E402
+
+
+def make_epidemic_frame(n_dates=1500, n_countries=240, seed=0):
+    """Builds a long DataFrame of daily cases per country: a few epidemic waves of country-specific size,
+    with Poisson reporting noise.
+
+    Args:
+        n_dates (int, optional): number of days.
+        n_countries (int, optional): number of countries.
+        seed (int, optional): random seed.
+
+    Returns:
+        DataFrame: Date_reported, Country and New_cases columns.
+    """
+    rng = np.random.default_rng(seed)
+    days = np.arange(n_dates)
+    size = rng.lognormal(6, 2, n_countries)[:, None]
+    peaks = rng.uniform(0, n_dates, (n_countries, 4))
+    widths = rng.uniform(20, 90, (n_countries, 4))
+    waves = np.exp(-(((days[None, None, :] - peaks[..., None]) / widths[..., None]) ** 2)).sum(axis=1)
+    cases = rng.poisson(size * waves)
+    dates = pd.date_range('2020-01-03', periods=n_dates).strftime('%Y-%m-%d')
+    return pd.DataFrame(
+        {
+            'Date_reported': np.tile(dates, n_countries),
+            'Country': np.repeat(['Country %03d' % i for i in range(n_countries)], n_dates),
+            'New_cases': cases.ravel(),
+        }
+    )
+
+
+def legacy_save(df, path):
+    df = df.copy()
+    df['Date_reported'] = pd.to_datetime(df['Date_reported'])
+    ax = df.pivot_table(index='Date_reported', columns='Country', values='New_cases', aggfunc='sum').plot()
+    ax.figure.savefig(path)
+    plt.close(ax.figure)
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main():
+    df = make_epidemic_frame()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'lines.png')
+        print(f"{'variant':<24} {'first s':>8} {'redraw s':>9}")
+        legacy = timed(lambda: legacy_save(df, path))
+        print(f"{'pivot_table + plot':<24} {legacy:>8.2f} {legacy:>9.2f}")
+        for decimation in (None, 'minmax', 'lttb'):
+            series = TimeSeries(df, 'Date_reported', 'Country', 'New_cases', decimation=decimation)
+            first = timed(lambda: series.save(path))
+            again = timed(lambda: series.save(path))
+            print(f"{'collection ' + str(decimation):<24} {first:>8.2f} {again:>9.2f}")
+        top = TimeSeries(df, 'Date_reported', 'Country', 'New_cases', top_n=10)
+        print(f"{'collection top 10':<24} {timed(lambda: top.save(path)):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Synthetic WHO-shaped datasets at configurable scales, for the end-to-end benchmark (bench_end_to_end).
+
+The daily file mirrors WHO-COVID-19-global-data.csv: one row per (country, day), sorted by country then date,
+with a few epidemic waves per country and Poisson reporting noise. Extra numeric columns and case-level line
+listings can be added to stress wide files and the ingestion path. admin_regions stands in for sub-national boundaries.
+"""
+import numpy as np
+import pandas as pd
+import shapely
+
+regions = np.array(['AFRO', 'AMRO', 'EMRO', 'EURO', 'SEARO', 'WPRO'])
+
+
+def country_codes(n_countries, known=()):
+    """Codes for n_countries countries: the known codes first (e.g. the world's iso_a3 column, so that rows
+    match polygons), then made-up codes that match nothing, like the territories of the real file.
+
+    Args:
+        n_countries (int): number of codes.
+        known (list[str], optional): real codes to use first.
+
+    Returns:
+        list[str]: the codes.
+    """
+    known = list(dict.fromkeys(code for code in known if isinstance(code, str) and code.isalpha()))
+    return (known + ['Q%03d' % i for i in range(max(0, n_countries - len(known)))])[:n_countries]
+
+
+def who_frame(n_countries, n_days, extra_columns=0, codes=None, start='2020-01-03', seed=0):
+    """Builds a WHO-shaped daily dataset.
+
+    Args:
+        n_countries (int): number of countries.
+        n_days (int): number of days.
+        extra_columns (int, optional): number of additional float columns (Metric_00, Metric_01, ...).
+        codes (list[str], optional): country codes, see country_codes. Defaults to made-up codes.
+        start (str, optional): first date.
+        seed (int, optional): random seed.
+
+    Returns:
+        DataFrame: Date_reported, Country_code, Country, WHO_region, New_cases, Cumulative_cases, New_deaths,
+        Cumulative_deaths and the extra columns.
+    """
+    rng = np.random.default_rng(seed)
+    codes = np.array(country_codes(n_countries, codes or ()))
+    days = np.arange(n_days)
+    size = rng.lognormal(5, 2, n_countries)[:, None]
+    peaks = rng.uniform(0, n_days, (n_countries, 4))
+    widths = rng.uniform(20, 90, (n_countries, 4))
+    waves = np.exp(-(((days[None, None, :] - peaks[..., None]) / widths[..., None]) ** 2)).sum(axis=1)
+    cases = rng.poisson(size * waves)
+    deaths = rng.binomial(cases, 0.02)
+
+    dates = pd.date_range(start, periods=n_days).strftime('%Y-%m-%d').to_numpy()
+    columns = {
+        'Date_reported': np.tile(dates, n_countries),
+        'Country_code': np.repeat(codes, n_days),
+        'Country': np.repeat(np.char.add('Country ', codes), n_days),
+        'WHO_region': np.repeat(regions[rng.integers(0, len(regions), n_countries)], n_days),
+        'New_cases': cases.ravel(),
+        'Cumulative_cases': cases.cumsum(axis=1).ravel(),
+        'New_deaths': deaths.ravel(),
+        'Cumulative_deaths': deaths.cumsum(axis=1).ravel(),
+    }
+    for number in range(extra_columns):
+        columns['Metric_%02d' % number] = rng.normal(0, 1, n_countries * n_days).round(3)
+    return pd.DataFrame(columns)
+
+
+def write_line_listing(path, n_cases, codes, n_days, start='2020-01-03', seed=0, block=1_000_000):
+    """Writes a case-level line listing, one row per case with the time of onset, in blocks so the generator
+    itself stays small.
+
+    Args:
+        path (str): CSV file to write.
+        n_cases (int): number of rows.
+        codes (list[str]): country codes the cases are spread over.
+        n_days (int): number of days the onsets are spread over.
+        start (str, optional): first day.
+        seed (int, optional): random seed.
+        block (int, optional): rows generated and written at a time.
+
+    Returns:
+        str: the path written.
+    """
+    rng = np.random.default_rng(seed)
+    codes = np.asarray(codes)
+    first = np.datetime64(start, 's')
+    for offset in range(0, n_cases, block):
+        size = min(block, n_cases - offset)
+        onset = first + rng.integers(0, n_days * 86400, size).astype('timedelta64[s]')
+        pd.DataFrame(
+            {
+                'Onset': np.datetime_as_string(onset, unit='m'),
+                'Country_code': codes[rng.integers(0, len(codes), size)],
+                'Age': rng.integers(0, 95, size),
+                'Hospitalized': rng.integers(0, 2, size),
+            }
+        ).to_csv(path, mode='a' if offset else 'w', header=offset == 0, index=False)
+    return path
+
+
+def admin_regions(n_regions, vertices=40, seed=0):
+    """Boundaries of n_regions made-up admin regions: irregular polygons of `vertices` points tiling a rectangle
+    of roughly 2:1, about as detailed as simplified admin-2 boundaries.
+
+    Args:
+        n_regions (int): number of regions.
+        vertices (int, optional): points per polygon.
+        seed (int, optional): random seed.
+
+    Returns:
+        GeoDataFrame: code ('A00000', 'A00001', ...) and geometry columns, in longitude/latitude.
+    """
+    from geopandas import GeoDataFrame
+
+    rng = np.random.default_rng(seed)
+    columns = int(np.ceil(np.sqrt(2 * n_regions)))
+    cells = np.arange(n_regions)
+    x, y = cells % columns, cells // columns
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    radii = 0.5 + 0.04 * rng.normal(size=(n_regions, vertices))
+    rings = np.stack(
+        [x[:, None] + 0.5 + radii * np.cos(angles), y[:, None] + 0.5 + radii * np.sin(angles)], axis=-1
+    )
+    # scaled down to a region of about 40 x 20 degrees, like a large country
+    polygons = shapely.polygons(rings * (40.0 / columns))
+    return GeoDataFrame({'code': ['A%05d' % cell for cell in cells]}, geometry=polygons, crs=4326)
@@ -1,4 +1,25 @@
+import importlib
+
 from ._version import __version__
-from .skeleton import EpiSpread
-from .graph_classes.time_series import TimeSeries
-from .graph_classes.heat_map import HeatMap
+
+# The public classes are imported on first access (PEP 562), so that `import epispread`, the CLI's --help and
+# process-pool workers only pay for pandas, geopandas and matplotlib once something actually uses them.
+_lazy = {
+    'EpiSpread': '.skeleton',
+    'TimeSeries': '.graph_classes.time_series',
+    'HeatMap': '.graph_classes.heat_map',
+}
+
+__all__ = ['__version__', 'EpiSpread', 'TimeSeries', 'HeatMap']
+
+
+def __getattr__(name):
+    if name not in _lazy:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_lazy[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy))
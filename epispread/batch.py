@@ -0,0 +1,297 @@
+import json
+import os
+import time
+
+import matplotlib.pyplot as plt
+
+try:
+    from skeleton import EpiSpread
+    from graph_classes.heat_map import HeatMap
+    from graph_classes.time_series import TimeSeries
+    from graph_classes.export import FrameExporter
+    from data_classes.metrics import world_population
+    from data_classes.rollup import Rollup
+    from data_classes.compact import compact, memory_report
+except ImportError:
+    from .skeleton import EpiSpread
+    from .graph_classes.heat_map import HeatMap
+    from .graph_classes.time_series import TimeSeries
+    from .graph_classes.export import FrameExporter
+    from .data_classes.metrics import world_population
+    from .data_classes.rollup import Rollup
+    from .data_classes.compact import compact, memory_report
+
+
+class Dataset:
+    def __init__(self, file_name, compact_df=False):
+        """One loaded file and everything derived from it that several plots can share:
+        the parsed columns, the world geometry, the ISO3 codes and the date indexes.
+
+        Args:
+            file_name (str): path to the CSV file.
+            compact_df (bool, optional): after parsing the columns, replace the DataFrame by its compact copy
+                (see compact), and keep the memory_report of the change.
+        """
+        self.file_name = file_name
+        start = time.perf_counter()
+        self.df, self.world = EpiSpread._read_data(file_name)
+        self.number_columns, self.date_columns, self.iso_columns, self.time_series_columns = EpiSpread._parse_columns(
+            self.df, file_name
+        )
+        self.memory_report = None
+        if compact_df:
+            compacted = compact(self.df, date_columns=self.date_columns)
+            self.memory_report = memory_report(self.df, compacted)
+            self.df = compacted
+        self.load_seconds = time.perf_counter() - start
+        self.date_indexes = {}
+        self.rollups = {}
+
+    def rollup(self, key_column, date_column):
+        """The Rollup of every number column by key_column and the grouping columns of the file (see
+        Rollup.hierarchy), built on first use and shared by the plots of coarser levels and buckets.
+
+        Args:
+            key_column (str): column of the finest level, e.g. the country code.
+            date_column (str): column holding the dates.
+
+        Returns:
+            Rollup: the rollup.
+        """
+        if (key_column, date_column) not in self.rollups:
+            parents = [column for column in Rollup.hierarchy if column in self.df.columns and column != key_column]
+            self.rollups[(key_column, date_column)] = Rollup(
+                self.df, date_column, key_column, self.number_columns, parents
+            )
+        return self.rollups[(key_column, date_column)]
+
+    def adopt(self, heat_map):
+        """Keeps what a HeatMap prepared on this dataset (the DataFrame with ISO3 codes attached, its date index)
+        so the next plot does not prepare it again.
+
+        Args:
+            heat_map (HeatMap): a map built on this dataset.
+        """
+        self.df = heat_map.df
+        self.date_indexes[heat_map.date_column] = heat_map.date_index
+
+
+class BatchRunner:
+    job_types = ('heat map', 'heat map w/ time slider', 'time series')
+
+    def __init__(self, spec, output_dir=None, base_dir="."):
+        """Runs many plots non-interactively from a job spec, loading and parsing every referenced file once.
+
+        The spec is a dict (usually read from JSON or YAML, see from_file) like::
+
+            output_dir: maps
+            jobs:
+              - name: cases
+                type: heat map
+                file: data_files/WHO-COVID-19-global-data.csv
+                column: New_cases
+                date: 2021-01-01
+              - name: cases-animated
+                type: heat map w/ time slider
+                file: data_files/WHO-COVID-19-global-data.csv
+                column: New_cases
+                start: 2021-01-01
+                step: 7
+                output: cases.gif
+              - name: deaths-by-country
+                type: time series
+                file: data_files/WHO-COVID-19-global-data.csv
+                column: New_deaths
+
+        Optional job keys are iso_column, date_column and line_column (detected from the file if omitted),
+        date (heat map), start/end/step/fps (time slider), series/top_n (time series), lod and output. Heat map and
+        time series jobs also take level (e.g. WHO_region or global) and bucket (day, week or month), read from
+        one Rollup per file and key column (see Dataset.rollup).
+        A top-level ``compact: true`` keeps every file in memory in its compact form (see compact): categorical
+        keys, int32 day offsets for dates and downcast counts.
+
+        Args:
+            spec (dict): the job spec.
+            output_dir (str, optional): where outputs go; overrides spec['output_dir']. Defaults to batch_output.
+            base_dir (str, optional): directory relative file and output paths in the spec are resolved against.
+        """
+        self.spec = spec
+        self.base_dir = base_dir
+        self.output_dir = os.path.join(base_dir, output_dir or spec.get('output_dir', 'batch_output'))
+        self.datasets = {}
+        self.results = []
+
+    @classmethod
+    def from_file(cls, path, output_dir=None):
+        """Reads a job spec from a .json, .yaml or .yml file. Paths in it are relative to the file.
+
+        Args:
+            path (str): path to the spec.
+            output_dir (str, optional): overrides the spec's output_dir.
+
+        Returns:
+            BatchRunner: the runner.
+        """
+        with open(path) as f:
+            if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+                import yaml
+
+                spec = yaml.safe_load(f)
+            else:
+                spec = json.load(f)
+        return cls(spec, output_dir, os.path.dirname(path) or ".")
+
+    def _dataset(self, file_name):
+        path = os.path.join(self.base_dir, file_name)
+        if path not in self.datasets:
+            self.datasets[path] = Dataset(path, compact_df=bool(self.spec.get('compact')))
+        return self.datasets[path]
+
+    def _output(self, job, extension):
+        path = os.path.join(self.output_dir, job.get('output') or job['name'] + extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    @staticmethod
+    def _rollup(job, dataset, key_column, date_column):
+        """The dataset's shared rollup for a job with a level or bucket, or None to plot the rows
+        (a derived metric is rolled up by the plot itself)."""
+        if not (job.get('level') or job.get('bucket')) or job['column'] not in dataset.number_columns:
+            return None
+        return dataset.rollup(key_column, date_column)
+
+    def _heat_map(self, job, dataset):
+        date_column = job.get('date_column') or dataset.date_columns[0]
+        iso_column = job.get('iso_column') or dataset.iso_columns[0]
+        heat_map = HeatMap(
+            dataset.df,
+            dataset.world,
+            job['column'],
+            job.get('date') or dataset.df[date_column].iloc[0],
+            iso_column,
+            date_column,
+            lod=job.get('lod', 'auto'),
+            date_index=dataset.date_indexes.get(date_column),
+            level=job.get('level'),
+            bucket=job.get('bucket', 'day'),
+            rollup=self._rollup(job, dataset, iso_column, date_column),
+        )
+        try:
+            path = heat_map.save(self._output(job, '.png'))
+            dataset.adopt(heat_map)
+        finally:
+            plt.close(heat_map.fig)
+        return [path]
+
+    def _time_slider(self, job, dataset):
+        date_column = job.get('date_column') or dataset.time_series_columns[0][1]
+        exporter = FrameExporter(
+            dataset.df,
+            dataset.world,
+            job['column'],
+            job.get('iso_column') or dataset.iso_columns[0],
+            date_column,
+            start_date=job.get('start') and str(job['start']),
+            end_date=job.get('end') and str(job['end']),
+            step=job.get('step', 1),
+            lod=job.get('lod', 'medium'),
+            date_index=dataset.date_indexes.get(date_column),
+        )
+        dataset.adopt(exporter.heat_map)
+        output = self._output(job, '.gif')
+        frames = exporter.render_frames(os.path.splitext(output)[0] + "_frames", workers=job.get('workers'))
+        if os.path.splitext(output)[1].lower() in ('.gif', '.mp4'):
+            return [FrameExporter.assemble(frames, output, fps=job.get('fps', 5))]
+        return frames
+
+    def _time_series(self, job, dataset):
+        line_column, date_column = dataset.time_series_columns[0]
+        line_column = job.get('line_column') or line_column
+        date_column = job.get('date_column') or date_column
+        population = None
+        if job['column'].endswith('_per100k') and dataset.iso_columns:
+            population = world_population(dataset.world, dataset.df, line_column, dataset.iso_columns[0])
+        time_series = TimeSeries(
+            dataset.df,
+            date_column,
+            line_column,
+            job['column'],
+            series=job.get('series'),
+            top_n=job.get('top_n'),
+            population=population,
+            level=job.get('level'),
+            bucket=job.get('bucket', 'day'),
+            rollup=self._rollup(job, dataset, line_column, date_column),
+        )
+        return [time_series.save(self._output(job, '.png'))]
+
+    def run_job(self, job):
+        """Runs a single job and records its outcome and timing in self.results.
+
+        Args:
+            job (dict): one entry of the spec's jobs list.
+
+        Returns:
+            dict: the job's result: name, type, status, seconds and outputs.
+        """
+        handlers = {
+            'heat map': self._heat_map,
+            'heat map w/ time slider': self._time_slider,
+            'time series': self._time_series,
+        }
+        result = {'name': job.get('name'), 'type': job.get('type'), 'file': job.get('file'), 'outputs': []}
+        start = time.perf_counter()
+        try:
+            if job.get('type') not in handlers:
+                raise ValueError(f"unknown job type {job.get('type')!r}, expected one of {self.job_types}")
+            dataset = self._dataset(job['file'])
+            # loading is timed separately, per file, in the summary
+            start = time.perf_counter()
+            result['outputs'] = handlers[job['type']](job, dataset)
+            result['status'] = 'ok'
+        except Exception as error:  # one broken job should not stop the batch
+            result['status'] = f"failed: {error}"
+        result['seconds'] = time.perf_counter() - start
+        self.results.append(result)
+        return result
+
+    def run(self):
+        """Runs every job of the spec in order and writes summary.json to the output directory.
+
+        Returns:
+            list[dict]: the result of every job, see run_job.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        for number, job in enumerate(self.spec.get('jobs', [])):
+            job.setdefault('name', f"job-{number}")
+            self.run_job(job)
+        with open(os.path.join(self.output_dir, "summary.json"), 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        return self.results
+
+    def summary(self):
+        """Timing summary of the batch: how long each file took to load and parse, and each job to run.
+
+        Returns:
+            dict: 'loads', 'jobs' and 'total_seconds'.
+        """
+        loads = [{'file': path, 'seconds': dataset.load_seconds} for path, dataset in self.datasets.items()]
+        return {
+            'loads': loads,
+            'jobs': self.results,
+            'total_seconds': sum(item['seconds'] for item in loads + self.results),
+        }
+
+    def format_summary(self):
+        """The timing summary as a printable table.
+
+        Returns:
+            str: one line per load and per job.
+        """
+        lines = [f"{'step':<40} {'seconds':>8}  status"]
+        for path, dataset in self.datasets.items():
+            lines.append(f"{'load ' + os.path.basename(path):<40} {dataset.load_seconds:>8.2f}  ok")
+        for result in self.results:
+            lines.append(f"{result['name']:<40} {result['seconds']:>8.2f}  {result['status']}")
+        lines.append(f"{'total':<40} {self.summary()['total_seconds']:>8.2f}")
+        return "\n".join(lines)
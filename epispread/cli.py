@@ -0,0 +1,267 @@
+import argparse
+import os
+import sys
+import time
+
+
+def _export(args):
+    """Handler of `epispread export`: renders a time-sliced heat map to PNG frames and optional animations."""
+    import matplotlib
+
+    matplotlib.use('Agg')
+    from .skeleton import EpiSpread
+    from .graph_classes.export import FrameExporter
+
+    df, world = EpiSpread._read_data(args.file)
+    _, date_columns, iso_columns, _ = EpiSpread._parse_columns(df, args.file)
+    exporter = FrameExporter(
+        df,
+        args.boundaries or world,
+        args.column,
+        args.iso_column or iso_columns[0],
+        args.date_column or date_columns[0],
+        start_date=args.start,
+        end_date=args.end,
+        step=args.step,
+        lod=args.lod,
+        dpi=args.dpi,
+        region_key=args.region_key,
+    )
+    start = time.perf_counter()
+    frames = exporter.render_frames(args.out, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {len(frames)} frames to {args.out} in {elapsed:.1f}s ({len(frames) / max(elapsed, 1e-9):.1f}/s)")
+    for animation in (args.gif, args.mp4):
+        if animation:
+            print("Wrote", FrameExporter.assemble(frames, animation, fps=args.fps))
+    return 0
+
+
+def _batch(args):
+    """Handler of `epispread batch`: runs every plot of a JSON/YAML job spec."""
+    import matplotlib
+
+    matplotlib.use('Agg')
+    from .batch import BatchRunner
+
+    runner = BatchRunner.from_file(args.spec, args.out)
+    results = runner.run()
+    print(runner.format_summary())
+    return 0 if all(result['status'] == 'ok' for result in results) else 1
+
+
+def _ingest(args):
+    """Handler of `epispread ingest`: aggregates a line listing into a per-date, per-region CSV."""
+    from .data_classes.line_listing import LineListingAggregator
+
+    locator = None
+    if args.coordinates:
+        from .data_classes.regions import RegionLocator
+        from .data_classes.world_cache import WorldCache
+
+        locator = RegionLocator(WorldCache.shared(source=args.boundaries).load('high'), args.region_key)
+
+    def report(rows, seconds):
+        print(f"\r{rows:,} rows, {rows / max(seconds, 1e-9):,.0f} rows/s", end='', file=sys.stderr, flush=True)
+
+    aggregator = LineListingAggregator(
+        args.date_column,
+        args.region_column,
+        args.sum or (),
+        chunk_size=args.chunk_size,
+        progress=report,
+        locator=locator,
+        coordinate_columns=args.coordinates,
+    )
+    df = aggregator.aggregate(args.file)
+    print(file=sys.stderr)
+    df.to_csv(args.out, index=False)
+    print(
+        f"Aggregated {aggregator.rows:,} rows ({aggregator.skipped:,} without date or region) into {len(df):,} rows "
+        f"in {aggregator.seconds:.1f}s ({aggregator.rows_per_second:,.0f} rows/s), wrote {args.out}"
+    )
+    return 0
+
+
+def _refresh(args):
+    """Handler of `epispread refresh`: downloads the WHO files (unless files are given) and appends their new dates
+    to the cache."""
+    from .skeleton import EpiSpread
+
+    files = args.files
+    if not files:
+        EpiSpread._get_files(EpiSpread.urls)
+        print(EpiSpread.download_report)
+        files = EpiSpread.download_report.file_paths
+    status = 0
+    for file_name in files:
+        try:
+            report = EpiSpread._refresh_data(file_name, args.date_column)
+        except (IndexError, KeyError):
+            print(f"{file_name}: no date column, skipped")
+            continue
+        except Exception as error:
+            print(f"{file_name}: failed: {error}")
+            status = 1
+            continue
+        print(f"{file_name}: {report}")
+    return status
+
+
+def _serve(args):
+    """Handler of `epispread serve`: keeps the files and the world loaded and serves map frames over HTTP."""
+    import asyncio
+
+    import matplotlib
+
+    matplotlib.use('Agg')
+    from .server import FrameServer
+
+    server = FrameServer(
+        args.files,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        lod=args.lod,
+        dpi=args.dpi,
+        compact_df=args.compact,
+    )
+
+    async def serve():
+        await server.start()
+        for column in args.column or ():
+            for name in server.datasets:
+                try:
+                    await server.layer(name, column)
+                except Exception as error:
+                    print(f"{name}: {column} not prepared: {error}")
+        print(f"Serving {', '.join(server.datasets)} on {server.url()} (Ctrl+C to stop)", flush=True)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _query(args):
+    """Handler of plain `epispread`: the interactive prompt of EpiSpread.run_query."""
+    from .skeleton import EpiSpread
+
+    EpiSpread.run_query()
+    return 0
+
+
+def build_parser():
+    """Builds the command line parser.
+
+    Returns:
+        argparse.ArgumentParser: the parser, with one sub-command per mode.
+    """
+    parser = argparse.ArgumentParser(prog='epispread', description="Visualize disease spread from WHO-style data.")
+    parser.set_defaults(handler=_query)
+    parser.add_argument('--metrics', help="time every pipeline stage and write the metrics as JSON to this path")
+    parser.add_argument('--log-metrics', action='store_true', help="time every pipeline stage and log the metrics")
+    parser.add_argument('--profile', action='append', metavar='STAGE', help="run a stage under cProfile, repeatable")
+    parser.add_argument('--profile-dir', help="write the pstats file of every profiled stage to this directory")
+    parser.add_argument(
+        '--trace-memory', action='append', metavar='STAGE', help="record the peak memory of a stage, repeatable"
+    )
+    commands = parser.add_subparsers(title='commands')
+
+    export = commands.add_parser('export', help="render every date of a heat map to PNG frames, a GIF or an MP4")
+    export.add_argument('file', help="CSV file to plot, e.g. data_files/WHO-COVID-19-global-data.csv")
+    export.add_argument('--column', required=True, help="column to colour the map by")
+    export.add_argument('--iso-column', help="column with ISO2/ISO3 country codes (detected if omitted)")
+    export.add_argument('--date-column', help="column with YYYY-MM-DD dates (detected if omitted)")
+    export.add_argument('--start', help="first date to render")
+    export.add_argument('--end', help="last date to render")
+    export.add_argument('--step', type=int, default=1, help="render every STEP-th date")
+    export.add_argument('--out', default='frames', help="directory for the PNG frames")
+    export.add_argument('--gif', help="also write an animated GIF to this path")
+    export.add_argument('--mp4', help="also write an MP4 to this path (needs ffmpeg)")
+    export.add_argument('--fps', type=int, default=5, help="frames per second of the animations")
+    export.add_argument('--workers', type=int, default=os.cpu_count(), help="number of rendering processes")
+    export.add_argument('--lod', default='medium', help="level of detail of the world: high, medium or low")
+    export.add_argument('--dpi', type=int, default=100, help="resolution of the frames")
+    export.add_argument('--boundaries', help="boundary file to map instead of the world's countries, e.g. admin-1")
+    export.add_argument('--region-key', default='iso_a3', help="column of the boundaries the ISO column matches")
+    export.set_defaults(handler=_export)
+
+    batch = commands.add_parser('batch', help="run many plots from a JSON or YAML job spec")
+    batch.add_argument('spec', help="path to the job spec (.json, .yaml or .yml)")
+    batch.add_argument('--out', help="output directory, overrides the spec's output_dir")
+    batch.set_defaults(handler=_batch)
+
+    refresh = commands.add_parser('refresh', help="append only the new dates of updated files to the cache")
+    refresh.add_argument('files', nargs='*', help="CSV files to refresh (default: download and refresh the WHO files)")
+    refresh.add_argument('--date-column', help="column the files grow by (detected if omitted)")
+    refresh.set_defaults(handler=_refresh)
+
+    ingest = commands.add_parser('ingest', help="aggregate a line listing of cases into counts per date and region")
+    ingest.add_argument('file', help="line listing CSV, one row per case (may be compressed, e.g. .csv.gz)")
+    ingest.add_argument('--date-column', required=True, help="column with the date of each case")
+    ingest.add_argument(
+        '--region-column',
+        required=True,
+        help="column with the region (country code) of each case, or of the located region with --coordinates",
+    )
+    ingest.add_argument('--sum', action='append', help="numeric column to sum per date and region, repeatable")
+    ingest.add_argument('--chunk-size', type=int, default=1_000_000, help="number of rows read at a time")
+    ingest.add_argument('--out', required=True, help="path of the aggregated CSV")
+    ingest.add_argument(
+        '--coordinates', nargs=2, metavar=('LON', 'LAT'), help="locate each case in a region from these columns"
+    )
+    ingest.add_argument('--boundaries', help="boundary file of the regions for --coordinates (default: countries)")
+    ingest.add_argument('--region-key', default='iso_a3', help="column of the boundaries holding the region keys")
+    ingest.set_defaults(handler=_ingest)
+
+    serve = commands.add_parser('serve', help="serve map frames and values of files over HTTP from one warm process")
+    serve.add_argument('files', nargs='+', help="CSV files to load once and serve")
+    serve.add_argument('--host', default='127.0.0.1', help="interface to listen on")
+    serve.add_argument('--port', type=int, default=8050, help="port to listen on")
+    serve.add_argument('--workers', type=int, help="number of rendering processes (default: number of CPUs)")
+    serve.add_argument('--column', action='append', help="column to prepare before serving, repeatable")
+    serve.add_argument('--lod', default='medium', help="level of detail of the world: high, medium or low")
+    serve.add_argument('--dpi', type=int, default=100, help="resolution of the frames")
+    serve.add_argument('--compact', action='store_true', help="keep the files in memory in their compact form")
+    serve.set_defaults(handler=_serve)
+    return parser
+
+
+def main(argv=None):
+    """Entry point of `python -m epispread` and the `epispread` script.
+
+    Args:
+        argv (list[str], optional): command line arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: exit status.
+    """
+    args = build_parser().parse_args(argv)
+    if not (args.metrics or args.log_metrics or args.profile or args.trace_memory):
+        return args.handler(args)
+
+    import logging
+
+    from .data_classes.instrumentation import Instrumentation
+
+    instrumentation = Instrumentation.shared().configure(
+        profile=args.profile or (), trace_memory=args.trace_memory or (), profile_dir=args.profile_dir
+    )
+    try:
+        return args.handler(args)
+    finally:
+        if args.metrics:
+            instrumentation.dump(args.metrics)
+        if args.log_metrics or not args.metrics:
+            logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
+            instrumentation.log()
+        for name, report in instrumentation.to_dict()['profiles'].items():
+            if not args.profile_dir:
+                print(f"--- profile of stage {name} ---\n{report}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pragma: no cover - the cache falls back to plain CSV reads
+    pa = None
+    feather = None
+
+
+class ColumnarCache:
+    index_file = "index.json"
+
+    def __init__(self, cache_dir="data_files/.cache"):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def available():
+        """Whether pyarrow is installed, i.e. whether anything can actually be cached.
+
+        Returns:
+            bool: True if Feather files can be written and memory-mapped.
+        """
+        return feather is not None
+
+    @staticmethod
+    def hash_file(file_name, block_size=1 << 20):
+        """Hashes the content of a file.
+
+        Args:
+            file_name (str): path to the file.
+            block_size (int, optional): number of bytes read at a time.
+
+        Returns:
+            str: hex digest of the file content.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_name, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, self.index_file)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _store_index(self, index):
+        self._atomic_write(os.path.join(self.cache_dir, self.index_file), lambda f: f.write(json.dumps(index).encode()))
+
+    def _atomic_write(self, path, write):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def content_key(self, file_name):
+        """Returns the content hash of a source file. The hash is remembered together with the file's
+        size and modification time, so an unchanged file is not re-hashed on every load.
+
+        Args:
+            file_name (str): path to the source CSV.
+
+        Returns:
+            str: hex digest of the file content.
+        """
+        stat = os.stat(file_name)
+        source = os.path.abspath(file_name)
+        index = self._load_index()
+        entry = index.get(source)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['hash']
+        key = self.hash_file(file_name)
+        index[source] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': key}
+        self._store_index(index)
+        return key
+
+    def cache_path(self, file_name, key):
+        """Path of the Feather file caching a given version of a source file.
+
+        Args:
+            file_name (str): path to the source CSV.
+            key (str): content hash of the source CSV.
+
+        Returns:
+            str: path of the cache file.
+        """
+        return os.path.join(self.cache_dir, self._source_stem(file_name) + "-" + key + ".feather")
+
+    @staticmethod
+    def _source_stem(file_name):
+        # sources of the same name in different directories must not share (and evict) each other's files
+        digest = hashlib.blake2b(os.path.abspath(file_name).encode(), digest_size=4).hexdigest()
+        return os.path.splitext(os.path.basename(file_name))[0] + "-" + digest
+
+    def _evict_stale(self, file_name, keep):
+        stem = self._source_stem(file_name)
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            key = name[len(stem) + 1 : -len(".feather")]
+            if name.startswith(stem + "-") and name.endswith(".feather") and path != keep and len(key) == 32:
+                os.remove(path)
+
+    def build(self, file_name, key=None):
+        """Parses the source CSV once and writes it as an uncompressed (memory-mappable) Feather file.
+        Older cache files of the same source are removed.
+
+        Args:
+            file_name (str): path to the source CSV.
+            key (str, optional): content hash of the source CSV, computed if not given.
+
+        Returns:
+            DataFrame: the parsed CSV.
+        """
+        df = pd.read_csv(file_name, delimiter=",")
+        if feather is None:
+            return df
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.cache_path(file_name, key or self.content_key(file_name))
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        self._atomic_write(path, lambda f: feather.write_feather(table, f, compression='uncompressed'))
+        self._evict_stale(file_name, path)
+        return df
+
+    def load(self, file_name, columns=None):
+        """Loads a CSV through the cache. The first load parses the CSV and writes the Feather cache;
+        later loads memory-map the cache and only materialise the requested columns.
+        A changed CSV has a different content hash and therefore misses the cache.
+
+        Args:
+            file_name (str): path to the source CSV.
+            columns (list[str], optional): only load these columns. Defaults to all columns.
+
+        Returns:
+            DataFrame: the loaded dataset.
+        """
+        if feather is None:
+            self.misses += 1
+            return pd.read_csv(file_name, delimiter=",", usecols=columns)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        key = self.content_key(file_name)
+        path = self.cache_path(file_name, key)
+        if os.path.exists(path):
+            self.hits += 1
+            table = feather.read_table(path, columns=columns, memory_map=True)
+            return table.to_pandas()
+        self.misses += 1
+        df = self.build(file_name, key)
+        return df[columns] if columns is not None else df
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+from pandas.api import types
+
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+def to_days(values):
+    """Converts dates to int32 day offsets from 1970-01-01, parsing every distinct value only once.
+
+    Args:
+        values (Series): dates as text (e.g. YYYY-MM-DD), datetimes, or already day offsets.
+
+    Returns:
+        Series: int32 day offsets with the index of values; nullable Int32 if some dates are missing or invalid.
+    """
+    if types.is_integer_dtype(values.dtype):
+        return values
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(uniques, errors='coerce').to_numpy(dtype='datetime64[D]')
+    valid = ~np.isnat(parsed)
+    days = np.where(valid, (parsed - EPOCH).astype(np.int64), 0)
+    # code -1 (a missing value) picks the appended invalid entry
+    missing = ~np.r_[valid, False][codes]
+    days = np.r_[days, 0][codes].astype(np.int32)
+    if missing.any():
+        return pd.Series(pd.arrays.IntegerArray(days, missing), index=values.index, name=values.name)
+    return pd.Series(days, index=values.index, name=values.name)
+
+
+def to_day(date):
+    """Day offset of a single date.
+
+    Args:
+        date: a day offset, a date as text (e.g. '2020-01-03'), or a date/datetime.
+
+    Returns:
+        int: days since 1970-01-01.
+    """
+    if isinstance(date, (int, np.integer)):
+        return int(date)
+    return int((np.datetime64(pd.Timestamp(date).date(), 'D') - EPOCH).astype(np.int64))
+
+
+def format_days(days):
+    """Formats day offsets as YYYY-MM-DD.
+
+    Args:
+        days (array-like): day offsets from 1970-01-01.
+
+    Returns:
+        ndarray: the dates as strings.
+    """
+    return np.datetime_as_string(EPOCH + np.asarray(days, dtype=np.int64), unit='D')
+
+
+def compact(df, date_columns=None, key_columns=None, max_category_ratio=0.5):
+    """A compact copy of a dataset: text key columns become categoricals, date columns int32 day offsets
+    (see to_days) and integer-valued numeric columns the smallest integer type that holds them.
+    Float columns with missing values are left as they are. df itself is not modified.
+
+    Args:
+        df (DataFrame): the dataset.
+        date_columns (list[str], optional): columns to convert to day offsets. Defaults to the text columns
+            with "date" in their name.
+        key_columns (list[str], optional): columns to make categorical. Defaults to the other text columns
+            with at most max_category_ratio distinct values per row.
+        max_category_ratio (float, optional): see key_columns.
+
+    Returns:
+        DataFrame: the compact copy.
+    """
+    text = [column for column in df.columns if df[column].dtype == object]
+    if date_columns is None:
+        date_columns = [column for column in text if "date" in str(column).lower()]
+    if key_columns is None:
+        key_columns = [
+            column
+            for column in text
+            if column not in date_columns and df[column].nunique() <= max_category_ratio * max(len(df), 1)
+        ]
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if column in date_columns:
+            values = to_days(values)
+        elif column in key_columns:
+            values = values.astype('category')
+        elif types.is_integer_dtype(values.dtype) and not types.is_extension_array_dtype(values.dtype):
+            values = pd.to_numeric(values, downcast='integer')
+        elif types.is_float_dtype(values.dtype) and len(values) and values.notna().all():
+            if (values == np.floor(values)).all():
+                values = pd.to_numeric(values.astype(np.int64), downcast='integer')
+        columns[column] = values
+    return pd.DataFrame(columns, index=df.index)
+
+
+def memory_report(before, after):
+    """Memory held by every column of a dataset before and after compact.
+
+    Args:
+        before (DataFrame): the original dataset.
+        after (DataFrame): its compact copy.
+
+    Returns:
+        DataFrame: one row per column and a 'total' row, with the dtypes and bytes before and after
+        (strings counted in full) and the ratio after / before.
+    """
+    report = pd.DataFrame(
+        {
+            'dtype_before': before.dtypes.astype(str),
+            'dtype_after': after.dtypes.astype(str),
+            'bytes_before': before.memory_usage(index=False, deep=True),
+            'bytes_after': after.memory_usage(index=False, deep=True),
+        }
+    )
+    report.loc['total'] = ['', '', report['bytes_before'].sum(), report['bytes_after'].sum()]
+    report['ratio'] = report['bytes_after'] / report['bytes_before'].where(report['bytes_before'] > 0)
+    return report
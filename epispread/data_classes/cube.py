@@ -0,0 +1,167 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+class DataCube:
+    aggregations = {'sum': np.nansum, 'mean': np.nanmean, 'min': np.nanmin, 'max': np.nanmax}
+
+    def __init__(self, dates, keys, arrays):
+        """Dense (date x key) arrays of one or more value columns. Row i holds dates[i], column j holds keys[j];
+        missing values are NaN.
+
+        Args:
+            dates (list): the dates, sorted.
+            keys (list): the region keys, e.g. the iso_a3 column of the world in row order.
+            arrays (dict[str, ndarray]): one float32 array of shape (len(dates), len(keys)) per value column.
+        """
+        self.dates = list(dates)
+        self.keys = list(keys)
+        self.arrays = arrays
+        self._date_rows = {date: row for row, date in enumerate(self.dates)}
+        self._sorted_dates = pd.Index(self.dates)
+
+    @classmethod
+    def build(cls, df, date_column, key_column, value_columns, keys=None, row_dates=None):
+        """Pivots long-format data into one cube per value column, with a single pass over the date and key columns.
+
+        Args:
+            df (DataFrame): long-format dataset, one row per (key, date).
+            date_column (str): column holding the dates.
+            key_column (str): column holding the region keys.
+            value_columns (list[str]): columns to build cubes for.
+            keys (list, optional): the cube's columns, in order. Pass the world's iso_a3 column to align the cube
+                with the world geometry; a key listed twice only gets values in its first column.
+                Defaults to the sorted distinct keys of df.
+            row_dates (Series, optional): the date of every row of df in another representation to key the cube by,
+                e.g. day offsets from to_days. Defaults to df[date_column].
+
+        Returns:
+            DataCube: the cubes.
+        """
+        date_codes, dates = pd.factorize(df[date_column] if row_dates is None else row_dates, sort=True)
+        if keys is None:
+            key_codes, keys = pd.factorize(df[key_column], sort=True)
+        else:
+            keys = pd.Index(keys)
+            first = ~keys.duplicated()
+            positions = keys[first].get_indexer(pd.Index(df[key_column]))
+            key_codes = np.where(positions >= 0, np.flatnonzero(first)[positions], -1)
+        present = (date_codes >= 0) & (key_codes >= 0)
+        date_codes, key_codes = date_codes[present], key_codes[present]
+
+        arrays = {}
+        for column in value_columns:
+            values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float32)[present]
+            cube = np.full((len(dates), len(keys)), np.nan, dtype=np.float32)
+            cube[date_codes, key_codes] = values
+            arrays[column] = cube
+        return cls(dates, keys, arrays)
+
+    def extend(self, df, date_column, key_column, row_dates=None):
+        """Appends the rows of new dates to the cubes, keeping the keys.
+
+        Args:
+            df (DataFrame): long-format rows of dates after the last date of the cubes, with every value column.
+            date_column (str): column holding the dates.
+            key_column (str): column holding the region keys.
+            row_dates (Series, optional): the dates of the rows, if the cube was built with row_dates.
+
+        Returns:
+            DataCube: self, with the new dates appended.
+        """
+        added = self.build(df, date_column, key_column, list(self.arrays), self.keys, row_dates)
+        if self.dates and added.dates and added.dates[0] <= self.dates[-1]:
+            raise ValueError(f"new date {added.dates[0]} does not come after the last date {self.dates[-1]}")
+        for column, array in added.arrays.items():
+            self.arrays[column] = np.concatenate([self.arrays[column], array])
+        self.dates += added.dates
+        self._date_rows = {date: row for row, date in enumerate(self.dates)}
+        self._sorted_dates = pd.Index(self.dates)
+        return self
+
+    @property
+    def nbytes(self):
+        """Total memory held by the cubes, in bytes."""
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def memory_footprint(self):
+        """Memory held by each cube.
+
+        Returns:
+            dict[str, int]: bytes per value column.
+        """
+        return {column: array.nbytes for column, array in self.arrays.items()}
+
+    def date_position(self, date):
+        """Row of a date in the cubes.
+
+        Args:
+            date: a date, in the representation of the source date column.
+
+        Returns:
+            int: the row, or None if the date is not in the cube.
+        """
+        return self._date_rows.get(date)
+
+    def frame(self, date, column):
+        """Values of every key on one date.
+
+        Args:
+            date: a date, in the representation of the source date column.
+            column (str): value column.
+
+        Returns:
+            ndarray: a view of the cube row, all NaN if the date is not in the cube.
+        """
+        row = self.date_position(date)
+        if row is None:
+            return np.full(len(self.keys), np.nan, dtype=np.float32)
+        return self.arrays[column][row]
+
+    def date_slice(self, start=None, end=None):
+        """Rows of the cubes covering a range of dates.
+
+        Args:
+            start (optional): first date, inclusive. Defaults to the first date of the cube.
+            end (optional): last date, inclusive. Defaults to the last date of the cube.
+
+        Returns:
+            slice: the rows.
+        """
+        dates = self._sorted_dates
+        first = 0 if start is None else dates.searchsorted(start, side='left')
+        last = len(dates) if end is None else dates.searchsorted(end, side='right')
+        return slice(first, last)
+
+    def range(self, column, start=None, end=None):
+        """Values of every key over a range of dates.
+
+        Args:
+            column (str): value column.
+            start (optional): first date, inclusive. Defaults to the first date of the cube.
+            end (optional): last date, inclusive. Defaults to the last date of the cube.
+
+        Returns:
+            ndarray: a view of the cube rows, shape (dates in range, keys).
+        """
+        return self.arrays[column][self.date_slice(start, end)]
+
+    def aggregate(self, column, how='sum', start=None, end=None):
+        """Reduces a range of dates to one value per key, ignoring missing values.
+
+        Args:
+            column (str): value column.
+            how (str, optional): one of DataCube.aggregations.
+            start (optional): first date, inclusive.
+            end (optional): last date, inclusive.
+
+        Returns:
+            ndarray: one value per key.
+        """
+        values = self.range(column, start, end)
+        with warnings.catch_warnings():
+            # keys without any value in the range come out as NaN (0 for sum), that is not worth a warning
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            return self.aggregations[how](values, axis=0)
@@ -0,0 +1,221 @@
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DownloadReport:
+    def __init__(self):
+        self.file_names = []
+        self.file_paths = []
+        self.cache_hits = []
+        self.failures = []
+        self.bytes_transferred = 0
+
+    def __repr__(self):
+        return (
+            f"DownloadReport(files={len(self.file_paths)}, cache_hits={len(self.cache_hits)}, "
+            f"failures={len(self.failures)}, bytes_transferred={self.bytes_transferred})"
+        )
+
+
+class Downloader:
+    metadata_file = ".download-metadata.json"
+
+    def __init__(self, dest_dir="data_files", max_workers=4, chunk_size=1 << 16, timeout=60, session=None):
+        self.dest_dir = dest_dir
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        # a session handed in belongs to the caller, who closes it
+        self._owns_session = session is None
+        self.session = session or self._make_session(max_workers)
+        self._lock = threading.Lock()
+        # mkstemp creates 0600 files, downloads get the mode open() would have given them
+        umask = os.umask(0)
+        os.umask(umask)
+        self._file_mode = 0o666 & ~umask
+
+    def close(self):
+        """Closes the pooled session and its connections, unless the session was handed in."""
+        if self._owns_session:
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _make_session(max_workers):
+        """Builds a requests Session whose connection pool is large enough for every worker thread.
+
+        Args:
+            max_workers (int): number of concurrent downloads.
+
+        Returns:
+            requests.Session: the pooled session.
+        """
+        # requests is only imported once something is downloaded, to keep `import epispread` fast
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @staticmethod
+    def file_name_for(url):
+        """Derives the bare file name (no directory, no .csv) used for a downloaded URL.
+
+        Args:
+            url (str): link to the file.
+
+        Returns:
+            str: name of the file, e.g. 'WHO-COVID-19-global-data'.
+        """
+        return url.split('/')[-1].replace(".csv", "")
+
+    def _metadata_path(self, file_path):
+        return os.path.join(os.path.dirname(file_path) or ".", self.metadata_file)
+
+    def _load_metadata(self, file_path):
+        """Reads the ETag/Last-Modified validators stored next to the given file.
+
+        Args:
+            file_path (str): path of the downloaded file.
+
+        Returns:
+            dict: validators keyed by URL, empty if nothing was stored yet.
+        """
+        try:
+            with open(self._metadata_path(file_path)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _store_metadata(self, file_path, url, response):
+        """Records the validators the server sent for a URL so the next request can be conditional.
+        Nothing is written if the server sent neither an ETag nor a Last-Modified header.
+
+        Args:
+            file_path (str): path of the downloaded file.
+            url (str): link the file was downloaded from.
+            response (requests.Response): the 200 response.
+        """
+        entry = {
+            'file': os.path.basename(file_path),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        with self._lock:
+            metadata = self._load_metadata(file_path)
+            if not entry['etag'] and not entry['last_modified']:
+                if metadata.pop(url, None) is None:
+                    return
+            else:
+                metadata[url] = entry
+            with open(self._metadata_path(file_path), 'w') as f:
+                json.dump(metadata, f, indent=2, sort_keys=True)
+
+    def _conditional_headers(self, url, file_path):
+        """Builds If-None-Match/If-Modified-Since headers for a URL whose file is already on disk.
+
+        Args:
+            url (str): link to the file.
+            file_path (str): where the file is stored locally.
+
+        Returns:
+            dict: request headers, empty if the file must be fetched unconditionally.
+        """
+        if not os.path.exists(file_path):
+            return {}
+        with self._lock:
+            entry = self._load_metadata(file_path).get(url)
+        if not entry or entry.get('file') != os.path.basename(file_path):
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def _fetch_one(self, url, file_path):
+        """Downloads one URL to file_path, streaming the body in chunks into a temporary file
+        in the same directory and renaming it into place once complete.
+
+        Args:
+            url (str): link to the file.
+            file_path (str): where the file should end up.
+
+        Returns:
+            (str, int): status, one of 'downloaded', 'cached' or 'failed', and the number of body bytes read.
+        """
+        import requests
+
+        headers = self._conditional_headers(url, file_path)
+        try:
+            with self.session.get(url, headers=headers, stream=True, allow_redirects=True, timeout=self.timeout) as r:
+                if r.status_code == 304:
+                    return 'cached', 0
+                if r.status_code != 200:
+                    return 'failed', 0
+                directory = os.path.dirname(file_path) or "."
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".download-", suffix=".part")
+                transferred = 0
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        for chunk in r.iter_content(chunk_size=self.chunk_size):
+                            f.write(chunk)
+                            transferred += len(chunk)
+                    os.chmod(tmp_path, self._file_mode)
+                    os.replace(tmp_path, file_path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+                self._store_metadata(file_path, url, r)
+                return 'downloaded', transferred
+        except requests.RequestException:
+            return 'failed', 0
+
+    def fetch(self, urls, file_paths=None):
+        """Downloads every URL concurrently over the pooled session. Files that are unchanged on the
+        server (304 Not Modified) are kept as they are and reported as cache hits.
+
+        Args:
+            urls (list[str]): list of all website links to the files we want to download.
+            file_paths (list[str], optional): where to store each URL. Defaults to
+                dest_dir/[file_name].csv for each URL.
+
+        Returns:
+            DownloadReport: the files that are available locally, the cache hits, failures and bytes transferred.
+        """
+        if file_paths is None:
+            file_paths = [os.path.join(self.dest_dir, self.file_name_for(url) + ".csv") for url in urls]
+        for file_path in set(file_paths):
+            directory = os.path.dirname(file_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+
+        report = DownloadReport()
+        if not urls:
+            return report
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as pool:
+            results = list(pool.map(self._fetch_one, urls, file_paths))
+
+        for url, file_path, (status, transferred) in zip(urls, file_paths, results):
+            report.bytes_transferred += transferred
+            if status == 'failed':
+                report.failures.append(url)
+                continue
+            if status == 'cached':
+                report.cache_hits.append(self.file_name_for(url))
+            report.file_names.append(self.file_name_for(url))
+            report.file_paths.append(file_path)
+        return report
@@ -0,0 +1,254 @@
+import hashlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api import types
+
+try:
+    from data_classes.columnar_cache import ColumnarCache, feather, pa
+except ImportError:
+    from .columnar_cache import ColumnarCache, feather, pa
+
+
+class RefreshReport:
+    def __init__(self, mode, reason="", new_rows=None, seconds=0.0):
+        """Outcome of IncrementalCache.refresh.
+
+        Args:
+            mode (str): 'initial' (first ingestion), 'unchanged', 'append' (only new dates were added)
+                or 'rebuild' (the cache was rebuilt from the whole file).
+            reason (str, optional): why a rebuild was needed.
+            new_rows (DataFrame, optional): the rows added by an append.
+            seconds (float, optional): time the refresh took.
+        """
+        self.mode = mode
+        self.reason = reason
+        self.new_rows = new_rows
+        self.seconds = seconds
+
+    @property
+    def rows_added(self):
+        return 0 if self.new_rows is None else len(self.new_rows)
+
+    def __repr__(self):
+        reason = f", reason={self.reason!r}" if self.reason else ""
+        return f"RefreshReport(mode={self.mode!r}, rows_added={self.rows_added}, seconds={self.seconds:.3f}{reason})"
+
+
+def partition_checksums(df, date_column):
+    """Checksum of the rows of every date. Numbers are hashed as float64 and everything else as text, so the
+    checksum does not change when a column is parsed as int in one version of a file and as float in the next.
+    Rows without a date form one more partition, keyed "".
+
+    Args:
+        df (DataFrame): the dataset.
+        date_column (str): column the rows are partitioned by.
+
+    Returns:
+        dict[str, str]: "<rows>:<hash>" per date.
+    """
+    row_hashes = np.zeros(len(df), dtype=np.uint64)
+    for column in df.columns:
+        values = df[column]
+        if types.is_numeric_dtype(values.dtype) and not types.is_bool_dtype(values.dtype):
+            values = values.astype('float64')
+        else:
+            values = values.where(values.notna(), '').astype(str)
+        row_hashes = row_hashes * np.uint64(0x100000001B3) + pd.util.hash_array(values.to_numpy())
+    codes, dates = pd.factorize(df[date_column], sort=True)
+    labels = [str(date) for date in dates] + [""]
+    codes = np.where(codes >= 0, codes, len(dates))
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=len(labels))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    filled = counts > 0
+    sums = np.add.reduceat(row_hashes[order], starts[filled]) if len(order) else []
+    labels = np.array(labels)[filled]
+    return {label: f"{count}:{total:016x}" for label, count, total in zip(labels, counts[filled], sums)}
+
+
+class IncrementalCache(ColumnarCache):
+    manifest_suffix = ".manifest.json"
+
+    def __init__(self, cache_dir="data_files/.cache"):
+        """A ColumnarCache that can take in a new version of a file by appending only its new dates.
+        The cached dataset of a file is then a base Feather file plus one Feather part per append,
+        described by a manifest that also holds a checksum of the rows of every date.
+        Loads memory-map and concatenate the parts.
+
+        Args:
+            cache_dir (str, optional): directory the cache files are written to.
+        """
+        super().__init__(cache_dir)
+
+    def manifest_path(self, file_name):
+        return os.path.join(self.cache_dir, self._source_stem(file_name) + self.manifest_suffix)
+
+    def _load_manifest(self, file_name):
+        try:
+            with open(self.manifest_path(file_name)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return manifest if manifest.get('source') == os.path.abspath(file_name) else None
+
+    def _store_manifest(self, file_name, manifest):
+        self._atomic_write(self.manifest_path(file_name), lambda f: f.write(json.dumps(manifest).encode()))
+
+    def _read_parts(self, manifest, columns=None):
+        tables = [
+            feather.read_table(os.path.join(self.cache_dir, part), columns=columns, memory_map=True)
+            for part in manifest['parts']
+        ]
+        return pa.concat_tables(tables)
+
+    def load(self, file_name, columns=None):
+        """Loads a CSV through the cache, see ColumnarCache.load. If the file was last taken in by refresh,
+        its base file and appended parts are memory-mapped and concatenated. A file that changed since then is
+        taken in by refresh first, so the manifest keeps pointing at existing parts.
+
+        Args:
+            file_name (str): path to the source CSV.
+            columns (list[str], optional): only load these columns. Defaults to all columns.
+
+        Returns:
+            DataFrame: the loaded dataset.
+        """
+        if feather is not None and os.path.exists(file_name):
+            manifest = self._load_manifest(file_name)
+            if manifest is not None:
+                if manifest['hash'] == self.content_key(file_name):
+                    self.hits += 1
+                else:
+                    # ColumnarCache.build would evict the base file the manifest still lists
+                    self.misses += 1
+                    self._refresh(file_name, manifest['date_column'])
+                    manifest = self._load_manifest(file_name)
+                return self._read_parts(manifest, columns).to_pandas()
+        return super().load(file_name, columns)
+
+    @staticmethod
+    def _hash_prefix(file_name, size, block_size=1 << 20):
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_name, 'rb') as f:
+            remaining = size
+            while remaining > 0:
+                block = f.read(min(block_size, remaining))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _read_tail(file_name, offset):
+        """Parses the rows after byte offset, under the file's header line."""
+        with open(file_name, 'rb') as f:
+            header = f.readline().rstrip(b"\r\n")
+            f.seek(offset)
+            tail = f.read()
+        separator = b"" if tail.startswith((b"\n", b"\r\n")) else b"\n"
+        return pd.read_csv(io.BytesIO(header + separator + tail), delimiter=",")
+
+    def _rebuild(self, file_name, date_column, key, mode, reason="", df=None):
+        path = self.cache_path(file_name, key)
+        if df is None:
+            df = self.build(file_name, key)
+        else:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self._atomic_write(path, lambda f: feather.write_feather(table, f, compression='uncompressed'))
+            self._evict_stale(file_name, path)
+        old = self._load_manifest(file_name)
+        manifest = {
+            'source': os.path.abspath(file_name),
+            'hash': key,
+            'size': os.path.getsize(file_name),
+            'date_column': date_column,
+            'parts': [os.path.basename(path)],
+            'partitions': partition_checksums(df, date_column),
+        }
+        self._store_manifest(file_name, manifest)
+        for part in (old or {}).get('parts', [])[1:]:
+            if os.path.exists(os.path.join(self.cache_dir, part)):
+                os.remove(os.path.join(self.cache_dir, part))
+        return RefreshReport(mode, reason)
+
+    def _append(self, file_name, manifest, key, new_rows):
+        schema = feather.read_table(os.path.join(self.cache_dir, manifest['parts'][0]), memory_map=True).schema
+        table = pa.Table.from_pandas(new_rows, schema=schema, preserve_index=False)
+        part = os.path.splitext(manifest['parts'][0])[0] + ".part-%04d.feather" % len(manifest['parts'])
+        self._atomic_write(
+            os.path.join(self.cache_dir, part),
+            lambda f: feather.write_feather(table, f, compression='uncompressed'),
+        )
+        manifest['parts'].append(part)
+        manifest['hash'] = key
+        manifest['size'] = os.path.getsize(file_name)
+        manifest['partitions'].update(partition_checksums(new_rows, manifest['date_column']))
+        self._store_manifest(file_name, manifest)
+
+    def refresh(self, file_name, date_column):
+        """Takes in a new version of a file. If only rows of dates after the last cached date were added,
+        only those rows are parsed (when the file grew by appending, just its new bytes) and appended
+        to the cache as a new part. If any row of an already cached date changed, disappeared or was added,
+        as shown by the per-date checksums, the cache is rebuilt from the whole file.
+
+        Args:
+            file_name (str): path to the source CSV.
+            date_column (str): column holding the dates, formatted YYYY-MM-DD.
+
+        Returns:
+            RefreshReport: what was done; its new_rows can be handed to HeatMap.extend.
+        """
+        start = time.perf_counter()
+        report = self._refresh(file_name, date_column)
+        report.seconds = time.perf_counter() - start
+        return report
+
+    def _refresh(self, file_name, date_column):
+        if feather is None:
+            return RefreshReport('rebuild', "pyarrow is not installed")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        key = self.content_key(file_name)
+        manifest = self._load_manifest(file_name)
+        if manifest is None or manifest['date_column'] != date_column:
+            return self._rebuild(file_name, date_column, key, 'initial')
+        if manifest['hash'] == key:
+            return RefreshReport('unchanged', new_rows=pd.DataFrame())
+
+        partitions = manifest['partitions']
+        if not partitions:
+            # the cached file had no rows (e.g. only its header), so there is nothing to append to
+            return self._rebuild(file_name, date_column, key, 'initial', "no rows were cached")
+        last_date = max(partitions)
+        size = os.path.getsize(file_name)
+        if size > manifest['size'] and self._hash_prefix(file_name, manifest['size']) == manifest['hash']:
+            # the file grew by appending: the cached rows are untouched, parse only the new bytes
+            df = None
+            new_rows = self._read_tail(file_name, manifest['size'])
+            new_dates = new_rows[date_column].dropna().astype(str)
+            if len(new_dates) < len(new_rows) or (new_dates <= last_date).any():
+                return self._rebuild(file_name, date_column, key, 'rebuild', "appended rows of cached dates")
+        else:
+            df = pd.read_csv(file_name, delimiter=",")
+            checksums = partition_checksums(df, date_column)
+            changed = [date for date, checksum in partitions.items() if checksums.get(date) != checksum]
+            if changed:
+                reason = f"rows of {len(changed)} cached dates changed, e.g. {changed[0]}"
+                return self._rebuild(file_name, date_column, key, 'rebuild', reason, df)
+            if any(date < last_date for date in checksums if date not in partitions):
+                reason = "new dates before the last cached date"
+                return self._rebuild(file_name, date_column, key, 'rebuild', reason, df)
+            new_rows = df[df[date_column].notna() & (df[date_column].astype(str) > last_date)].reset_index(drop=True)
+
+        try:
+            self._append(file_name, manifest, key, new_rows)
+        except OSError:
+            return self._rebuild(file_name, date_column, key, 'rebuild', "the cached base file could not be read", df)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, ValueError, TypeError, KeyError):
+            return self._rebuild(file_name, date_column, key, 'rebuild', "new rows do not fit the cached columns", df)
+        return RefreshReport('append', new_rows=new_rows)
@@ -0,0 +1,307 @@
+import bisect
+import contextlib
+import cProfile
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger('epispread')
+
+# a single context manager handed out by every disabled stage, so that instrumentation costs one attribute check
+_disabled = contextlib.nullcontext()
+
+
+class LatencyHistogram:
+    # upper bounds of the buckets, in milliseconds; the last bucket takes everything slower
+    bounds_ms = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self):
+        """Counts of durations in fixed buckets, with their total, minimum and maximum."""
+        self.counts = [0] * (len(self.bounds_ms) + 1)
+        self.total_ms = 0.0
+        self.min_ms = float('inf')
+        self.max_ms = 0.0
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def record(self, seconds):
+        """Adds one duration.
+
+        Args:
+            seconds (float): the duration.
+        """
+        ms = seconds * 1e3
+        self.counts[bisect.bisect_left(self.bounds_ms, ms)] += 1
+        self.total_ms += ms
+        self.min_ms = min(self.min_ms, ms)
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, or the maximum if that is in the last bucket.
+
+        Args:
+            q (float): between 0 and 1.
+
+        Returns:
+            float: milliseconds, None without any duration.
+        """
+        if not self.count:
+            return None
+        bucket = bisect.bisect_left(list(itertools.accumulate(self.counts)), q * self.count)
+        return min(self.bounds_ms[bucket], self.max_ms) if bucket < len(self.bounds_ms) else self.max_ms
+
+    def to_dict(self):
+        labels = [f"<={bound}ms" for bound in self.bounds_ms] + [f">{self.bounds_ms[-1]}ms"]
+        return {
+            'count': self.count,
+            'mean_ms': self.total_ms / self.count if self.count else None,
+            'min_ms': self.min_ms if self.count else None,
+            'max_ms': self.max_ms,
+            'p50_ms': self.quantile(0.5),
+            'p90_ms': self.quantile(0.9),
+            'p99_ms': self.quantile(0.99),
+            'buckets': {label: count for label, count in zip(labels, self.counts) if count},
+        }
+
+
+class Instrumentation:
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, enabled=False, profile=(), trace_memory=(), profile_dir=None):
+        """Timers, counters and latency histograms of the pipeline stages, collected into one metrics object
+        that can be dumped as JSON or logged. While disabled, stage() hands out a shared no-op context manager
+        and the other methods return at once, so instrumented code runs at full speed.
+
+        Args:
+            enabled (bool, optional): whether to collect anything.
+            profile (list[str], optional): stages to run under cProfile. Their top functions by cumulative time
+                end up in the metrics, and in profile_dir/<stage>.prof if profile_dir is given.
+            trace_memory (list[str], optional): stages to run under tracemalloc, recording their peak memory.
+            profile_dir (str, optional): directory for the pstats files of the profiled stages.
+        """
+        self.enabled = enabled
+        self.profile = set(profile)
+        self.trace_memory = set(trace_memory)
+        self.profile_dir = profile_dir
+        self._lock = threading.Lock()
+        self._profiling = False
+        # per open memory-traced stage, on any thread: the highest peak it saw before another stage reset it
+        self._peaks = {}
+        # whether tracemalloc was started by a stage, and is to be stopped once no traced stage is open
+        self._started_tracing = False
+        self.reset()
+
+    @classmethod
+    def shared(cls):
+        """Returns the process-wide instance the pipeline reports to, disabled until configure is called."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def configure(self, enabled=True, profile=(), trace_memory=(), profile_dir=None):
+        """Switches collection on or off and chooses the profiled and memory-traced stages, keeping what was
+        collected so far.
+
+        Args:
+            enabled (bool, optional): whether to collect anything.
+            profile (list[str], optional): stages to run under cProfile.
+            trace_memory (list[str], optional): stages to run under tracemalloc.
+            profile_dir (str, optional): directory for the pstats files of the profiled stages.
+
+        Returns:
+            Instrumentation: self.
+        """
+        self.enabled = enabled
+        self.profile = set(profile)
+        self.trace_memory = set(trace_memory)
+        self.profile_dir = profile_dir
+        return self
+
+    def reset(self):
+        """Drops everything collected so far."""
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+            self.histograms = {}
+            self.profiles = {}
+            self.peak_bytes = {}
+
+    def stage(self, name, histogram=None):
+        """Context manager timing one run of a stage.
+
+        Args:
+            name (str): the stage, e.g. 'read_data'.
+            histogram (str, optional): also add the duration to this latency histogram.
+
+        Returns:
+            context manager: a no-op one while disabled.
+        """
+        if not self.enabled:
+            return _disabled
+        return self._timed(name, histogram)
+
+    @contextlib.contextmanager
+    def _timed(self, name, histogram):
+        # stages run on the prefetch and loader threads too, so the shared profiler and tracing state is locked
+        profiler = None
+        with self._lock:
+            if name in self.profile and not self._profiling:
+                # only one profiler can be active at a time, nested profiled stages are covered by the outer one
+                self._profiling = True
+                profiler = cProfile.Profile()
+        tracing = name in self.trace_memory
+        token = object()
+        if tracing:
+            with self._lock:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._started_tracing = True
+                else:
+                    # other traced stages may be open: keep the peak so far for them, and count afresh
+                    current = tracemalloc.get_traced_memory()[1]
+                    self._peaks = {key: max(peak, current) for key, peak in self._peaks.items()}
+                    tracemalloc.reset_peak()
+                self._peaks[token] = 0
+        if profiler is not None:
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                with self._lock:
+                    self._profiling = False
+                self._store_profile(name, profiler)
+            if tracing:
+                with self._lock:
+                    peak = max(tracemalloc.get_traced_memory()[1], self._peaks.pop(token))
+                    if not self._peaks and self._started_tracing:
+                        tracemalloc.stop()
+                        self._started_tracing = False
+                    self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), peak)
+            self.record(name, elapsed)
+            if histogram is not None:
+                self.observe(histogram, elapsed)
+
+    def _store_profile(self, name, profiler, top=15):
+        text = io.StringIO()
+        stats = pstats.Stats(profiler, stream=text)
+        stats.sort_stats('cumulative').print_stats(top)
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            stats.dump_stats(os.path.join(self.profile_dir, name + ".prof"))
+        with self._lock:
+            self.profiles[name] = text.getvalue()
+
+    def record(self, name, seconds):
+        """Adds one run of a stage timed elsewhere.
+
+        Args:
+            name (str): the stage.
+            seconds (float): how long it took.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            stage['calls'] += 1
+            stage['seconds'] += seconds
+            stage['max_seconds'] = max(stage['max_seconds'], seconds)
+
+    def count(self, name, n=1):
+        """Increments a counter, e.g. of cache hits.
+
+        Args:
+            name (str): the counter.
+            n (int, optional): the increment.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, seconds):
+        """Adds a duration to a latency histogram, e.g. of slider frames.
+
+        Args:
+            name (str): the histogram.
+            seconds (float): the duration.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = LatencyHistogram()
+            self.histograms[name].record(seconds)
+
+    def to_dict(self):
+        """Everything collected so far.
+
+        Returns:
+            dict: 'stages' (calls, total, mean and max seconds per stage), 'counters', 'histograms',
+            'peak_bytes' (of the memory-traced stages) and 'profiles' (text reports of the profiled stages).
+        """
+        with self._lock:
+            stages = {
+                name: dict(stage, mean_seconds=stage['seconds'] / stage['calls']) for name, stage in self.stages.items()
+            }
+            return {
+                'stages': stages,
+                'counters': dict(self.counters),
+                'histograms': {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+                'peak_bytes': dict(self.peak_bytes),
+                'profiles': dict(self.profiles),
+            }
+
+    def dump(self, path):
+        """Writes the metrics as JSON.
+
+        Args:
+            path (str): file to write.
+
+        Returns:
+            str: the path written.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+    def log(self, level=logging.INFO):
+        """Logs one line per stage, counter and histogram to the 'epispread' logger."""
+        metrics = self.to_dict()
+        for name, stage in metrics['stages'].items():
+            peak = metrics['peak_bytes'].get(name)
+            memory = f", peak {peak / 2**20:.1f} MB" if peak is not None else ""
+            logger.log(
+                level,
+                "stage %s: %d calls, %.3fs total, %.3fs max%s",
+                name,
+                stage['calls'],
+                stage['seconds'],
+                stage['max_seconds'],
+                memory,
+            )
+        for name, value in metrics['counters'].items():
+            logger.log(level, "counter %s: %d", name, value)
+        for name, histogram in metrics['histograms'].items():
+            logger.log(
+                level,
+                "histogram %s: %d samples, p50 %s ms, p90 %s ms, max %.1f ms",
+                name,
+                histogram['count'],
+                histogram['p50_ms'],
+                histogram['p90_ms'],
+                histogram['max_ms'],
+            )
@@ -0,0 +1,105 @@
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class IsoLookup:
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path=None, to='ISO3'):
+        """Memoized country code conversion. Every distinct code is resolved once with
+        country_converter and remembered; if a path is given the table is also persisted there,
+        so later sessions do not need country_converter at all.
+
+        Args:
+            path (str, optional): JSON file the lookup table is persisted in. Defaults to in-memory only.
+            to (str, optional): country_converter classification to convert to.
+        """
+        self.path = path
+        self.to = to
+        self.table = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.table = json.load(f).get(to, {})
+            except (OSError, ValueError):
+                self.table = {}
+
+    @classmethod
+    def shared(cls, path="data_files/.cache/iso-lookup.json", to='ISO3'):
+        """Returns the process-wide lookup persisted at path, creating it on first use.
+
+        Args:
+            path (str, optional): JSON file the lookup table is persisted in.
+            to (str, optional): country_converter classification to convert to.
+
+        Returns:
+            IsoLookup: the shared instance.
+        """
+        with cls._shared_lock:
+            if (path, to) not in cls._shared:
+                cls._shared[(path, to)] = cls(path, to)
+            return cls._shared[(path, to)]
+
+    def _convert(self, codes):
+        import country_converter as coco
+
+        return coco.convert(names=codes, to=self.to)
+
+    def _persist(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            stored = {}
+        stored[self.to] = self.table
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        with os.fdopen(fd, 'w') as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def resolve(self, codes, resolver=None):
+        """Makes sure every given code is in the lookup table, converting the unknown ones in a single call.
+
+        Args:
+            codes (iterable[str]): country codes, duplicates allowed.
+            resolver (callable, optional): function turning a list of codes into a list of converted codes.
+                Defaults to country_converter.convert.
+        """
+        with self._lock:
+            unknown = sorted({code for code in codes if isinstance(code, str) and code not in self.table})
+            if not unknown:
+                return
+            converted = (resolver or self._convert)(unknown)
+            if isinstance(converted, str):
+                converted = [converted]
+            self.table.update(
+                {code: (None if value == 'not found' else value) for code, value in zip(unknown, converted)}
+            )
+            if self.path:
+                self._persist()
+
+    def map(self, codes, resolver=None):
+        """Converts a column of codes. The conversion runs once per distinct code and is then
+        broadcast to every row.
+
+        Args:
+            codes (Series): country codes.
+            resolver (callable, optional): see resolve.
+
+        Returns:
+            Series: converted codes, None where a code is missing or could not be converted.
+        """
+        positions, uniques = pd.factorize(codes)
+        self.resolve(uniques, resolver)
+        # the extra trailing None is picked up by position -1, i.e. missing codes
+        converted = np.array([self.table.get(code) for code in uniques] + [None], dtype=object)
+        return pd.Series(converted[positions], index=codes.index, name=codes.name)
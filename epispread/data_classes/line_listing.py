@@ -0,0 +1,121 @@
+import time
+
+import pandas as pd
+
+
+class LineListingAggregator:
+    def __init__(
+        self,
+        date_column,
+        region_column,
+        sum_columns=(),
+        count_column='Cases',
+        chunk_size=1_000_000,
+        progress=None,
+        locator=None,
+        coordinate_columns=None,
+    ):
+        """Streams a line listing (one row per case) from disk and aggregates it into one row per (date, region),
+        without ever holding the whole file. Each chunk is read with explicit dtypes and only the needed columns,
+        grouped, and added into the running aggregate, so memory is bounded by the chunk size and the number of
+        (date, region) pairs, not by the size of the file.
+
+        Args:
+            date_column (str): column holding the date of each case. Timestamps are truncated to the day,
+                i.e. to their first 10 characters (YYYY-MM-DD).
+            region_column (str): column holding the region of each case, e.g. an ISO2/ISO3 country code.
+                With a locator, the name of the output column holding the located region instead.
+            sum_columns (iterable[str], optional): numeric columns to sum per (date, region) as well.
+            count_column (str, optional): name of the output column holding the number of cases.
+            chunk_size (int, optional): number of rows read at a time.
+            progress (callable, optional): called after every chunk with (rows read, seconds elapsed).
+            locator (RegionLocator, optional): finds the region of every case from its coordinates, for
+                geocoded line listings without a region column. Cases outside every region are skipped.
+            coordinate_columns ((str, str), optional): the longitude and latitude columns read for the locator.
+        """
+        if (locator is None) != (coordinate_columns is None):
+            raise ValueError("locator and coordinate_columns must be given together")
+        self.date_column = date_column
+        self.region_column = region_column
+        self.sum_columns = list(sum_columns)
+        self.count_column = count_column
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.locator = locator
+        self.coordinate_columns = list(coordinate_columns or ())
+        self.rows = 0
+        self.skipped = 0
+        self.chunks = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        """Ingestion speed of the last aggregate call."""
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def _input_columns(self):
+        regions = self.coordinate_columns if self.locator is not None else [self.region_column]
+        return [self.date_column] + regions + self.sum_columns
+
+    def _dtypes(self):
+        dtypes = {self.date_column: str}
+        if self.locator is not None:
+            dtypes.update({column: 'float64' for column in self.coordinate_columns})
+        else:
+            dtypes[self.region_column] = str
+        dtypes.update({column: 'float64' for column in self.sum_columns})
+        return dtypes
+
+    def _regions(self, chunk):
+        if self.locator is None:
+            return chunk[self.region_column]
+        x, y = self.coordinate_columns
+        return pd.Series(self.locator.keys_of(chunk[x], chunk[y]), index=chunk.index, name=self.region_column)
+
+    def _aggregate_chunk(self, chunk):
+        keys = [chunk[self.date_column].str.slice(0, 10), self._regions(chunk)]
+        grouped = chunk.groupby(keys, sort=False)
+        partial = grouped[self.sum_columns].sum() if self.sum_columns else pd.DataFrame(index=grouped.size().index)
+        partial.insert(0, self.count_column, grouped.size())
+        self.skipped += len(chunk) - int(partial[self.count_column].sum())
+        return partial
+
+    def aggregate(self, file_name, **read_csv_kwargs):
+        """Aggregates a line listing file. Compressed files (.gz, .zip, ...) are read transparently.
+
+        Args:
+            file_name (str): path to the CSV file.
+            **read_csv_kwargs: further arguments for pandas.read_csv, e.g. sep or encoding.
+
+        Returns:
+            DataFrame: one row per (date, region) sorted by date then region, with the date and region columns,
+            the case count and the sums. Rows with a missing date or region are left out and counted in skipped.
+        """
+        self.rows = self.skipped = self.chunks = 0
+        start = time.perf_counter()
+        total = None
+        reader = pd.read_csv(
+            file_name,
+            usecols=self._input_columns(),
+            dtype=self._dtypes(),
+            chunksize=self.chunk_size,
+            **read_csv_kwargs,
+        )
+        with reader:
+            for chunk in reader:
+                partial = self._aggregate_chunk(chunk)
+                total = partial if total is None else total.add(partial, fill_value=0)
+                self.rows += len(chunk)
+                self.chunks += 1
+                self.seconds = time.perf_counter() - start
+                if self.progress is not None:
+                    self.progress(self.rows, self.seconds)
+        self.seconds = time.perf_counter() - start
+
+        columns = [self.date_column, self.region_column, self.count_column] + self.sum_columns
+        if total is None:
+            return pd.DataFrame(columns=columns)
+        total = total.sort_index()
+        total.index.names = [self.date_column, self.region_column]
+        total[self.count_column] = total[self.count_column].astype('int64')
+        return total.reset_index()[columns]
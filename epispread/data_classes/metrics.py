@@ -0,0 +1,187 @@
+import re
+import warnings
+
+import numpy as np
+import pandas as pd
+
+try:
+    from data_classes.iso_lookup import IsoLookup
+except ImportError:
+    from .iso_lookup import IsoLookup
+
+
+def world_population(world, df, key_column, iso_column, iso_lookup=None):
+    """Population of every key of a dataset, from the pop_est column of the world GeoDataFrame.
+
+    Args:
+        world (GeoDataFrame): world polygons with iso_a3 and pop_est columns.
+        df (DataFrame): the dataset.
+        key_column (str): column of df the population is wanted for, e.g. the country name.
+        iso_column (str): column of df with the ISO2 or ISO3 code of each key.
+        iso_lookup (IsoLookup, optional): converts ISO2 codes to ISO3. Defaults to the shared, persisted one.
+
+    Returns:
+        Series: population indexed by the values of key_column, NaN where the country is not in the world.
+    """
+    keys = df[[key_column, iso_column]].dropna().drop_duplicates(key_column)
+    codes = keys[iso_column]
+    if len(codes) and len(codes.iloc[0]) == 2:
+        codes = (iso_lookup or IsoLookup.shared()).map(codes)
+    population = world.drop_duplicates('iso_a3').set_index('iso_a3')['pop_est']
+    return pd.Series(codes.map(population).to_numpy(dtype=float), index=keys[key_column].to_numpy())
+
+
+class DerivedMetrics:
+    # <column>_avg<days>, <column>_per100k, <column>_wow; suffixes can be chained, e.g. New_cases_avg7_per100k
+    pattern = re.compile(r'^(?P<column>.+)_(?P<metric>avg|per100k|wow)(?P<window>\d*)$')
+    windows = (7, 14)
+
+    def __init__(self, df, date_column, key_column, population=None):
+        """Metrics derived from the columns of a long-format dataset, by name:
+
+        - <column>_avg7, <column>_avg14 (any number of days): rolling mean over the last days of each key,
+          NaN until a key has that many days with values.
+        - <column>_per100k: the value per 100,000 inhabitants of the key.
+        - <column>_wow: week-over-week growth, the sum of the last 7 days over the sum of the 7 before, minus 1.
+
+        Every metric is computed for all keys at once with cumulative sums over the rows sorted by (key, date),
+        and memoized per (source column, metric, window). Windows count rows, i.e. days for daily data.
+
+        Args:
+            df (DataFrame): long-format dataset, one row per (key, date).
+            date_column (str): column holding the dates.
+            key_column (str): column holding the keys, e.g. the country.
+            population (Series or dict, optional): population per key, needed for per100k metrics.
+        """
+        self.df = df
+        self.date_column = date_column
+        self.key_column = key_column
+        self.population = population
+        self._memo = {}
+        self._layout = None
+
+    @classmethod
+    def names(cls, columns, per_capita=True):
+        """Names of the metrics that can be derived from some columns, e.g. to offer them in a prompt.
+
+        Args:
+            columns (list[str]): source columns, usually the number columns of the dataset.
+            per_capita (bool, optional): whether to include the per100k metrics.
+
+        Returns:
+            list[str]: metric names.
+        """
+        suffixes = [f"_avg{window}" for window in cls.windows] + (["_per100k"] if per_capita else []) + ["_wow"]
+        return [column + suffix for column in columns for suffix in suffixes]
+
+    @classmethod
+    def parse(cls, name):
+        """Splits a metric name into its source column, metric and window.
+
+        Args:
+            name (str): e.g. 'New_cases_avg7'.
+
+        Returns:
+            (str, str, int): the source column (itself possibly derived), the metric and the window in rows,
+            or None if name is not a metric name.
+        """
+        match = cls.pattern.match(name)
+        if match is None or (match['metric'] == 'avg') != bool(match['window']):
+            return None
+        window = {'avg': int(match['window'] or 0), 'per100k': 1, 'wow': 7}[match['metric']]
+        return match['column'], match['metric'], window
+
+    def provides(self, name):
+        """Whether name is a column of the dataset or a metric that can be derived from one."""
+        while name not in self.df.columns:
+            parsed = self.parse(name)
+            if parsed is None:
+                return False
+            name = parsed[0]
+        return True
+
+    def _prepare(self):
+        """Sorts the rows by (key, date) once and records the position of every row within its key."""
+        if self._layout is None:
+            key_codes, keys = pd.factorize(self.df[self.key_column])
+            date_codes, _ = pd.factorize(self.df[self.date_column], sort=True)
+            order = np.lexsort((date_codes, key_codes))
+            sorted_keys = key_codes[order]
+            starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            sizes = np.diff(np.r_[starts, len(order)])
+            position = np.arange(len(order)) - np.repeat(starts, sizes)
+            usable = (sorted_keys >= 0) & (date_codes[order] >= 0)
+            self._layout = (order, sorted_keys, keys, position, usable)
+        return self._layout
+
+    @staticmethod
+    def _window_sums(values, position, window, lag=0):
+        """Sums of the last window rows of each key ending lag rows back, with the number of non-NaN values in them.
+        Rows with fewer than window + lag earlier rows of their key get a count of 0."""
+        filled = np.where(np.isnan(values), 0.0, values)
+        sums = np.r_[0.0, np.cumsum(filled)]
+        counts = np.r_[0, np.cumsum(~np.isnan(values))]
+        end = np.arange(1, len(values) + 1) - lag
+        start = np.maximum(end - window, 0)
+        enough = position >= window + lag - 1
+        end, start = np.where(enough, end, 0), np.where(enough, start, 0)
+        return sums[end] - sums[start], np.where(enough, counts[end] - counts[start], 0)
+
+    def values(self, name):
+        """Values of a column or metric for every row of the dataset.
+
+        Args:
+            name (str): a column of the dataset or a metric name.
+
+        Returns:
+            ndarray: float64 values in the row order of the dataset.
+        """
+        if name in self.df.columns:
+            return pd.to_numeric(self.df[name], errors='coerce').to_numpy(dtype=float)
+        parsed = self.parse(name)
+        if parsed is None:
+            raise KeyError(f"{name!r} is neither a column nor a derived metric (e.g. {self.names(['New_cases'])})")
+        if parsed not in self._memo:
+            self._memo[parsed] = self._compute(*parsed)
+        return self._memo[parsed]
+
+    def _compute(self, column, metric, window):
+        order, sorted_keys, keys, position, usable = self._prepare()
+        values = self.values(column)[order]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            if metric == 'avg':
+                sums, counts = self._window_sums(values, position, window)
+                result = np.where(counts == window, sums / window, np.nan)
+            elif metric == 'wow':
+                last, last_counts = self._window_sums(values, position, window)
+                before, before_counts = self._window_sums(values, position, window, lag=window)
+                complete = (last_counts == window) & (before_counts == window) & (before != 0)
+                result = np.where(complete, last / before - 1.0, np.nan)
+            else:
+                if self.population is None:
+                    raise ValueError(f"{column}_per100k needs the population of every {self.key_column}")
+                population = pd.Series(keys).map(pd.Series(self.population)).to_numpy(dtype=float)
+                result = values / population[np.maximum(sorted_keys, 0)] * 100000
+        result = np.where(usable, result, np.nan)
+        unsorted = np.empty(len(result))
+        unsorted[order] = result
+        return unsorted
+
+    def attach(self, df, names):
+        """Adds metrics as columns to a shallow copy of df, which must have the dataset's rows in the same order.
+
+        Args:
+            df (DataFrame): the dataset, or a shallow copy of it with extra columns.
+            names (list[str]): metric names; names that already are columns of df are skipped.
+
+        Returns:
+            DataFrame: the copy with the metric columns, or df itself if nothing was added.
+        """
+        missing = [name for name in names if name not in df.columns]
+        if not missing:
+            return df
+        df = df.copy(deep=False)
+        for name in missing:
+            df[name] = self.values(name)
+        return df
@@ -0,0 +1,76 @@
+import threading
+
+import numpy as np
+
+
+class RegionLocator:
+    def __init__(self, world, key_column='iso_a3'):
+        """Finds the region of geocoded points, e.g. case records with a longitude and a latitude, so they can be
+        aggregated per region. The region polygons go into an STRtree and are prepared for containment tests,
+        both on first use, so a locator costs nothing until it locates points.
+
+        Args:
+            world (GeoDataFrame): region polygons in longitude/latitude, e.g. WorldCache(source=...).load('high').
+            key_column (str, optional): column of world holding the region keys.
+        """
+        self.world = world
+        self.key_column = key_column
+        self.keys = world[key_column].to_numpy()
+        self._geometries = None
+        self._tree = None
+        self._lock = threading.Lock()
+
+    @property
+    def tree(self):
+        """The STRtree of the region polygons, built on first use."""
+        with self._lock:
+            if self._tree is None:
+                import shapely
+
+                self._geometries = self.world.geometry.to_numpy()
+                shapely.prepare(self._geometries)
+                self._tree = shapely.STRtree(self._geometries)
+            return self._tree
+
+    def locate(self, x, y):
+        """Row of world containing each point. The tree narrows every point down to the regions whose bounding
+        box holds it, and only those are tested exactly.
+
+        Args:
+            x (array): longitudes.
+            y (array): latitudes.
+
+        Returns:
+            ndarray: row of world per point, -1 for points outside every region or with missing coordinates.
+            A point on a border shared by several regions goes to the first of them.
+        """
+        import shapely
+
+        tree = self.tree
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        rows = np.full(len(x), -1, dtype=np.intp)
+        valid = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+        x, y = x[valid], y[valid]
+        point_rows, region_rows = tree.query(shapely.points(x, y))
+        inside = shapely.intersects_xy(self._geometries[region_rows], x[point_rows], y[point_rows])
+        point_rows, region_rows = point_rows[inside], region_rows[inside]
+        # assign in reverse order of region so that the first region wins on shared borders
+        order = np.argsort(region_rows, kind='stable')[::-1]
+        rows[valid[point_rows[order]]] = region_rows[order]
+        return rows
+
+    def keys_of(self, x, y):
+        """Region key of each point.
+
+        Args:
+            x (array): longitudes.
+            y (array): latitudes.
+
+        Returns:
+            ndarray: object array of keys, None for points outside every region.
+        """
+        rows = self.locate(x, y)
+        keys = self.keys.astype(object)[rows]
+        keys[rows < 0] = None
+        return keys
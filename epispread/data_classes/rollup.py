@@ -0,0 +1,367 @@
+import numpy as np
+import pandas as pd
+
+try:
+    from data_classes.compact import EPOCH, format_days, to_days
+    from data_classes.cube import DataCube
+    from data_classes.metrics import DerivedMetrics
+    from data_classes.instrumentation import Instrumentation
+except ImportError:
+    from .compact import EPOCH, format_days, to_days
+    from .cube import DataCube
+    from .metrics import DerivedMetrics
+    from .instrumentation import Instrumentation
+
+
+def bucket_starts(days, bucket):
+    """First day of the bucket of every day offset.
+
+    Args:
+        days (array-like): day offsets from 1970-01-01 (see to_days).
+        bucket (str): 'day', 'week' (ISO weeks, starting on Monday) or 'month'.
+
+    Returns:
+        ndarray: int64 day offsets of the first day of each bucket.
+    """
+    days = np.asarray(days, dtype=np.int64)
+    if bucket == 'day':
+        return days
+    if bucket == 'week':
+        # 1970-01-01 was a Thursday, three days after a Monday
+        return days - (days + 3) % 7
+    if bucket == 'month':
+        return ((EPOCH + days).astype('datetime64[M]').astype('datetime64[D]') - EPOCH).astype(np.int64)
+    raise ValueError(f"bucket must be one of {Rollup.buckets}, not {bucket!r}")
+
+
+def bucket_labels(days, bucket):
+    """Labels of the buckets of day offsets: YYYY-MM-DD for days, ISO weeks as YYYY-Www and months as YYYY-MM.
+
+    Args:
+        days (array-like): day offsets from 1970-01-01.
+        bucket (str): one of Rollup.buckets.
+
+    Returns:
+        ndarray: the labels as strings.
+    """
+    starts = bucket_starts(days, bucket)
+    if bucket == 'week':
+        # an ISO week belongs to the year of its Thursday
+        thursdays = EPOCH + starts + 3
+        years = thursdays.astype('datetime64[Y]')
+        weeks = (thursdays - years.astype('datetime64[D]')).astype(np.int64) // 7 + 1
+        return np.array([f"{year}-W{week:02d}" for year, week in zip(years.astype(str), weeks)])
+    if bucket == 'month':
+        return np.datetime_as_string((EPOCH + starts).astype('datetime64[M]'), unit='M')
+    return format_days(starts)
+
+
+def _group_sum(array, groups, n_groups, axis):
+    """Sums the slices of an array along an axis per group, leaving out the slices of group -1.
+
+    Returns:
+        ndarray: float64, with n_groups slices along axis; groups without any slice are 0.
+    """
+    shape = list(array.shape)
+    shape[axis] = n_groups
+    result = np.zeros(shape)
+    kept = np.flatnonzero(groups >= 0)
+    if not len(kept):
+        return result
+    order = kept[np.argsort(groups[kept], kind='stable')]
+    ordered = groups[order]
+    starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+    index = [slice(None)] * array.ndim
+    index[axis] = ordered[starts]
+    result[tuple(index)] = np.add.reduceat(np.take(array, order, axis=axis), starts, axis=axis, dtype=np.float64)
+    return result
+
+
+def _pad(array, width, fill):
+    """array with extra columns of fill up to width columns, for keys added since it was built."""
+    if array.shape[1] == width:
+        return array
+    padded = np.full((array.shape[0], width), fill, dtype=array.dtype)
+    padded[:, : array.shape[1]] = array
+    return padded
+
+
+class Rollup:
+    buckets = ('day', 'week', 'month')
+    aggregations = ('sum', 'mean')
+    global_level = 'global'
+    # columns of the WHO files grouping countries into larger regions, finest first
+    hierarchy = ('WHO_region',)
+    instrumentation = Instrumentation.shared()
+
+    def __init__(self, df, date_column, key_column, value_columns, parent_columns=(), rate_columns=None, row_days=None):
+        """Aggregates of value columns at every level of a hierarchy of keys (e.g. country, WHO region, global)
+        and over days, ISO weeks and months, so coarser views are read from small tables instead of
+        re-aggregating the rows.
+
+        The rows are aggregated in one grouped pass into a (days x keys) table per column; every other level and
+        bucket is summed from that table. Each (level, bucket) table is kept as a float32 DataCube dated by the
+        first day of its buckets, NaN where a bucket has no value. Every column is summed; for rate columns the
+        number of values is kept too, so their mean can be read. New rows are added with extend.
+
+        Args:
+            df (DataFrame): long-format dataset, one row per (key, date).
+            date_column (str): column holding the dates, as text, datetimes or day offsets (see compact).
+            key_column (str): column holding the keys of the finest level, e.g. the country.
+            value_columns (list[str] or dict[str, array]): columns to aggregate, or values per row of df by name,
+                e.g. derived metrics (see DerivedMetrics).
+            parent_columns (list[str], optional): columns of df grouping the keys, finest first, e.g. WHO_region.
+                A key belongs to the group of its first row.
+            rate_columns (list[str], optional): columns to also keep the mean of. Defaults to the derived metrics
+                and the columns with "rate" in their name.
+            row_days (Series, optional): day offsets of the rows, if already converted (see to_days).
+        """
+        self.date_column = date_column
+        self.key_column = key_column
+        self.parent_columns = list(parent_columns)
+        self.levels = (key_column, *self.parent_columns, self.global_level)
+        values = self._values(df, value_columns)
+        self.columns = list(values)
+        if rate_columns is None:
+            rate_columns = [column for column in self.columns if self._is_rate(column)]
+        self.rate_columns = list(rate_columns)
+        self.keys = pd.Index([], dtype=object)
+        self.parents = {}
+        self.cubes = {}
+        self.counts = {}
+        with self.instrumentation.stage('rollup'):
+            self._add(df, values, row_days)
+
+    @staticmethod
+    def _is_rate(column):
+        return DerivedMetrics.parse(column) is not None or 'rate' in column.lower()
+
+    @staticmethod
+    def _values(df, value_columns):
+        if isinstance(value_columns, dict):
+            return {column: np.asarray(values, dtype=float) for column, values in value_columns.items()}
+        return {column: pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float) for column in value_columns}
+
+    def level(self, level):
+        """Name of a level, validated.
+
+        Args:
+            level (str): one of self.levels, or None for the finest.
+
+        Returns:
+            str: the level.
+        """
+        if level is None:
+            return self.levels[0]
+        if level not in self.levels:
+            raise ValueError(f"level must be one of {self.levels}, not {level!r}")
+        return level
+
+    def aggregation(self, column):
+        """Default aggregation of a column: 'mean' for rate columns, 'sum' otherwise."""
+        return 'mean' if column in self.rate_columns else 'sum'
+
+    def groups(self, level):
+        """Group of every key of the finest level at a level.
+
+        Args:
+            level (str): one of self.levels.
+
+        Returns:
+            (ndarray, Index): the group of every key (-1 for keys without one) and the keys of the level.
+        """
+        level = self.level(level)
+        if level == self.levels[0]:
+            return np.arange(len(self.keys)), self.keys
+        if level == self.global_level:
+            return np.zeros(len(self.keys), dtype=np.intp), pd.Index([self.global_level], dtype=object)
+        return self.parents[level]
+
+    @staticmethod
+    def _codes(column, known):
+        """Codes of the values of column in known, appending values not seen before.
+
+        Returns:
+            (ndarray, Index): the code of every row (-1 where missing) and the grown known values.
+        """
+        local, uniques = pd.factorize(column, sort=True)
+        uniques = pd.Index(np.asarray(uniques), dtype=object)
+        positions = known.get_indexer(uniques)
+        new = positions < 0
+        if new.any():
+            positions[new] = len(known) + np.arange(new.sum())
+            known = known.append(uniques[new])
+        return np.where(local >= 0, positions[np.maximum(local, 0)], -1), known
+
+    def _register(self, df):
+        """Codes of the keys of the rows of df, adding new keys and the groups they belong to.
+
+        Returns:
+            ndarray: the key code of every row, -1 where it is missing.
+        """
+        codes, self.keys = self._codes(df[self.key_column], self.keys)
+        for column in self.parent_columns:
+            groups, names = self.parents.get(column, (np.zeros(0, dtype=np.intp), pd.Index([], dtype=object)))
+            row_groups, names = self._codes(df[column], names)
+            grown = np.full(len(self.keys), -1, dtype=np.intp)
+            grown[: len(groups)] = groups
+            # keys without a group yet take the group of their first row: assign in reverse so that it wins
+            rows = np.flatnonzero((codes >= 0) & (row_groups >= 0))
+            rows = rows[grown[codes[rows]] < 0][::-1]
+            grown[codes[rows]] = row_groups[rows]
+            self.parents[column] = (grown, names)
+        return codes
+
+    def _add(self, df, values, row_days):
+        """Aggregates the rows of df and merges them into the tables."""
+        days = to_days(df[self.date_column]) if row_days is None else row_days
+        missing = pd.isna(days).to_numpy() if isinstance(days, pd.Series) else np.zeros(len(df), dtype=bool)
+        days = pd.Series(days).to_numpy(dtype=np.int64, na_value=0)
+        day_codes, day_values = pd.factorize(days, sort=True)
+        day_codes[missing] = -1
+        last = self.cubes.get((self.levels[0], 'day'))
+        if last is not None and last.dates and (day_codes >= 0).any():
+            first = day_values[day_codes[day_codes >= 0].min()]
+            if first <= last.dates[-1]:
+                raise ValueError(f"new day {first} does not come after the last day {last.dates[-1]}")
+        codes = self._register(df)
+        day_codes[codes < 0] = -1
+
+        n_days, n_keys = len(day_values), len(self.keys)
+        tables = {}
+        for column, column_values in values.items():
+            present = (day_codes >= 0) & ~np.isnan(column_values)
+            cells = day_codes[present] * n_keys + codes[present]
+            sums = np.bincount(cells, weights=column_values[present], minlength=n_days * n_keys)
+            counts = np.bincount(cells, minlength=n_days * n_keys)
+            sums, counts = sums.reshape(n_days, n_keys), counts.reshape(n_days, n_keys)
+            for level in self.levels:
+                level_sums, level_counts = sums, counts
+                if level != self.levels[0]:
+                    # every coarser level is summed from the small (days x keys) table, not from the rows
+                    groups, names = self.groups(level)
+                    level_sums = _group_sum(sums, groups, len(names), 1)
+                    level_counts = _group_sum(counts, groups, len(names), 1)
+                for bucket in self.buckets:
+                    starts, bucket_codes = np.unique(bucket_starts(day_values, bucket), return_inverse=True)
+                    table = tables.setdefault((level, bucket), (starts, {}))[1]
+                    table[column] = (
+                        _group_sum(level_sums, bucket_codes, len(starts), 0),
+                        _group_sum(level_counts, bucket_codes, len(starts), 0),
+                    )
+        for (level, bucket), (starts, table) in tables.items():
+            self._merge(level, bucket, starts, table)
+
+    def _merge(self, level, bucket, starts, table):
+        """Appends the aggregates of new rows to a table; a bucket both cover (e.g. the current week) is added up."""
+        names = self.groups(level)[1]
+        cube = self.cubes.get((level, bucket))
+        counts = self.counts.setdefault((level, bucket), {})
+        overlap = bool(cube is not None and cube.dates and len(starts) and starts[0] == cube.dates[-1])
+        arrays = {}
+        for column, (sums, column_counts) in table.items():
+            new = np.where(column_counts > 0, sums, np.nan).astype(np.float32)
+            new_counts = column_counts.astype(np.int32)
+            if cube is not None:
+                old = _pad(cube.arrays[column], len(names), np.nan)
+                old_counts = _pad(counts[column], len(names), 0) if column in counts else None
+                if overlap:
+                    old[-1] = np.where(np.isnan(new[0]), old[-1], np.nan_to_num(old[-1]) + new[0])
+                    new, new_counts = new[1:], new_counts[1:]
+                    if old_counts is not None:
+                        old_counts[-1] += column_counts[0].astype(np.int32)
+                new = np.concatenate([old, new])
+                if old_counts is not None:
+                    new_counts = np.concatenate([old_counts, new_counts])
+            arrays[column] = new
+            if column in self.rate_columns:
+                counts[column] = new_counts
+        dates = [] if cube is None else cube.dates
+        dates = dates + [int(start) for start in starts[1 if overlap else 0 :]]
+        self.cubes[(level, bucket)] = DataCube(dates, list(names), arrays)
+
+    def extend(self, df, row_days=None, values=None):
+        """Adds rows of days after the last one, e.g. RefreshReport.new_rows after a daily refresh.
+        Only the new rows are aggregated; the buckets they share with earlier rows are added up.
+
+        Args:
+            df (DataFrame): the new rows, with the date, key and parent columns and every value column.
+            row_days (Series, optional): day offsets of the rows, if already converted.
+            values (dict[str, array], optional): values of the new rows for columns not in df.
+
+        Returns:
+            Rollup: self.
+        """
+        if not len(df):
+            return self
+        with self.instrumentation.stage('rollup_extend'):
+            arrays = self._values(df, [column for column in self.columns if column not in (values or {})])
+            arrays.update(self._values(df, values or {}))
+            self._add(df, arrays, row_days)
+        return self
+
+    def cube(self, level=None, bucket='day', columns=None, how=None, keys=None):
+        """The aggregates of one level and bucket, dated by the first day of each bucket.
+
+        Args:
+            level (str, optional): one of self.levels. Defaults to the finest.
+            bucket (str, optional): one of Rollup.buckets.
+            columns (list[str], optional): value columns. Defaults to all.
+            how (str, optional): 'sum' or 'mean' (rate columns only). Defaults to each column's aggregation.
+            keys (list, optional): lay the cube out by these keys of the finest level instead of by the keys of
+                level, each key getting the value of its group, e.g. every country that of its WHO region.
+                Pass the world's key column to align the cube with the world geometry; a key listed twice only
+                gets values in its first column, keys not in the rollup none.
+
+        Returns:
+            DataCube: the aggregates, float32 and NaN where a bucket has no value.
+        """
+        level = self.level(level)
+        if bucket not in self.buckets:
+            raise ValueError(f"bucket must be one of {self.buckets}, not {bucket!r}")
+        if how is not None and how not in self.aggregations:
+            raise ValueError(f"how must be one of {self.aggregations}, not {how!r}")
+        cube = self.cubes[(level, bucket)]
+        arrays = {}
+        for column in self.columns if columns is None else columns:
+            if (how or self.aggregation(column)) == 'sum':
+                arrays[column] = cube.arrays[column]
+            elif column in self.rate_columns:
+                counts = self.counts[(level, bucket)][column]
+                arrays[column] = cube.arrays[column] / np.where(counts > 0, counts, 1).astype(np.float32)
+            else:
+                raise ValueError(f"only the sum of {column!r} is kept, it is not a rate column")
+        if keys is None:
+            return DataCube(cube.dates, cube.keys, arrays)
+        keys = pd.Index(keys)
+        first = ~keys.duplicated()
+        positions = np.where(first, self.keys.get_indexer(keys), -1)
+        groups = np.r_[self.groups(level)[0], -1][positions]
+        for column, array in arrays.items():
+            # group -1 picks the appended column of NaN
+            missing = np.full((len(array), 1), np.nan, dtype=np.float32)
+            arrays[column] = np.concatenate([array, missing], axis=1)[:, groups]
+        return DataCube(cube.dates, list(keys), arrays)
+
+    def wide(self, column, level=None, bucket='day', how=None):
+        """The aggregates of one column as a (buckets x keys of level) DataFrame, e.g. for TimeSeries.
+
+        Args:
+            column (str): value column.
+            level (str, optional): one of self.levels. Defaults to the finest.
+            bucket (str, optional): one of Rollup.buckets.
+            how (str, optional): 'sum' or 'mean'. Defaults to the column's aggregation.
+
+        Returns:
+            DataFrame: indexed by the first day of each bucket as datetimes, one column per key of level.
+        """
+        cube = self.cube(level, bucket, [column], how)
+        dates = (EPOCH + np.asarray(cube.dates, dtype=np.int64)).astype('datetime64[ns]')
+        index = pd.DatetimeIndex(dates, name=self.date_column)
+        return pd.DataFrame(cube.arrays[column], index=index, columns=cube.keys)
+
+    @property
+    def nbytes(self):
+        """Total memory held by the tables, in bytes."""
+        counts = sum(array.nbytes for table in self.counts.values() for array in table.values())
+        return sum(cube.nbytes for cube in self.cubes.values()) + counts
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pandas.api import types
+
+
+class SchemaInference:
+    schema_file = "schema.json"
+
+    def __init__(self, cache_dir=None, sample_rows=10000, max_entries=256):
+        """Works out which columns of a dataset hold numbers, dates, country codes and time-series keys.
+        Column types come from the dtypes, with a bounded row sample for object columns, so the cost does not
+        grow with the number of rows. Schemas of files are persisted, keyed by file content hash and header.
+
+        Args:
+            cache_dir (str, optional): directory schema.json is persisted in. Defaults to in-memory only.
+            sample_rows (int, optional): maximum number of rows looked at to type an object column.
+            max_entries (int, optional): maximum number of persisted schemas, the oldest are dropped first.
+        """
+        self.cache_dir = cache_dir
+        self.sample_rows = sample_rows
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._schemas = None
+
+    @staticmethod
+    def header_key(content_hash, df):
+        """Cache key of a schema: the file content plus the names and dtypes of the loaded columns.
+
+        Args:
+            content_hash (str): content hash of the source file, see ColumnarCache.content_key.
+            df (DataFrame): the dataset as loaded.
+
+        Returns:
+            str: hex digest.
+        """
+        header = "\0".join(f"{column}\1{dtype}" for column, dtype in df.dtypes.items())
+        return hashlib.blake2b((content_hash + "\0" + header).encode(), digest_size=16).hexdigest()
+
+    def _sample(self, df):
+        step = max(1, len(df) // self.sample_rows)
+        return df.iloc[::step]
+
+    def _is_number(self, column, sample):
+        if types.is_bool_dtype(column.dtype):
+            return False
+        if types.is_numeric_dtype(column.dtype):
+            return True
+        if column.dtype != object:
+            return False
+        # object columns holding Python numbers (e.g. mixed with None)
+        values = sample.dropna()
+        return len(values) > 0 and all(isinstance(value, (int, float, np.number)) for value in values)
+
+    def number_columns(self, df):
+        """Columns holding numbers, whatever their first row holds.
+
+        Args:
+            df (DataFrame): the dataset.
+
+        Returns:
+            list[str]: column names, in column order.
+        """
+        sample = self._sample(df)
+        return [column for column in df.columns if self._is_number(df[column], sample[column])]
+
+    @staticmethod
+    def date_columns(df):
+        """Columns holding dates: named like a date, or of a datetime dtype."""
+        return [
+            column
+            for column in df.columns
+            if "date" in str(column).lower() or types.is_datetime64_any_dtype(df[column].dtype)
+        ]
+
+    @staticmethod
+    def iso_columns(df):
+        """Columns holding country codes, recognised by name."""
+        return [column for column in df.columns if "iso" in str(column).lower() or "code" in str(column).lower()]
+
+    @staticmethod
+    def _codes(column):
+        codes, uniques = pd.factorize(column)
+        return codes.astype(np.int64), len(uniques)
+
+    def time_series_date(self, df, key_column, date_columns, date_codes=None):
+        """The first date column that makes key_column a time-series key: no (key, date) pair occurs twice,
+        and at least one key has more than one date. One vectorized duplicate check per date column.
+
+        Args:
+            df (DataFrame): the dataset.
+            key_column (str): candidate key column, e.g. the country name.
+            date_columns (list[str]): candidate date columns, in order of preference.
+            date_codes (dict, optional): factorized date columns, filled on demand so calls can share them.
+
+        Returns:
+            str: the date column, or None.
+        """
+        date_codes = {} if date_codes is None else date_codes
+        codes, n_keys = self._codes(df[key_column])
+        for date_column in date_columns:
+            if date_column not in date_codes:
+                date_codes[date_column] = self._codes(df[date_column])
+            dates, n_dates = date_codes[date_column]
+            present = (codes >= 0) & (dates >= 0)
+            pairs = pd.Series(codes[present] * n_dates + dates[present])
+            if len(pairs) > n_keys and not pairs.duplicated().any():
+                return date_column
+        return None
+
+    def infer(self, df):
+        """Infers the schema of a dataset.
+
+        Args:
+            df (DataFrame): the dataset.
+
+        Returns:
+            dict: 'number_columns', 'date_columns', 'iso_columns' and 'time_series_columns',
+            the latter a list of [key column, date column] pairs.
+        """
+        number_columns = self.number_columns(df)
+        date_columns = self.date_columns(df)
+        iso_columns = self.iso_columns(df)
+        typed = set(number_columns + date_columns + iso_columns)
+        time_series_columns = []
+        date_codes = {}
+        for column in df.columns:
+            if column in typed:
+                continue
+            date_column = self.time_series_date(df, column, date_columns, date_codes)
+            if date_column:
+                time_series_columns.append([column, date_column])
+        return {
+            'number_columns': number_columns,
+            'date_columns': date_columns,
+            'iso_columns': iso_columns,
+            'time_series_columns': time_series_columns,
+        }
+
+    def _load_schemas(self):
+        if self._schemas is None:
+            self._schemas = {}
+            if self.cache_dir:
+                try:
+                    with open(os.path.join(self.cache_dir, self.schema_file)) as f:
+                        self._schemas = json.load(f)
+                except (OSError, ValueError):
+                    pass
+        return self._schemas
+
+    def _persist(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._schemas, f)
+        os.replace(tmp_path, os.path.join(self.cache_dir, self.schema_file))
+
+    def schema(self, df, content_hash=None):
+        """The schema of a dataset, from the cache when the same file with the same header was seen before.
+
+        Args:
+            df (DataFrame): the dataset.
+            content_hash (str, optional): content hash of the file df was loaded from. Without it nothing is cached.
+
+        Returns:
+            dict: the schema, see infer.
+        """
+        if content_hash is None:
+            return self.infer(df)
+        key = self.header_key(content_hash, df)
+        schemas = self._load_schemas()
+        if key in schemas:
+            self.hits += 1
+            return schemas[key]
+        self.misses += 1
+        schemas[key] = self.infer(df)
+        for stale in list(schemas)[: max(0, len(schemas) - self.max_entries)]:
+            del schemas[stale]
+        if self.cache_dir:
+            self._persist()
+        return schemas[key]
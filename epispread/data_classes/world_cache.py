@@ -0,0 +1,184 @@
+import hashlib
+import importlib.util
+import os
+import tempfile
+import threading
+
+# GeoDataFrame.to_feather needs pyarrow; without it only the process-level cache is used. geopandas and pyarrow
+# themselves are imported when a world is first loaded.
+has_pyarrow = importlib.util.find_spec('pyarrow') is not None
+
+
+class WorldCache:
+    # simplification tolerance of each level of detail, in degrees
+    levels = {'high': 0.0, 'medium': 0.1, 'low': 0.25}
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, cache_dir="data_files/.cache", source=None):
+        """Process-level and on-disk cache of the prepared world GeoDataFrame (naturalearth_lowres without
+        Antarctica, or a user-supplied boundary file) and of simplified variants of it, one per level of detail.
+        On disk every variant is a Feather file with WKB geometries, so later sessions do not parse the source,
+        which matters for boundary files of thousands of admin regions.
+
+        Args:
+            cache_dir (str, optional): directory the Feather files are written to. None keeps the cache in memory.
+            source (str, optional): path of the shapefile, or of any boundary file geopandas can read
+                (GeoPackage, GeoJSON, ...). Its geometries are converted to longitude/latitude if they are
+                projected. Defaults to geopandas' naturalearth_lowres.
+        """
+        self.cache_dir = cache_dir
+        self.source = source
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, cache_dir="data_files/.cache", source=None):
+        """Returns the process-wide cache for a cache directory and source, creating it on first use.
+
+        Args:
+            cache_dir (str, optional): directory the Feather files are written to.
+            source (str, optional): path of the boundary file. Defaults to naturalearth_lowres.
+
+        Returns:
+            WorldCache: the shared instance.
+        """
+        with cls._shared_lock:
+            if (cache_dir, source) not in cls._shared:
+                cls._shared[(cache_dir, source)] = cls(cache_dir, source)
+            return cls._shared[(cache_dir, source)]
+
+    @classmethod
+    def owner(cls, world):
+        """Returns the shared cache world was loaded from, so its precomputed variants are found.
+
+        Args:
+            world (GeoDataFrame): the polygons.
+
+        Returns:
+            WorldCache: that cache, or the default shared one for a GeoDataFrame loaded elsewhere.
+        """
+        with cls._shared_lock:
+            caches = list(cls._shared.values())
+        for cache in caches:
+            if any(world is variant for variant in cache._variants.values()):
+                return cache
+        return cls.shared()
+
+    @classmethod
+    def select_level(cls, width_px, extent_degrees=360.0):
+        """Picks the coarsest level of detail whose simplification stays below one pixel.
+
+        Args:
+            width_px (float): width of the map axes in pixels.
+            extent_degrees (float, optional): longitude range shown across that width.
+
+        Returns:
+            str: name of the level of detail.
+        """
+        degrees_per_px = extent_degrees / max(width_px, 1.0)
+        fitting = [(tolerance, level) for level, tolerance in cls.levels.items() if tolerance <= degrees_per_px]
+        return max(fitting)[1]
+
+    def _source_path(self):
+        if self.source:
+            return self.source
+        import geopandas as gpd
+
+        return gpd.datasets.get_path('naturalearth_lowres')
+
+    def _cache_path(self, level):
+        stat = os.stat(self._source_path())
+        key = "%s:%d:%d:%r" % (os.path.abspath(self._source_path()), stat.st_size, stat.st_mtime_ns, self.levels)
+        digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+        return os.path.join(self.cache_dir, "world-%s-%s.feather" % (level, digest))
+
+    def _prepare(self):
+        import geopandas as gpd
+
+        world = gpd.read_file(self._source_path())
+        if self.source:
+            # the tolerances of the levels of detail are in degrees
+            if world.crs is not None and not world.crs.is_geographic:
+                world = world.to_crs(4326)
+            return world
+        return world[world.name != "Antarctica"]
+
+    def _write(self, world, path):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        os.close(fd)
+        try:
+            world.to_feather(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _build(self):
+        """Reads the Feather variants from disk if they are there, otherwise parses the shapefile once,
+        simplifies it at every level and writes the variants out.
+        """
+        import geopandas as gpd
+
+        on_disk = self.cache_dir is not None and has_pyarrow
+        if on_disk and all(os.path.exists(self._cache_path(level)) for level in self.levels):
+            self._variants = {level: gpd.read_feather(self._cache_path(level)) for level in self.levels}
+            return
+        world = self._prepare()
+        self._variants = {level: self.simplify(world, tolerance) for level, tolerance in self.levels.items()}
+        if on_disk:
+            for level, variant in self._variants.items():
+                self._write(variant, self._cache_path(level))
+
+    @staticmethod
+    def simplify(world, tolerance):
+        """Simplifies every geometry of world, keeping row order and all other columns.
+
+        Args:
+            world (GeoDataFrame): polygons to simplify.
+            tolerance (float): simplification tolerance in degrees, 0 returns world unchanged.
+
+        Returns:
+            GeoDataFrame: the simplified polygons.
+        """
+        if not tolerance:
+            return world
+        simplified = world.copy()
+        simplified['geometry'] = world.geometry.simplify(tolerance, preserve_topology=True)
+        return simplified
+
+    def load(self, level='high'):
+        """Returns the prepared world GeoDataFrame at a level of detail. The object is shared with
+        every other caller, so copy it before modifying it.
+
+        Args:
+            level (str, optional): one of WorldCache.levels.
+
+        Returns:
+            GeoDataFrame: the world, without Antarctica.
+        """
+        if level not in self.levels:
+            raise ValueError(f"level must be one of {list(self.levels)}, not {level!r}")
+        with self._lock:
+            if not self._variants:
+                self._build()
+            return self._variants[level]
+
+    def variant(self, world, level):
+        """Returns world at the given level of detail. Worlds loaded from this cache get their precomputed
+        variant, any other GeoDataFrame is simplified on the spot.
+
+        Args:
+            world (GeoDataFrame): the world polygons.
+            level (str): one of WorldCache.levels.
+
+        Returns:
+            GeoDataFrame: world at that level of detail, rows in the same order.
+        """
+        if level not in self.levels:
+            raise ValueError(f"level must be one of {list(self.levels)}, not {level!r}")
+        if any(world is variant for variant in self._variants.values()):
+            return self.load(level)
+        return self.simplify(world, self.levels[level])
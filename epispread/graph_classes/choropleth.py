@@ -0,0 +1,318 @@
+import numpy as np
+import pandas as pd
+from matplotlib import colormaps
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PathCollection
+from matplotlib.colors import to_rgba
+from matplotlib.figure import Figure
+from matplotlib.image import AxesImage
+from matplotlib.path import Path
+
+
+def _ring_path(ring):
+    """Turns one closed shapely ring into vertices and path codes.
+
+    Args:
+        ring (LinearRing): exterior or interior ring of a polygon.
+
+    Returns:
+        (ndarray, ndarray): the vertices and matching matplotlib Path codes.
+    """
+    vertices = np.asarray(ring.coords)[:, :2]
+    codes = np.full(len(vertices), Path.LINETO, dtype=Path.code_type)
+    codes[0] = Path.MOVETO
+    codes[-1] = Path.CLOSEPOLY
+    return vertices, codes
+
+
+def polygon_paths(geometry):
+    """Converts a Polygon or MultiPolygon into one matplotlib Path per polygon, holes included.
+
+    Args:
+        geometry (Polygon or MultiPolygon): the shape to convert.
+
+    Returns:
+        list[Path]: the paths, empty for missing or empty geometries.
+    """
+    if geometry is None or geometry.is_empty:
+        return []
+    polygons = geometry.geoms if hasattr(geometry, 'geoms') else [geometry]
+    paths = []
+    for polygon in polygons:
+        if polygon.is_empty:
+            continue
+        rings = [_ring_path(polygon.exterior)] + [_ring_path(ring) for ring in polygon.interiors]
+        paths.append(Path(np.concatenate([v for v, _ in rings]), np.concatenate([c for _, c in rings])))
+    return paths
+
+
+def world_paths(world):
+    """Converts every geometry of a GeoDataFrame into matplotlib Paths.
+
+    Args:
+        world (GeoDataFrame): polygons, one row per region.
+
+    Returns:
+        (list[Path], ndarray): the paths, and the row of world each path belongs to.
+    """
+    paths = []
+    owners = []
+    for row, geometry in enumerate(world.geometry):
+        shapes = polygon_paths(geometry)
+        paths.extend(shapes)
+        owners.extend([row] * len(shapes))
+    return paths, np.asarray(owners, dtype=np.intp)
+
+
+class Choropleth:
+    def __init__(
+        self, ax, world, key_column='iso_a3', cmap='viridis', norm=None, missing_color='lightgrey', linewidth=0.2
+    ):
+        """Draws every polygon of the world GeoDataFrame once, as a single collection. Afterwards a new frame
+        only swaps the collection's colour array, nothing is re-merged or re-drawn from scratch. Regions without
+        a value are hatched with red edges on top of missing_color, as the merged GeoDataFrame plot drew them.
+
+        Args:
+            ax (Axes): axes to draw on.
+            world (GeoDataFrame): polygons to draw, one row per region.
+            key_column (str, optional): column of world that frames are matched on.
+            cmap (str, optional): name of the matplotlib colormap.
+            norm (Normalize, optional): colour normalisation, shared by every frame.
+            missing_color (str, optional): colour of regions without a value.
+            linewidth (float, optional): width of the region borders.
+        """
+        self.ax = ax
+        self._index_keys(world, key_column)
+        # polygon i of the collection belongs to row owners[i] of world
+        self._paths, self.owners = world_paths(world)
+        colormap = colormaps[cmap].copy()
+        colormap.set_bad(missing_color)
+        self.collection = PathCollection(self._paths, cmap=colormap, norm=norm, edgecolor='black', linewidth=linewidth)
+        self.collection.set_array(np.ma.masked_all(len(self._paths)))
+        # drawn over the collection, holds only the polygons of regions without a value
+        self.missing = PathCollection(self._paths, facecolor='none', edgecolor='red', hatch='///', linewidth=linewidth)
+        # the artists a new frame changes
+        self.artists = [self.collection, self.missing]
+        ax.add_collection(self.collection)
+        ax.add_collection(self.missing, autolim=False)
+        ax.autoscale_view()
+
+    def _index_keys(self, world, key_column):
+        keys = pd.Index(world[key_column])
+        unique = ~keys.duplicated()
+        self.keys = keys[unique]
+        self._key_rows = np.flatnonzero(unique)
+        self.n_regions = len(world)
+
+    def align(self, keys):
+        """Finds the world row of every key, so frames can be scattered onto the polygons without a merge.
+
+        Args:
+            keys (Series or array): region keys, e.g. ISO3 codes.
+
+        Returns:
+            ndarray: world row of each key, -1 where the key is not in the world.
+        """
+        positions = self.keys.get_indexer(pd.Index(keys))
+        return np.where(positions >= 0, self._key_rows[positions], -1)
+
+    def set_values(self, values):
+        """Recolours the regions.
+
+        Args:
+            values (ndarray): one value per world row, NaN for missing.
+        """
+        values = np.asarray(values, dtype=float)[self.owners]
+        self.collection.set_array(np.ma.masked_invalid(values))
+        self.missing.set_paths([self._paths[i] for i in np.flatnonzero(np.isnan(values))])
+
+
+class _RegionImage(AxesImage):
+    """The image a RasterChoropleth draws: before every draw it makes sure the region ids are rasterised for the
+    current view and resolution."""
+
+    def __init__(self, ax, choropleth, **kwargs):
+        super().__init__(ax, origin='upper', interpolation='nearest', **kwargs)
+        self.choropleth = choropleth
+
+    def draw(self, renderer):
+        self.choropleth._refresh(renderer)
+        super().draw(renderer)
+
+    def get_extent(self):
+        return self.choropleth.extent
+
+    def autoscale_None(self):
+        self.norm.autoscale_None(np.ma.masked_invalid(self.choropleth.values))
+
+    def get_cursor_data(self, event):
+        return self.choropleth.value_at(event.xdata, event.ydata)
+
+
+class RasterChoropleth(Choropleth):
+    # borders are left out while the regions in view average fewer pixels than this, they would cover the fills
+    border_min_pixels = 64
+
+    def __init__(
+        self,
+        ax,
+        world,
+        key_column='iso_a3',
+        cmap='viridis',
+        norm=None,
+        missing_color='lightgrey',
+        linewidth=0.2,
+        edge_color='black',
+    ):
+        """Choropleth for maps of thousands of regions, e.g. admin-1 or admin-2 boundaries. The polygons are
+        rasterised once into an image of region ids at the resolution of the axes, and again only when the view
+        or the size of the figure changes. A frame is then a lookup of each region's colour through that image,
+        which takes about as long for 200 regions as for 200,000. It has the interface of Choropleth, with an
+        AxesImage as its collection. Regions without a value are only filled with missing_color, hatching would
+        not read at a few pixels per region.
+
+        Args:
+            ax (Axes): axes to draw on.
+            world (GeoDataFrame): polygons to draw, one row per region.
+            key_column (str, optional): column of world that frames are matched on.
+            cmap (str, optional): name of the matplotlib colormap.
+            norm (Normalize, optional): colour normalisation, shared by every frame.
+            missing_color (str, optional): colour of regions without a value.
+            linewidth (float, optional): width of the region borders, 0 for none.
+            edge_color (str, optional): colour of the region borders.
+        """
+        self.ax = ax
+        self._index_keys(world, key_column)
+        self._paths, self.owners = world_paths(world)
+        self.linewidth = linewidth
+        # ids in the raster: 0 outside every region, row + 1 inside a region, n_regions + 1 on a border
+        self.ids = None
+        self._raster_key = None
+        self._lut = np.zeros((self.n_regions + 2, 4), dtype=np.uint8)
+        self._lut[-1] = np.round(np.array(to_rgba(edge_color)) * 255)
+        self.values = np.full(self.n_regions, np.nan)
+
+        colormap = colormaps[cmap].copy()
+        colormap.set_bad(missing_color)
+        self.collection = _RegionImage(ax, self, cmap=colormap, norm=norm)
+        self.artists = [self.collection]
+        x0, y0, x1, y1 = world.total_bounds
+        self.bounds = (x0, y0, x1, y1)
+        self.extent = (x0, x1, y0, y1)
+        ax.add_image(self.collection)
+        ax.update_datalim([(x0, y0), (x1, y1)])
+        ax.autoscale_view()
+
+    @staticmethod
+    def _encode(ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        return np.column_stack([(ids >> 16) & 255, (ids >> 8) & 255, ids & 255, np.full(len(ids), 255)]) / 255
+
+    def _shows_borders(self, width, height, xlim, ylim):
+        """Whether the regions in a view are large enough for borders, assuming they are spread evenly over
+        the bounds of the world."""
+        x0, y0, x1, y1 = self.bounds
+        overlap_x = max(0.0, min(x1, max(xlim)) - max(x0, min(xlim)))
+        overlap_y = max(0.0, min(y1, max(ylim)) - max(y0, min(ylim)))
+        visible = self.n_regions * overlap_x * overlap_y / max((x1 - x0) * (y1 - y0), 1e-12)
+        return bool(self.linewidth) and width * height >= self.border_min_pixels * visible
+
+    def rasterize(self, width, height, xlim, ylim, dpi=100):
+        """Draws the polygons, each in a colour encoding its row, without antialiasing and reads the ids back.
+
+        Args:
+            width (int): width of the raster in pixels.
+            height (int): height of the raster in pixels.
+            xlim ((float, float)): x range covered by the raster.
+            ylim ((float, float)): y range covered by the raster, bottom to top.
+            dpi (float, optional): resolution the border width is scaled by.
+
+        Returns:
+            ndarray: int32 ids of shape (height, width), the first row at the top.
+        """
+        fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        canvas = FigureCanvasAgg(fig)
+        fig.patch.set_facecolor((0, 0, 0, 1))
+        ax = fig.add_axes((0, 0, 1, 1))
+        ax.set_axis_off()
+        ax.set_xlim(xlim)
+        ax.set_ylim(ylim)
+        border = self._encode([self.n_regions + 1])[0] if self._shows_borders(width, height, xlim, ylim) else 'none'
+        collection = PathCollection(
+            self._paths,
+            facecolors=self._encode(self.owners + 1),
+            edgecolors=border,
+            linewidths=self.linewidth,
+            antialiased=False,
+        )
+        ax.add_collection(collection)
+        canvas.draw()
+        rgba = np.asarray(canvas.buffer_rgba()).astype(np.int32)
+        ids = (rgba[..., 0] << 16) | (rgba[..., 1] << 8) | rgba[..., 2]
+        ids[ids > self.n_regions + 1] = 0
+        return ids
+
+    def _refresh(self, renderer):
+        """Rasterises the ids again if the view, the size of the axes or the resolution changed."""
+        bbox = self.ax.get_window_extent(renderer)
+        width, height = max(int(round(bbox.width)), 1), max(int(round(bbox.height)), 1)
+        xlim, ylim = self.ax.get_xlim(), self.ax.get_ylim()
+        key = (width, height, xlim, ylim, renderer.dpi)
+        if key == self._raster_key:
+            return
+        self.ids = self.rasterize(width, height, xlim, ylim, renderer.dpi)
+        self.extent = (xlim[0], xlim[1], ylim[0], ylim[1])
+        self._raster_key = key
+        self.collection.set_data(self._lut[self.ids])
+
+    def set_values(self, values):
+        """Recolours the regions.
+
+        Args:
+            values (ndarray): one value per world row, NaN for missing.
+        """
+        self.values = np.asarray(values, dtype=float)
+        masked = np.ma.masked_invalid(self.values)
+        self.collection.norm.autoscale_None(masked)
+        self._lut[1:-1] = self.collection.to_rgba(masked, bytes=True)
+        if self.ids is not None:
+            self.collection.set_data(self._lut[self.ids])
+
+    def value_at(self, x, y):
+        """Value of the region under a point of the current view.
+
+        Args:
+            x (float): x in data coordinates.
+            y (float): y in data coordinates.
+
+        Returns:
+            float: the value, None outside every region or before the first draw.
+        """
+        if self.ids is None or x is None or y is None:
+            return None
+        x0, x1, y0, y1 = self.extent
+        height, width = self.ids.shape
+        column, row = int((x - x0) / (x1 - x0) * width), int((y1 - y) / (y1 - y0) * height)
+        if not (0 <= row < height and 0 <= column < width):
+            return None
+        region = self.ids[row, column]
+        return self.values[region - 1] if 1 <= region <= self.n_regions else None
+
+
+def build_choropleth(ax, world, key_column='iso_a3', raster_threshold=5000, **kwargs):
+    """Draws world as a Choropleth, or as a RasterChoropleth if it has more than raster_threshold regions.
+
+    Args:
+        ax (Axes): axes to draw on.
+        world (GeoDataFrame): polygons to draw, one row per region.
+        key_column (str, optional): column of world that frames are matched on.
+        raster_threshold (int, optional): number of regions above which frames are drawn as an image.
+            None always draws the polygons, 0 always draws an image.
+        **kwargs: further arguments of Choropleth, e.g. norm.
+
+    Returns:
+        Choropleth: the persistent artist.
+    """
+    if raster_threshold is not None and len(world) > raster_threshold:
+        return RasterChoropleth(ax, world, key_column, **kwargs)
+    return Choropleth(ax, world, key_column, **kwargs)
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+
+class DateIndex:
+    def __init__(self, df, date_column, row_dates=None):
+        """Sorts the rows of df by date once and records where each date's block of rows starts and ends,
+        so that fetching the rows of one date is a slice instead of a scan over the whole table.
+
+        Args:
+            df (DataFrame): long-format DataFrame with one row per (place, date).
+            date_column (str): name of the column holding the dates.
+            row_dates (Series, optional): the date of every row of df in another representation to index by,
+                e.g. day offsets from to_days. Defaults to df[date_column].
+        """
+        self.df = df
+        self.date_column = date_column
+
+        codes, uniques = pd.factorize(df[date_column] if row_dates is None else row_dates, sort=True)
+        order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        ends = np.cumsum(counts)
+        # rows with a missing date get code -1 and sort first; leave them out
+        missing = len(codes) - int(ends[-1]) if len(ends) else len(codes)
+
+        self.order = order[missing:]
+        self.sorted_df = df.iloc[self.order]
+        self.dates = list(uniques)
+        self.offsets = {date: (int(end - count), int(end)) for date, end, count in zip(uniques, ends, counts)}
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, date):
+        return date in self.offsets
+
+    def frame(self, date):
+        """Returns the rows reported on a single date.
+
+        Args:
+            date: the date to fetch, in the same representation as the date column.
+
+        Returns:
+            DataFrame: the rows for that date (empty if the date does not occur). This is a slice of the
+            sorted table, so copy it before modifying it.
+        """
+        start, end = self.offsets.get(date, (0, 0))
+        return self.sorted_df.iloc[start:end]
+
+    def rows(self, date):
+        """Returns the positions in the original DataFrame of the rows reported on a single date.
+
+        Args:
+            date: the date to fetch, in the same representation as the date column.
+
+        Returns:
+            ndarray: positional row numbers (empty if the date does not occur).
+        """
+        start, end = self.offsets.get(date, (0, 0))
+        return self.order[start:end]
+
+    def extend(self, df, row_dates=None):
+        """Takes in rows of new dates appended to the indexed DataFrame, indexing only the new rows.
+
+        Args:
+            df (DataFrame): the indexed DataFrame with the new rows appended at the end. Every new date must come
+                after the last indexed date.
+            row_dates (Series, optional): the dates of the new rows, if the index was built with row_dates.
+
+        Returns:
+            DateIndex: self, now indexing df.
+        """
+        old_rows = len(self.df)
+        added = DateIndex(df.iloc[old_rows:], self.date_column, row_dates)
+        if self.dates and added.dates and added.dates[0] <= self.dates[-1]:
+            raise ValueError(f"new date {added.dates[0]} does not come after the last indexed date {self.dates[-1]}")
+        shift = len(self.order)
+        self.df = df
+        self.order = np.concatenate([self.order, added.order + old_rows])
+        self.sorted_df = pd.concat([self.sorted_df, added.sorted_df])
+        self.dates += added.dates
+        self.offsets.update({date: (start + shift, end + shift) for date, (start, end) in added.offsets.items()})
+        return self
@@ -0,0 +1,70 @@
+import warnings
+
+import numpy as np
+
+
+def minmax_indices(values, n_buckets):
+    """Picks the minimum and the maximum of every series in each of n_buckets equal slices of the rows, so the
+    envelope of every line survives while the number of points drops to 2 * n_buckets.
+
+    Args:
+        values (ndarray): shape (points, series), NaN where a series has no value.
+        n_buckets (int): number of slices, about the number of pixels across the axes.
+
+    Returns:
+        ndarray: row indices, shape (rows kept, series), in increasing order per series.
+    """
+    n_points, n_series = values.shape
+    if n_buckets < 1 or 2 * n_buckets >= n_points:
+        return np.repeat(np.arange(n_points)[:, None], n_series, axis=1)
+    edges = np.linspace(0, n_points, n_buckets + 1).astype(int)
+    kept = np.empty((2 * n_buckets, n_series), dtype=np.intp)
+    for bucket, (start, end) in enumerate(zip(edges[:-1], edges[1:])):
+        block = values[start:end]
+        missing = np.isnan(block)
+        low = start + np.argmin(np.where(missing, np.inf, block), axis=0)
+        high = start + np.argmax(np.where(missing, -np.inf, block), axis=0)
+        kept[2 * bucket] = np.minimum(low, high)
+        kept[2 * bucket + 1] = np.maximum(low, high)
+    return kept
+
+
+def lttb_indices(x, values, n_out):
+    """Largest-Triangle-Three-Buckets downsampling of every series at once: keeps the first and last point and,
+    in each of n_out - 2 slices of the rows, the point forming the largest triangle with the previously kept point
+    and the average of the next slice.
+
+    Args:
+        x (ndarray): shape (points,), increasing x values shared by all series.
+        values (ndarray): shape (points, series), NaN where a series has no value.
+        n_out (int): number of points to keep per series, about the number of pixels across the axes.
+
+    Returns:
+        ndarray: row indices, shape (n_out, series), in increasing order per series.
+    """
+    n_points, n_series = values.shape
+    if n_out < 3 or n_out >= n_points:
+        return np.repeat(np.arange(n_points)[:, None], n_series, axis=1)
+    edges = np.linspace(1, n_points - 1, n_out - 1).astype(int)
+    columns = np.arange(n_series)
+    kept = np.empty((n_out, n_series), dtype=np.intp)
+    kept[0] = 0
+    kept[-1] = n_points - 1
+    previous = kept[0]
+    with warnings.catch_warnings():
+        # a series without any value in a slice has a NaN average, its point is then picked arbitrarily
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        for bucket in range(n_out - 2):
+            start, end = edges[bucket], edges[bucket + 1]
+            following = slice(end, edges[bucket + 2] if bucket + 2 < len(edges) else n_points)
+            average_x = x[following].mean()
+            average_y = np.nanmean(values[following], axis=0)
+            previous_x = x[previous]
+            previous_y = values[previous, columns]
+            area = np.abs(
+                (previous_x - average_x) * (values[start:end] - previous_y)
+                - (previous_x - x[start:end, None]) * (average_y - previous_y)
+            )
+            previous = start + np.argmax(np.where(np.isnan(area), -1.0, area), axis=0)
+            kept[bucket + 1] = previous
+    return kept
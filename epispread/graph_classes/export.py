@@ -0,0 +1,239 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import Normalize
+from matplotlib.figure import Figure
+from mpl_toolkits.axes_grid1 import make_axes_locatable
+
+try:
+    from graph_classes.choropleth import build_choropleth
+    from graph_classes.heat_map import HeatMap
+    from data_classes.compact import format_days, to_day
+except ImportError:
+    from .choropleth import build_choropleth
+    from .heat_map import HeatMap
+    from ..data_classes.compact import format_days, to_day
+
+# per-process rendering state, set up once by _init_worker
+_worker = {}
+
+
+def _make_renderer(values, world, vmin, vmax, title, figsize, dpi, key_column='iso_a3', raster_threshold=5000):
+    """Builds a figure and its choropleth once, for rendering many frames of one column without pyplot.
+
+    Args:
+        values (ndarray): the (dates x world regions) cube of the column, possibly memory-mapped.
+        world (GeoDataFrame): world polygons, in the order of the cube's columns.
+        vmin (float): lower end of the colour scale.
+        vmax (float): upper end of the colour scale.
+        title (str): heading of every frame, followed by the frame's date.
+        figsize ((float, float)): size of the frames in inches.
+        dpi (int): resolution of the frames.
+        key_column (str, optional): column of world the cube's columns stand for.
+        raster_threshold (int, optional): number of regions above which frames are drawn as an image,
+            see build_choropleth.
+
+    Returns:
+        dict: the renderer, for _draw.
+    """
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_aspect('equal')
+    cax = make_axes_locatable(ax).append_axes("right", size="5%", pad=0.1)
+    choropleth = build_choropleth(
+        ax, world, key_column, raster_threshold=raster_threshold, norm=Normalize(vmin=vmin, vmax=vmax)
+    )
+    fig.colorbar(choropleth.collection, cax=cax)
+    return dict(fig=fig, title=ax.set_title(title), choropleth=choropleth, values=values, heading=title)
+
+
+def _draw(renderer, row, label):
+    """Recolours a renderer's choropleth with one cube row and sets its title.
+
+    Args:
+        renderer (dict): from _make_renderer.
+        row (int): the cube row.
+        label (str): the row's date.
+
+    Returns:
+        Figure: the figure, ready to be saved.
+    """
+    renderer['choropleth'].set_values(renderer['values'][row])
+    renderer['title'].set_text(f"{renderer['heading']}  {label}")
+    return renderer['fig']
+
+
+def _init_worker(cube_path, world, *style):
+    """Builds the figure and the choropleth of a rendering process once. The cube is memory-mapped from
+    disk, so its pages are shared between processes instead of being pickled to each of them.
+    """
+    _worker.update(_make_renderer(np.load(cube_path, mmap_mode='r'), world, *style))
+
+
+def _render_frame(task):
+    """Renders one cube row to a PNG file.
+
+    Args:
+        task ((int, str, str)): the cube row, its date and the path of the PNG.
+
+    Returns:
+        str: the path of the PNG.
+    """
+    row, label, path = task
+    _draw(_worker, row, label).savefig(path)
+    return path
+
+
+class FrameExporter:
+    def __init__(
+        self,
+        df,
+        world,
+        plot_column,
+        iso_column,
+        date_column,
+        start_date=None,
+        end_date=None,
+        step=1,
+        lod='medium',
+        figsize=(10, 5),
+        dpi=100,
+        iso_lookup=None,
+        date_index=None,
+        region_key='iso_a3',
+        raster_threshold=5000,
+    ):
+        """Renders every date of a time-sliced heat map without a GUI.
+
+        Args:
+            df (DataFrame): long-format dataset, one row per (place, date).
+            world (GeoDataFrame or str): world polygons, or the path of a boundary file, see HeatMap.
+            plot_column (str): column of df to colour the map by.
+            iso_column (str): column of df holding ISO2 or ISO3 country codes.
+            date_column (str): column of df holding the dates, formatted YYYY-MM-DD or as day offsets (see compact).
+            start_date (str, optional): first date to render. Defaults to the first date of df.
+            end_date (str, optional): last date to render. Defaults to the last date of df.
+            step (int, optional): render every step-th date.
+            lod (str, optional): level of detail of the world polygons, see HeatMap.
+            figsize ((float, float), optional): size of each frame in inches.
+            dpi (int, optional): resolution of each frame.
+            iso_lookup (IsoLookup, optional): ISO2 to ISO3 lookup, see HeatMap.
+            date_index (DateIndex, optional): an existing DateIndex of df to reuse, see HeatMap.
+            region_key (str, optional): column of world that iso_column is joined on, see HeatMap.
+            raster_threshold (int, optional): number of regions above which frames are drawn as an image,
+                see HeatMap.
+        """
+        first_date = start_date or df[date_column].dropna().min()
+        # HeatMap does the preparation (ISO3 codes, world level of detail, cube, colour scale); its figure is unused
+        heat_map = HeatMap(
+            df,
+            world,
+            plot_column,
+            first_date,
+            iso_column,
+            date_column,
+            1,
+            iso_lookup,
+            lod=lod,
+            engine='cube',
+            date_index=date_index,
+            region_key=region_key,
+            raster_threshold=raster_threshold,
+        )
+        heat_map._choropleth_setup()
+        plt.close(heat_map.fig)
+
+        self.heat_map = heat_map
+        self.plot_column = plot_column
+        self.world = heat_map.world
+        self.cube = heat_map.cube
+        self.norm = heat_map.choropleth.collection.norm
+        self.figsize = figsize
+        self.dpi = dpi
+        self.region_key = region_key
+        self.raster_threshold = raster_threshold
+        # the cube is keyed by day offset
+        end_day = None if end_date is None else to_day(end_date)
+        rows = range(len(self.cube.dates))[self.cube.date_slice(heat_map.start_day, end_day)]
+        self.rows = list(rows[::step])
+
+    @property
+    def style(self):
+        """Arguments of _make_renderer after the cube and the world."""
+        norm = self.norm
+        return (norm.vmin, norm.vmax, self.plot_column, self.figsize, self.dpi, self.region_key, self.raster_threshold)
+
+    def _tasks(self, out_dir):
+        labels = format_days([self.cube.dates[row] for row in self.rows])
+        return [
+            (row, str(label), os.path.join(out_dir, "frame_%05d.png" % number))
+            for number, (row, label) in enumerate(zip(self.rows, labels))
+        ]
+
+    def render_frames(self, out_dir, workers=None):
+        """Renders the frames to out_dir/frame_00000.png, frame_00001.png, ... on the Agg backend,
+        spread over a pool of processes.
+
+        Args:
+            out_dir (str): directory for the PNG files, created if needed.
+            workers (int, optional): number of processes. Defaults to the number of CPUs; 1 renders in this process.
+
+        Returns:
+            list[str]: paths of the PNG files, in date order.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        workers = workers or os.cpu_count() or 1
+        tasks = self._tasks(out_dir)
+        with tempfile.TemporaryDirectory() as tmp:
+            cube_path = os.path.join(tmp, "cube.npy")
+            np.save(cube_path, self.cube.arrays[self.plot_column])
+            initargs = (cube_path, self.world) + self.style
+            if workers == 1:
+                _init_worker(*initargs)
+                paths = [_render_frame(task) for task in tasks]
+                _worker.clear()
+                return paths
+            chunksize = max(1, len(tasks) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+                return list(pool.map(_render_frame, tasks, chunksize=chunksize))
+
+    @staticmethod
+    def assemble(frames, output, fps=5):
+        """Joins rendered frames into an animation. GIFs are written with Pillow, MP4s with ffmpeg.
+
+        Args:
+            frames (list[str]): paths of the PNG files, in order, as written by render_frames.
+            output (str): path of the animation, ending in .gif or .mp4.
+            fps (int, optional): frames per second.
+
+        Returns:
+            str: the path of the animation.
+        """
+        if not frames:
+            raise ValueError("no frames to assemble")
+        extension = os.path.splitext(output)[1].lower()
+        if extension == '.gif':
+            from PIL import Image
+
+            images = [Image.open(frame) for frame in frames]
+            images[0].save(output, save_all=True, append_images=images[1:], duration=int(1000 / fps), loop=0)
+            return output
+        if extension == '.mp4':
+            ffmpeg = shutil.which('ffmpeg')
+            if ffmpeg is None:
+                raise RuntimeError("ffmpeg was not found on PATH, it is needed to write .mp4 files")
+            pattern = os.path.join(os.path.dirname(frames[0]), "frame_%05d.png")
+            subprocess.run(
+                [ffmpeg, '-y', '-loglevel', 'error', '-framerate', str(fps), '-i', pattern]
+                + ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', output],
+                check=True,
+            )
+            return output
+        raise ValueError(f"unsupported animation format {extension!r}, use .gif or .mp4")
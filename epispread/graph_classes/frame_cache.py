@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+
+class FrameCache:
+    def __init__(self, compute, max_frames=64, max_bytes=64 * 1024 * 1024, workers=2):
+        """Bounded LRU cache of prepared frames, with a thread pool that computes frames ahead of time.
+
+        Args:
+            compute (callable): function turning a key (e.g. a slider position) into a frame,
+                a (values ndarray, label) tuple.
+            max_frames (int, optional): maximum number of cached frames.
+            max_bytes (int, optional): maximum total size of the cached value arrays.
+            workers (int, optional): number of prefetch threads, 0 disables prefetching.
+        """
+        self.compute = compute
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+        self.nbytes = 0
+        self._frames = OrderedDict()
+        self._pending = {}
+        # bumped by clear, so frames computed from data that has since changed are not stored
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='frame-prefetch') if workers else None
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, key):
+        return key in self._frames
+
+    def _store(self, key, frame, generation):
+        with self._lock:
+            if generation != self._generation or key in self._frames:
+                return
+            self._frames[key] = frame
+            self.nbytes += frame[0].nbytes
+            while len(self._frames) > self.max_frames or (self.nbytes > self.max_bytes and len(self._frames) > 1):
+                _, (values, _) = self._frames.popitem(last=False)
+                self.nbytes -= values.nbytes
+
+    def get(self, key):
+        """Returns the frame for a key. A cached frame costs a dictionary lookup, a frame that is being
+        prefetched is waited for, anything else is computed on the calling thread.
+
+        Args:
+            key: the frame key.
+
+        Returns:
+            (ndarray, str): the frame's values and label.
+        """
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return frame
+            future = self._pending.get(key)
+            generation = self._generation
+            self.misses += 1
+        try:
+            # clear or close on another thread may cancel the future at any point
+            frame = future.result() if future is not None else self.compute(key)
+        except CancelledError:
+            frame = self.compute(key)
+        self._store(key, frame, generation)
+        return frame
+
+    def _prefetch_one(self, key, generation):
+        try:
+            frame = self.compute(key)
+            self._store(key, frame, generation)
+            with self._lock:
+                self.prefetched += 1
+            return frame
+        finally:
+            with self._lock:
+                if generation == self._generation:
+                    self._pending.pop(key, None)
+
+    def prefetch(self, keys):
+        """Starts computing the frames of keys that are neither cached nor already being computed.
+
+        Args:
+            keys (iterable): frame keys, most urgent first.
+        """
+        if self._pool is None:
+            return
+        with self._lock:
+            for key in keys:
+                if key not in self._frames and key not in self._pending:
+                    self._pending[key] = self._pool.submit(self._prefetch_one, key, self._generation)
+
+    def stats(self):
+        """Counters describing how well the cache is doing.
+
+        Returns:
+            dict: hits, misses, prefetched frames, cached frames and cached bytes.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'prefetched': self.prefetched,
+                'frames': len(self._frames),
+                'nbytes': self.nbytes,
+            }
+
+    def clear(self):
+        """Drops every cached frame, e.g. after the data behind the frames changed. Queued prefetches are
+        cancelled, and frames already being prefetched from the old data are not waited for but never stored."""
+        with self._lock:
+            self._generation += 1
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            self._frames.clear()
+            self.nbytes = 0
+
+    def close(self):
+        """Stops the prefetch threads; frames still queued are dropped, frames being computed are finished."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
@@ -1,28 +1,165 @@
+import numpy as np
 import pandas as pd
-import country_converter as coco
 import matplotlib.pyplot as plt
-import datetime
+from matplotlib.colors import Normalize
 from matplotlib.widgets import Slider
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
+try:
+    from graph_classes.date_index import DateIndex
+    from graph_classes.choropleth import build_choropleth
+    from graph_classes.frame_cache import FrameCache
+    from data_classes.iso_lookup import IsoLookup
+    from data_classes.world_cache import WorldCache
+    from data_classes.cube import DataCube
+    from data_classes.metrics import DerivedMetrics
+    from data_classes.rollup import Rollup, bucket_labels, bucket_starts
+    from data_classes.compact import format_days, to_day, to_days
+    from data_classes.instrumentation import Instrumentation
+except ImportError:
+    from .date_index import DateIndex
+    from .choropleth import build_choropleth
+    from .frame_cache import FrameCache
+    from ..data_classes.iso_lookup import IsoLookup
+    from ..data_classes.world_cache import WorldCache
+    from ..data_classes.cube import DataCube
+    from ..data_classes.metrics import DerivedMetrics
+    from ..data_classes.rollup import Rollup, bucket_labels, bucket_starts
+    from ..data_classes.compact import format_days, to_day, to_days
+    from ..data_classes.instrumentation import Instrumentation
+
 
 class HeatMap:
-    def __init__(self, df, world, plot_column, start_date, iso_column, date_column, ts_flag=0):
+    iso3_column = 'Country_code_iso3'
+    render_modes = ('collection', 'merge')
+    engines = ('frames', 'cube')
+    instrumentation = Instrumentation.shared()
+
+    def __init__(
+        self,
+        df,
+        world,
+        plot_column,
+        start_date,
+        iso_column,
+        date_column,
+        ts_flag=0,
+        iso_lookup=None,
+        render_mode='collection',
+        lod='auto',
+        engine='frames',
+        frame_cache_size=64,
+        prefetch=2,
+        date_index=None,
+        metrics=None,
+        region_key='iso_a3',
+        raster_threshold=5000,
+        level=None,
+        bucket='day',
+        rollup=None,
+    ):
+        """
+        Args:
+            df (DataFrame): long-format dataset, one row per (place, date).
+            world (GeoDataFrame or str): world polygons, keyed on region_key, or the path of a boundary file
+                (shapefile, GeoPackage, GeoJSON, ...) such as admin-1 or admin-2 regions. A file is read and
+                simplified once per level of detail and cached on disk, see WorldCache.
+            plot_column (str): column of df to colour the map by, or a derived metric of one such as
+                New_cases_avg7 or New_cases_per100k (see DerivedMetrics), computed once and added to self.df.
+            start_date (str): first date to plot, formatted YYYY-MM-DD, or a day offset (see to_days).
+            iso_column (str): column of df holding ISO2 or ISO3 country codes, or with another region_key the
+                region codes matching it.
+            date_column (str): column of df holding the dates, as text, datetimes or int day offsets (see compact).
+                Frames are looked up by day offset, converted once per distinct date.
+            ts_flag (int, optional): 1 to add a time slider. Defaults to 0.
+            iso_lookup (IsoLookup, optional): ISO2 to ISO3 lookup. Defaults to the shared, persisted one.
+            render_mode (str, optional): 'collection' draws the polygons once and only recolours them per date,
+                with one colour scale for all dates; 'merge' merges and re-plots the GeoDataFrame per date.
+            lod (str, optional): level of detail of the world polygons, one of WorldCache.levels. 'auto' picks it
+                from the size of the map axes, None draws world as given.
+            engine (str, optional): in collection mode, 'frames' cuts each date's rows out of df, 'cube' pivots
+                plot_column once into a (dates x world regions) DataCube and reads each frame as a row of it.
+            frame_cache_size (int, optional): in collection mode with a time slider, number of prepared frames
+                kept in an LRU FrameCache. 0 disables the cache.
+            prefetch (int, optional): number of slider steps on either side of the current one that are
+                prepared in the background. 0 disables prefetching.
+            date_index (DateIndex, optional): an existing DateIndex of df to reuse, e.g. one shared by several maps.
+            metrics (DerivedMetrics, optional): an existing DerivedMetrics of df by (ISO code, date) to reuse.
+            region_key (str, optional): column of world that iso_column is joined on. Any column other than iso_a3
+                is matched as is, without ISO2 to ISO3 conversion.
+            raster_threshold (int, optional): in collection mode, number of regions above which frames are
+                drawn as an image of region ids instead of as polygons, see RasterChoropleth. None never does.
+            level (str, optional): colour every region by the total (mean for rate columns) of its group in this
+                column of df, e.g. WHO_region, or by the 'global' total. Defaults to the region's own value.
+            bucket (str, optional): one of Rollup.buckets: 'day', or 'week' (ISO weeks) and 'month' to colour the
+                map of a date by the total (mean for rate columns) of its bucket.
+            rollup (Rollup, optional): an existing Rollup of df with plot_column, by iso_column or by the ISO3
+                codes, to read frames from, e.g. one shared by several plots. Built on first use when level or
+                bucket is given. Frames read from a rollup need the collection render_mode.
+        """
+        if render_mode not in self.render_modes:
+            raise ValueError(f"render_mode must be one of {self.render_modes}, not {render_mode!r}")
+        if engine not in self.engines:
+            raise ValueError(f"engine must be one of {self.engines}, not {engine!r}")
+        if bucket not in Rollup.buckets:
+            raise ValueError(f"bucket must be one of {Rollup.buckets}, not {bucket!r}")
+        if isinstance(world, str):
+            world = WorldCache.shared(source=world).load('high')
         self.df = df
         self.world = world
+        self.region_key = region_key
+        self.raster_threshold = raster_threshold
         self.plot_column = plot_column
         self.iso_column = iso_column
         self.date_column = date_column
         self.ts_flag = ts_flag
+        self.render_mode = render_mode
+        self.engine = engine
+        self.level = level
+        self.bucket = bucket
+        self.rollup = rollup
+        if self._rolls_up() and render_mode != 'collection':
+            raise ValueError("level, bucket and rollup need the 'collection' render_mode")
+        self.choropleth = None
+        self.cube = None
+        self.frame_cache = None
+        self.frame_cache_size = frame_cache_size
+        self.prefetch = prefetch
+        self.time_slider = None
+        self._animated = []
+        self._background = None
+        self._labels = {}
+        self._day_cache = None
+
+        self.start_day = to_day(start_date)
+        self.start_date = str(format_days([self.start_day])[0])
+
+        self.iso_lookup = iso_lookup if iso_lookup is not None else IsoLookup.shared()
+        self.merge_iso_column = self._attach_iso3()
+        self.metrics = metrics
+        if DerivedMetrics.parse(plot_column) and plot_column not in self.df.columns:
+            self.df = self._attach_metric(self.df)
 
-        self.start_date = start_date
-        self.start_datetime = datetime.datetime.strptime(self.start_date, '%Y-%m-%d')
+        self._date_index = date_index
+        if self.ts_flag:
+            self._get_date_index()
 
         self.fig, self.ax = plt.subplots()
         self.ax.set_aspect('equal')
         self.divider = make_axes_locatable(self.ax)
         self.cax = self.divider.append_axes("right", size="5%", pad=0.1)
 
+        if lod == 'auto':
+            extent = 360.0
+            if region_key != 'iso_a3':
+                # sub-national boundaries span a fraction of the globe, so they are simplified less
+                x0, _, x1, _ = world.total_bounds
+                extent = x1 - x0
+            lod = WorldCache.select_level(self.ax.get_window_extent().width, extent)
+        self.lod = lod
+        if self.lod is not None:
+            self.world = WorldCache.owner(world).variant(world, self.lod)
+
     def _slider_setup(self):
         """Sets up the slider on the graph.
 
@@ -42,10 +179,13 @@ class HeatMap:
         Returns:
             list: list of iso3 codes
         """
+        import country_converter as coco
+
         return coco.convert(names=iso2_codes, to='ISO3')
 
     def _add_iso3(self, df):
         """Takes in the given dataframe and adds a column of ISO3 codes based on the existing column of ISO2.
+        Each distinct ISO2 code is converted once through self.iso_lookup and the result is mapped onto the rows.
 
         Args:
             df (DataFrame): The DataFrame to add to.
@@ -53,23 +193,149 @@ class HeatMap:
         Returns:
             DataFrame: The inputted DataFrame with the added column.
         """
-        iso3_codes = self._iso2_to_iso3(df[self.iso_column])
-        df.loc[:, 'Country_code_iso3'] = iso3_codes
+        iso3_codes = self.iso_lookup.map(df[self.iso_column], self._iso2_to_iso3)
+        df.loc[:, self.iso3_column] = iso3_codes
         return df
 
+    def _attach_iso3(self):
+        """If the ISO column holds ISO2 codes, adds the ISO3 column to (a shallow copy of) self.df once,
+        so frames cut from it later already carry the codes the world GeoDataFrame is keyed on.
+
+        Returns:
+            str: name of the column to merge with the world's region_key column.
+        """
+        if self.region_key != 'iso_a3':
+            return self.iso_column
+        first_code = self.df[self.iso_column].dropna().iloc[0]
+        if len(first_code) != 2:
+            return self.iso_column
+        if self.iso3_column not in self.df.columns:
+            with self.instrumentation.stage('iso_conversion'):
+                self.df = self._add_iso3(self.df.copy(deep=False))
+        return self.iso3_column
+
+    def _population(self):
+        """Population per ISO3 code, from the world's pop_est column.
+
+        Returns:
+            Series: population indexed by region_key, or None if the world has no pop_est column.
+        """
+        if 'pop_est' not in self.world.columns:
+            return None
+        return self.world.drop_duplicates(self.region_key).set_index(self.region_key)['pop_est']
+
+    def _attach_metric(self, df):
+        """Adds plot_column, a derived metric, to a shallow copy of df. Metrics are computed per merge ISO code,
+        so per-capita rates use the population of the world polygon each row is drawn on.
+
+        Args:
+            df (DataFrame): self.df, without the plot_column.
+
+        Returns:
+            DataFrame: the copy with plot_column.
+        """
+        if self.metrics is None or self.metrics.df is not df:
+            self.metrics = DerivedMetrics(df, self.date_column, self.merge_iso_column, self._population())
+        if not self.metrics.provides(self.plot_column):
+            raise KeyError(f"{self.plot_column!r} is neither a column of the data nor a derived metric of one")
+        return self.metrics.attach(df, [self.plot_column])
+
+    def _days(self):
+        """Day offset of every row of self.df, converted once (and again only if self.df is replaced).
+        A date column that already holds day offsets is used as is.
+
+        Returns:
+            Series: int32 day offsets, in the row order of self.df.
+        """
+        if self._day_cache is None or self._day_cache[0] is not self.df:
+            self._day_cache = (self.df, to_days(self.df[self.date_column]))
+        return self._day_cache[1]
+
+    def _get_date_index(self):
+        """Returns the DateIndex of the DataFrame associated with the class instance, keyed by day offset,
+        building it if it does not exist yet or if self.df has been replaced since it was built.
+
+        Returns:
+            DateIndex: rows of self.df sorted by date, with per-date offsets.
+        """
+        index = self._date_index
+        by_day = index is not None and (not index.dates or isinstance(index.dates[0], (int, np.integer)))
+        if not by_day or index.df is not self.df:
+            self._date_index = DateIndex(self.df, self.date_column, self._days())
+        return self._date_index
+
+    @property
+    def date_index(self):
+        """The DateIndex of self.df, built on first use; can be handed to other maps of the same DataFrame."""
+        return self._get_date_index()
+
+    def extend(self, new_rows):
+        """Takes in rows of dates after the last one, e.g. RefreshReport.new_rows after a daily refresh.
+        Only the new rows get ISO3 codes, date index entries, cube rows, rollup aggregates and world alignments;
+        the colour scale is widened if needed and cached frames are dropped. A derived plot_column is recomputed
+        over all rows, since rolling metrics of the new dates depend on the earlier ones.
+
+        Args:
+            new_rows (DataFrame): rows with the columns of the original df, all of dates after its last date.
+
+        Returns:
+            DataFrame: the extended self.df.
+        """
+        if not len(new_rows):
+            return self.df
+        days = pd.concat([self._days(), to_days(new_rows[self.date_column])], ignore_index=True)
+        new_days = days.iloc[len(self.df) :]
+        if self.merge_iso_column == self.iso3_column and self.iso3_column not in new_rows.columns:
+            new_rows = self._add_iso3(new_rows.copy())
+        derived = self.metrics is not None and self.plot_column not in new_rows.columns
+        new_rows = new_rows.reindex(columns=self.df.columns)
+        df = pd.concat([self.df, new_rows], ignore_index=True)
+        if derived:
+            df = self._attach_metric(df.drop(columns=self.plot_column))
+            new_rows = df.iloc[len(self.df) :]
+        if self._date_index is not None and self._date_index.df is self.df:
+            self._date_index.extend(df, new_days)
+        self.df = df
+        self._day_cache = (df, days)
+        if self.rollup is not None:
+            self.rollup.extend(new_rows, new_days)
+        if self.choropleth is not None and self._rolls_up():
+            self.cube = self._rollup_cube()
+            self._widen_norm(self.cube.arrays[self.plot_column])
+        elif self.choropleth is not None:
+            new_values = pd.to_numeric(new_rows[self.plot_column], errors='coerce').to_numpy(dtype=float)
+            self._plot_values = np.concatenate([self._plot_values, new_values])
+            new_world_rows = self.choropleth.align(new_rows[self.merge_iso_column])
+            self._world_rows = np.concatenate([self._world_rows, new_world_rows])
+            self._widen_norm(new_values)
+            if self.cube is not None:
+                self.cube.extend(new_rows, self.date_column, self.merge_iso_column, new_days)
+        if self.frame_cache is not None:
+            self.frame_cache.clear()
+        return self.df
+
+    def _widen_norm(self, values):
+        """Widens the colour scale to the finite values given, if they fall outside of it."""
+        finite = values[np.isfinite(values)]
+        norm = self.choropleth.collection.norm
+        if len(finite) and norm.scaled():
+            norm.vmin, norm.vmax = min(norm.vmin, finite.min()), max(norm.vmax, finite.max())
+
     def _filter_single_date(self, date):
         """Filters the DataFrame associated with the class instance by the specified date.
+        Uses the date index, so only the rows of that date are touched.
 
         Args:
-            date (str): The date to filter on
+            date (str or int): The date to filter on, or its day offset
 
         Returns:
             DataFrame: The appropriately filtered DataFrame.
         """
-        return self.df.loc[self.df[self.date_column] == date].copy()
+        return self._get_date_index().frame(to_day(date)).copy()
 
     def _merge_manager(self, date):
-        """If necessary, converts the iso2 to iso3 in either DataFrame so they match.
+        """Cuts the frame for the given date. ISO2 codes were already converted to ISO3 once at construction
+        (see _attach_iso3), so the frame can be matched to the world's region_key column directly.
         On the basis of the matching iso3 column, merges the two DataFrames and plots the resulting combination.
 
         Args:
@@ -78,53 +344,270 @@ class HeatMap:
         Returns:
            (list of Line2D) : A list of lines representing the plotted data.
         """
-        if self.ts_flag:
+        merge_iso_column = self.merge_iso_column
+        if self._frames_by_date():
             mod_df = self._filter_single_date(date)
         else:
             mod_df = self.df.copy()
-        merge_iso_column = self.iso_column
-        if len(self.df[self.iso_column].iloc[0]) == 2:
-            mod_df = self._add_iso3(self._filter_single_date(date))
-            merge_iso_column = 'Country_code_iso3'
-
-        open('test.txt', 'w').write(str(mod_df))
-        merge = pd.merge(left=self.world, right=mod_df, left_on='iso_a3', right_on=merge_iso_column, how='left')
-        return merge.plot(
-            ax=self.ax,
-            column=self.plot_column,
-            legend=True,
-            cax=self.cax,
-            missing_kwds={
-                "color": "lightgrey",
-                "edgecolor": "red",
-                "hatch": "///",
-                "label": "Missing values",
-            },
-        )
+
+        with self.instrumentation.stage('merge'):
+            merge = pd.merge(
+                left=self.world, right=mod_df, left_on=self.region_key, right_on=merge_iso_column, how='left'
+            )
+        with self.instrumentation.stage('merge_plot'):
+            return merge.plot(
+                ax=self.ax,
+                column=self.plot_column,
+                legend=True,
+                cax=self.cax,
+                missing_kwds={
+                    "color": "lightgrey",
+                    "edgecolor": "red",
+                    "hatch": "///",
+                    "label": "Missing values",
+                },
+            )
+
+    def _frame_rows(self, date):
+        """Positions in self.df of the rows making up the frame for a date.
+
+        Args:
+            date (str or int): The required date, in format 'yy-mm-dd', or its day offset
+
+        Returns:
+            ndarray: positional row numbers.
+        """
+        if self._frames_by_date():
+            return self._get_date_index().rows(to_day(date))
+        return np.arange(len(self.df))
+
+    def _frames_by_date(self):
+        """Whether a frame is the rows of a single date (time slider, or long-format ISO2 data) rather than all rows.
+
+        Returns:
+            bool: True if frames are cut by date.
+        """
+        return bool(self.ts_flag) or self.merge_iso_column == self.iso3_column
+
+    def _choropleth_setup(self):
+        """Draws the world polygons once as a single collection with its colorbar, and aligns every row of self.df
+        to its polygon. The colour scale spans the minimum and maximum of plot_column over all dates (over the
+        buckets of the level when rolling up), so colours are comparable between frames.
+
+        Returns:
+            Choropleth: the persistent artist.
+        """
+        with self.instrumentation.stage('choropleth_setup'):
+            self._plot_values = pd.to_numeric(self.df[self.plot_column], errors='coerce').to_numpy(dtype=float)
+            if self._rolls_up():
+                self.cube = self._rollup_cube()
+                finite = self.cube.arrays[self.plot_column].ravel()
+            else:
+                finite = self._plot_values
+            finite = finite[np.isfinite(finite)]
+            norm = Normalize(vmin=finite.min(), vmax=finite.max()) if len(finite) else Normalize()
+            self.choropleth = build_choropleth(
+                self.ax, self.world, self.region_key, raster_threshold=self.raster_threshold, norm=norm
+            )
+            self.fig.colorbar(self.choropleth.collection, cax=self.cax)
+            self._world_rows = self.choropleth.align(self.df[self.merge_iso_column])
+            if self.cube is None and self.engine == 'cube' and self._frames_by_date():
+                world_keys = self.world[self.region_key]
+                self.cube = DataCube.build(
+                    self.df, self.date_column, self.merge_iso_column, [self.plot_column], world_keys, self._days()
+                )
+            return self.choropleth
+
+    def _rolls_up(self):
+        """Whether frames are read from a Rollup of the level and bucket rather than from the rows of a date."""
+        return self.level is not None or self.bucket != 'day' or self.rollup is not None
+
+    def _rollup_cube(self):
+        """The rollup's cube of plot_column at the level and bucket, laid out by the world rows, building the
+        rollup over self.df first if none was given.
+
+        Returns:
+            DataCube: dated by the first day of each bucket.
+        """
+        if self.rollup is None:
+            key = self.merge_iso_column
+            parents = [] if self.level in (None, key, Rollup.global_level) else [self.level]
+            self.rollup = Rollup(self.df, self.date_column, key, [self.plot_column], parents, row_days=self._days())
+        keys = self.world[self.region_key]
+        if self.rollup.key_column != self.merge_iso_column:
+            # e.g. a rollup of the file's ISO2 codes: look up the code of every world row
+            codes = self.df[[self.merge_iso_column, self.rollup.key_column]].drop_duplicates(self.merge_iso_column)
+            keys = keys.map(codes.set_index(self.merge_iso_column)[self.rollup.key_column])
+        return self.rollup.cube(self.level, self.bucket, [self.plot_column], keys=keys)
+
+    def _frame_values(self, date):
+        """Scatters the plot_column values of one date onto the world rows.
+
+        Args:
+            date (str or int): The required date, in format 'yy-mm-dd', or its day offset
+
+        Returns:
+            ndarray: one value per world row, NaN where the date has no value for that region.
+        """
+        if self.cube is not None:
+            return self.cube.frame(int(bucket_starts([to_day(date)], self.bucket)[0]), self.plot_column)
+        rows = self._frame_rows(date)
+        targets = self._world_rows[rows]
+        matched = targets >= 0
+        values = np.full(self.choropleth.n_regions, np.nan)
+        values[targets[matched]] = self._plot_values[rows[matched]]
+        return values
+
+    def _draw_frame(self, date):
+        """Recolours the persistent choropleth with the values of one date.
+
+        Args:
+            date (str): The required date, in format 'yy-mm-dd'
+
+        Returns:
+            PathCollection: the recoloured collection.
+        """
+        if self.choropleth is None:
+            self._choropleth_setup()
+        self.choropleth.set_values(self._frame_values(date))
+        return self.choropleth.collection
+
+    def _render(self, date):
+        """Draws the frame for a date with the configured render_mode.
+
+        Args:
+            date (str or int): The required date, in format 'yy-mm-dd', or its day offset
+        """
+        if self.render_mode == 'merge':
+            return self._merge_manager(date)
+        return self._draw_frame(date)
 
     def _update(self, time_offset):
         """ "This is a callback function that replots the graph whenever time_offset is updated,
-        a.k.a. whenever the slider on the map is moved. Takes in the time offset integer, converts
-        to a real datetime, adds to the starting date and converts back to string to push to other methods.
+        a.k.a. whenever the slider on the map is moved. Takes in the time offset integer and adds it to
+        the starting day offset; frames are looked up by day offset, without formatting or parsing dates.
+        Each call is timed as the 'update' stage and its latency recorded in the 'frame_latency' histogram.
 
         Args:
             time_offset (int): The associated number value of the slider, created in slider_setup.
         """
-        new_datetime = self.start_datetime + datetime.timedelta(days=time_offset)
-        self._merge_manager(new_datetime.strftime('%Y-%m-%d'))
-        self.fig.canvas.draw_idle()
-        self.fig.canvas.flush_events()
+        with self.instrumentation.stage('update', histogram='frame_latency'):
+            if self.frame_cache is not None:
+                hits = self.frame_cache.hits
+                values, label = self.frame_cache.get(time_offset)
+                self.instrumentation.count('frame_cache_hits' if self.frame_cache.hits > hits else 'frame_cache_misses')
+                self.choropleth.set_values(values)
+                self.time_slider.valtext.set_text(label)
+                self._prefetch_around(time_offset)
+            else:
+                self._render(self.start_day + int(time_offset))
+            if self._background is not None:
+                self._blit()
+            else:
+                self.fig.canvas.draw_idle()
+            self.fig.canvas.flush_events()
 
-    def plot(self):
-        """This function should be the only one getting called by the user.
-        Will plot the merged DataFrame that results from the init method, along with a slider to
-        show the progression of time."""
+    def _compute_frame(self, time_offset):
+        """Prepares the frame of a slider position for the FrameCache; safe to run off the GUI thread.
+
+        Args:
+            time_offset (int): The associated number value of the slider, created in slider_setup.
+
+        Returns:
+            (ndarray, str): one value per world row, and the date of the frame.
+        """
+        day = self.start_day + int(time_offset)
+        return self._frame_values(day), self._labels.get(day) or str(bucket_labels([day], self.bucket)[0])
+
+    def _prefetch_around(self, time_offset):
+        """Queues the frames of the slider positions next to time_offset, nearest first.
+
+        Args:
+            time_offset (int): The current value of the slider.
+        """
+        slider = self.time_slider
+        step = slider.valstep or 1
+        offsets = []
+        for distance in range(1, self.prefetch + 1):
+            for offset in (time_offset + distance * step, time_offset - distance * step):
+                if slider.valmin <= offset <= slider.valmax:
+                    offsets.append(offset)
+        self.frame_cache.prefetch(offsets)
+
+    def _frame_cache_setup(self):
+        """Creates the FrameCache behind the slider, formats the date labels of all slider positions at once
+        and starts prefetching around the initial position."""
+        slider = self.time_slider
+        days = self.start_day + np.arange(slider.valmin, slider.valmax + 1, slider.valstep or 1).astype(int)
+        self._labels = dict(zip(days.tolist(), bucket_labels(days, self.bucket).tolist()))
+        self.frame_cache = FrameCache(
+            self._compute_frame, max_frames=self.frame_cache_size, workers=2 if self.prefetch else 0
+        )
+        self.fig.canvas.mpl_connect('close_event', lambda event: self.frame_cache.close())
+        self._prefetch_around(self.time_slider.val)
+
+    def _enable_blitting(self):
+        """Marks the artists that change between frames (the choropleth and the slider's moving parts) as animated.
+        Full redraws then leave them out and keep the result as a background, and a slider step only
+        restores that background and redraws the animated artists on top of it.
+        """
+        if not self.fig.canvas.supports_blit:
+            return
+        self._animated = list(self.choropleth.artists)
+        if self.time_slider is not None:
+            self.time_slider.drawon = False
+            self._animated += [self.time_slider.poly, self.time_slider.valtext]
+            self._animated += [artist for artist in (getattr(self.time_slider, '_handle', None),) if artist]
+        for artist in self._animated:
+            artist.set_animated(True)
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        """draw_event callback: stores the freshly drawn background and draws the animated artists over it."""
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self._animated:
+            self.fig.draw_artist(artist)
+
+    def _blit(self):
+        """Redraws only the animated artists on top of the stored background."""
+        self.fig.canvas.restore_region(self._background)
+        for artist in self._animated:
+            self.fig.draw_artist(artist)
+        self.fig.canvas.blit(self.fig.bbox)
+
+    def _prepare(self):
+        """Sets up the slider (if ts_flag is set) and draws the first frame, without showing the figure."""
         if self.ts_flag:
-            time_slider = self._slider_setup()
+            self.time_slider = self._slider_setup()
 
             # callback
-            time_slider.on_changed(self._update)
+            self.time_slider.on_changed(self._update)
 
         # initial plot
-        self._merge_manager(self.start_date)
+        self._render(self.start_day)
+        if self.render_mode == 'collection':
+            if self.time_slider is not None and self.frame_cache_size:
+                self._frame_cache_setup()
+            self._enable_blitting()
+
+    def plot(self):
+        """This function should be the only one getting called by the user.
+        Will plot the merged DataFrame that results from the init method, along with a slider to
+        show the progression of time."""
+        self._prepare()
         plt.show()
+
+    def save(self, path, date=None):
+        """Renders the map of a single date and writes it to an image file, without a slider or a GUI.
+
+        Args:
+            path (str): file to write, its extension selects the format (e.g. .png, .svg).
+            date (str or int, optional): date to plot, formatted YYYY-MM-DD, or its day offset.
+                Defaults to start_date.
+
+        Returns:
+            str: the path written.
+        """
+        self._render(self.start_day if date is None else date)
+        self.fig.savefig(path)
+        return path
@@ -1,19 +1,219 @@
+import itertools
+
+import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
+from pandas.api import types
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+
+try:
+    from graph_classes.decimation import lttb_indices, minmax_indices
+    from data_classes.metrics import DerivedMetrics
+    from data_classes.rollup import Rollup
+    from data_classes.instrumentation import Instrumentation
+except ImportError:
+    from .decimation import lttb_indices, minmax_indices
+    from ..data_classes.metrics import DerivedMetrics
+    from ..data_classes.rollup import Rollup
+    from ..data_classes.instrumentation import Instrumentation
 
 
 class TimeSeries:
-    def __init__(self, df, date_col, line_col, indep_col):
+    decimations = ('minmax', 'lttb', None)
+    instrumentation = Instrumentation.shared()
+
+    def __init__(
+        self,
+        df,
+        date_col,
+        line_col,
+        indep_col,
+        series=None,
+        top_n=None,
+        decimation='minmax',
+        legend_max=10,
+        population=None,
+        metrics=None,
+        level=None,
+        bucket='day',
+        rollup=None,
+    ):
+        """
+        Args:
+            df (DataFrame): long-format dataset, one row per (line, date). It is not modified.
+            date_col (str): column of df holding the dates.
+            line_col (str): column of df whose values each get a line, e.g. the country.
+            indep_col (str): column of df to plot, or a derived metric of one such as New_cases_avg7
+                (see DerivedMetrics).
+            series (list, optional): only draw these values of line_col.
+            top_n (int, optional): only draw the top_n lines with the largest total of indep_col.
+            decimation (str, optional): how lines longer than the axes is wide are thinned before drawing:
+                'minmax' keeps the minimum and maximum per pixel, 'lttb' uses Largest-Triangle-Three-Buckets,
+                None draws every point.
+            legend_max (int, optional): a legend is only drawn for at most this many lines.
+            population (Series, optional): population per line_col value, for per100k metrics (see world_population).
+            metrics (DerivedMetrics, optional): an existing DerivedMetrics of df by (line_col, date_col) to reuse.
+            level (str, optional): draw one line per value of this column grouping the line_col values, e.g.
+                WHO_region, or a single 'global' line, summing (averaging for rate columns) the values of
+                every group. Defaults to one line per line_col value.
+            bucket (str, optional): one of Rollup.buckets: 'day', or 'week' (ISO weeks) and 'month' to draw
+                one point per bucket, the sum (mean for rate columns) of its days.
+            rollup (Rollup, optional): an existing Rollup of df by line_col with indep_col to read the lines
+                from, e.g. one shared by several plots. Built on first use when level or bucket is given.
+        """
+        if decimation not in self.decimations:
+            raise ValueError(f"decimation must be one of {self.decimations}, not {decimation!r}")
+        if bucket not in Rollup.buckets:
+            raise ValueError(f"bucket must be one of {Rollup.buckets}, not {bucket!r}")
         self.df = df
         self.date_col = date_col
         self.line_col = line_col
         self.indep_col = indep_col
+        self.series = series
+        self.top_n = top_n
+        self.decimation = decimation
+        self.legend_max = legend_max
+        self.population = population
+        self.metrics = metrics
+        self.level = level
+        self.bucket = bucket
+        self.rollup = rollup
+        self._wide = None
 
-    def plot(self):
-        """plot first converts the values in the "date_col" column of the dataframe to datetime,
-        and then calls pandas.pivot_table to plot each of the "line_col" columns by date and their "indep_col" variable.
+    @property
+    def wide(self):
+        """The (dates x lines) matrix of indep_col, summed per (date, line) and NaN where a line has no row
+        for a date. Pivoted once on first use and cached; self.df is left untouched. With a level or bucket,
+        it is read from the rollup instead (see _rolled_up)."""
+        if self._wide is None:
+            with self.instrumentation.stage('pivot'):
+                self._wide = self._rolled_up() if self._rolls_up() else self._pivot()
+        return self._wide
+
+    def _rolls_up(self):
+        """Whether the lines are read from a Rollup rather than pivoted from self.df."""
+        return self.level is not None or self.bucket != 'day' or self.rollup is not None
+
+    def _rolled_up(self):
+        """Reads the wide matrix of the level and bucket from the rollup, building the rollup of indep_col
+        over self.df first if none was given.
+
+        Returns:
+            DataFrame: indexed by the first day of each bucket, one column per value of the level.
+        """
+        if self.rollup is None:
+            parents = [] if self.level in (None, self.line_col, Rollup.global_level) else [self.level]
+            self.rollup = Rollup(self.df, self.date_col, self.line_col, {self.indep_col: self._values()}, parents)
+        return self.rollup.wide(self.indep_col, self.level, self.bucket)
+
+    def _pivot(self):
+        """Pivots self.df with one factorize per key column and a bincount, converting only the distinct dates.
+
+        Returns:
+            DataFrame: the wide matrix, indexed by sorted datetimes, one column per line_col value.
+        """
+        date_codes, dates = pd.factorize(self.df[self.date_col])
+        # text dates, datetimes or int day offsets (see compact)
+        dates = pd.to_datetime(dates, unit='D') if types.is_integer_dtype(dates.dtype) else pd.to_datetime(dates)
+        # distinct dates in chronological order, whatever their text format
+        order = np.argsort(dates, kind='stable')
+        rank = np.empty(len(order), dtype=np.intp)
+        rank[order] = np.arange(len(order))
+        line_codes, lines = pd.factorize(self.df[self.line_col], sort=True)
+        values = self._values()
+
+        present = (date_codes >= 0) & (line_codes >= 0) & ~np.isnan(values)
+        cells = rank[date_codes[present]] * len(lines) + line_codes[present]
+        size = len(dates) * len(lines)
+        sums = np.bincount(cells, weights=values[present], minlength=size)
+        counts = np.bincount(cells, minlength=size)
+        matrix = np.where(counts > 0, sums, np.nan).reshape(len(dates), len(lines))
+        return pd.DataFrame(matrix, index=pd.DatetimeIndex(dates[order], name=self.date_col), columns=lines)
+
+    def _values(self):
+        """Values of indep_col for every row of self.df, deriving them if indep_col is a metric name."""
+        if self.indep_col in self.df.columns:
+            return pd.to_numeric(self.df[self.indep_col], errors='coerce').to_numpy(dtype=float)
+        if self.metrics is None:
+            self.metrics = DerivedMetrics(self.df, self.date_col, self.line_col, self.population)
+        return self.metrics.values(self.indep_col)
+
+    def selected_columns(self):
+        """The lines to draw: the selected series if given, then the top_n by total if given, else all.
+
+        Returns:
+            list: values of line_col.
+        """
+        wide = self.wide
+        columns = list(wide.columns)
+        if self.series is not None:
+            wanted = set(self.series)
+            columns = [column for column in columns if column in wanted]
+        if self.top_n is not None:
+            totals = wide[columns].sum()
+            columns = list(totals.sort_values(ascending=False, kind='stable').index[: self.top_n])
+        return columns
+
+    def _decimate(self, x, values, width_px):
+        """Row indices to keep of every line for an axes width_px pixels wide.
+
+        Returns:
+            ndarray: shape (rows kept, lines).
+        """
+        if self.decimation == 'minmax':
+            return minmax_indices(values, int(width_px) // 2)
+        if self.decimation == 'lttb':
+            return lttb_indices(x, values, int(width_px))
+        return np.repeat(np.arange(len(x))[:, None], values.shape[1], axis=1)
+
+    def _draw(self):
+        """Draws one line per "line_col" value over time from the cached wide matrix (see wide),
+        all lines as a single LineCollection, thinned to the width of the axes.
+
+        Returns:
+            Axes: the axes the lines were drawn on.
         """
-        self.df[self.date_col] = pd.to_datetime(self.df[self.date_col])
-        pivot = self.df.pivot_table(index=self.date_col, columns=self.line_col, values=self.indep_col, aggfunc='sum')
-        pivot.plot()
+        with self.instrumentation.stage('time_series_draw'):
+            fig, ax = plt.subplots()
+            columns = self.selected_columns()
+            wide = self.wide[columns]
+            x = mdates.date2num(wide.index.to_pydatetime())
+            values = wide.to_numpy()
+            kept = self._decimate(x, values, ax.get_window_extent().width)
+
+            cycle = itertools.cycle(plt.rcParams['axes.prop_cycle'])
+            colors = [entry['color'] for entry in itertools.islice(cycle, len(columns))]
+            segments = np.stack([x[kept], np.take_along_axis(values, kept, axis=0)], axis=-1).transpose(1, 0, 2)
+            ax.add_collection(LineCollection(segments, colors=colors, linewidths=plt.rcParams['lines.linewidth']))
+            ax.autoscale_view()
+            # short date labels that do not overlap, as df.plot used to draw them
+            locator = mdates.AutoDateLocator()
+            ax.xaxis.set_major_locator(locator)
+            ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+            ax.set_xlabel(self.date_col)
+            ax.set_ylabel(self.indep_col)
+            if 0 < len(columns) <= self.legend_max:
+                handles = [Line2D([], [], color=color, label=str(column)) for color, column in zip(colors, columns)]
+                ax.legend(handles=handles, title=self.level or self.line_col)
+            return ax
+
+    def plot(self):
+        """plot draws one line per "line_col" value over time (see _draw) and shows the figure."""
+        self._draw()
         plt.show()
+
+    def save(self, path):
+        """Draws the time series and writes it to an image file, without a GUI.
+
+        Args:
+            path (str): file to write, its extension selects the format (e.g. .png, .svg).
+
+        Returns:
+            str: the path written.
+        """
+        ax = self._draw()
+        ax.figure.savefig(path)
+        plt.close(ax.figure)
+        return path
@@ -0,0 +1,531 @@
+import asyncio
+import http
+import io
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+try:
+    from batch import Dataset
+    from graph_classes.export import FrameExporter, _draw, _make_renderer
+    from data_classes.compact import format_days, to_day, to_days
+    from data_classes.instrumentation import Instrumentation
+    from data_classes.metrics import DerivedMetrics
+except ImportError:
+    from .batch import Dataset
+    from .graph_classes.export import FrameExporter, _draw, _make_renderer
+    from .data_classes.compact import format_days, to_day, to_days
+    from .data_classes.instrumentation import Instrumentation
+    from .data_classes.metrics import DerivedMetrics
+
+logger = logging.getLogger('epispread')
+
+# renderers of the process, by layer id: built on the first frame of a layer, reused for every later one
+_renderers = {}
+_layer_ids = itertools.count()
+
+
+def _render_png(task):
+    """Renders one cube row of a layer to PNG bytes, in a worker process or on the server's own thread.
+
+    Args:
+        task ((int, tuple, int, str)): the layer id, its renderer setup (see Layer), the cube row and its date.
+            The setup starts with the cube and the world, or with the paths of their .npy and pickle files.
+
+    Returns:
+        bytes: the PNG.
+    """
+    layer_id, setup, row, label = task
+    renderer = _renderers.get(layer_id)
+    if renderer is None:
+        values, world, *style = setup
+        if isinstance(values, str):
+            values, world = np.load(values, mmap_mode='r'), pd.read_pickle(world)
+        renderer = _renderers[layer_id] = _make_renderer(values, world, *style)
+    buffer = io.BytesIO()
+    _draw(renderer, row, label).savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        """An error answered to the client with an HTTP status and a JSON body.
+
+        Args:
+            status (int): the status code, e.g. 404.
+            message (str): what went wrong.
+        """
+        super().__init__(message)
+        self.status = status
+
+
+class ResponseCache:
+    def __init__(self, max_entries=512, max_bytes=128 * 1024 * 1024):
+        """Bounded LRU cache of encoded responses. It is only used from the event loop, so it needs no lock.
+
+        Args:
+            max_entries (int, optional): maximum number of cached responses.
+            max_bytes (int, optional): maximum total size of the cached bodies.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._responses = OrderedDict()
+
+    def __len__(self):
+        return len(self._responses)
+
+    def get(self, key):
+        """Returns the cached response of a key and marks it as recently used.
+
+        Args:
+            key: the response key.
+
+        Returns:
+            (str, bytes): content type and body, None if the key is not cached.
+        """
+        response = self._responses.get(key)
+        if response is None:
+            self.misses += 1
+            return None
+        self._responses.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def put(self, key, response):
+        """Caches a response, evicting the least recently used ones beyond the limits.
+
+        Args:
+            key: the response key.
+            response ((str, bytes)): content type and body.
+        """
+        if key in self._responses:
+            return
+        self._responses[key] = response
+        self.nbytes += len(response[1])
+        while len(self._responses) > self.max_entries or (self.nbytes > self.max_bytes and len(self._responses) > 1):
+            _, (_, body) = self._responses.popitem(last=False)
+            self.nbytes -= len(body)
+
+    def stats(self):
+        """Counters describing how well the cache is doing.
+
+        Returns:
+            dict: hits, misses, cached responses and cached bytes.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'responses': len(self._responses), 'nbytes': self.nbytes}
+
+    def clear(self):
+        """Drops every cached response."""
+        self._responses.clear()
+        self.nbytes = 0
+
+
+class Layer:
+    def __init__(self, layer_id, name, exporter, setup):
+        """One column of one dataset, prepared for serving: its (dates x world regions) cube, the world regions
+        the cube's columns stand for and what a renderer needs to draw it.
+
+        Args:
+            layer_id (int): id of the layer, unique in the process; worker processes key their renderers by it.
+            name (str): name of the dataset.
+            exporter (FrameExporter): the column's exporter, holding the cube, the world and the colour scale.
+            setup (tuple): the cube and the world (or the paths of their files), then FrameExporter.style.
+        """
+        self.id = layer_id
+        self.name = name
+        self.column = exporter.plot_column
+        self.cube = exporter.cube
+        self.regions = [str(region) for region in exporter.world[exporter.region_key]]
+        self.setup = setup
+        self.labels = [str(label) for label in format_days(self.cube.dates)]
+
+    def row(self, date=None):
+        """Cube row of a date.
+
+        Args:
+            date (str, optional): the date, formatted YYYY-MM-DD. Defaults to the last date.
+
+        Returns:
+            int: the row.
+        """
+        if not self.cube.dates:
+            raise HTTPError(404, f"{self.name} has no dates")
+        if date is None:
+            return len(self.cube.dates) - 1
+        try:
+            day = to_day(date)
+        except ValueError:
+            raise HTTPError(400, f"invalid date {date!r}, expected YYYY-MM-DD")
+        row = self.cube.date_position(day)
+        if row is None:
+            raise HTTPError(404, f"{self.name} has no data for {date}")
+        return row
+
+
+class FrameServer:
+    instrumentation = Instrumentation.shared()
+
+    def __init__(
+        self,
+        files,
+        host='127.0.0.1',
+        port=8050,
+        workers=None,
+        cache_entries=512,
+        cache_bytes=128 * 1024 * 1024,
+        lod='medium',
+        figsize=(10, 5),
+        dpi=100,
+        compact_df=False,
+        iso_lookup=None,
+    ):
+        """Long-running local HTTP server that loads datasets and the world geometry once and then serves map
+        frames of them to any number of clients (dashboards, notebooks, scripts). It answers:
+
+        - ``GET /datasets``: the loaded datasets with their numeric columns and date range, as JSON.
+        - ``GET /values?file=NAME&column=COLUMN&date=YYYY-MM-DD``: the column's value for every world region on
+          that date, as JSON, NaN as null.
+        - ``GET /frame.png?file=NAME&column=COLUMN&date=YYYY-MM-DD``: the rendered heat map of that date.
+        - ``GET /stats``: response cache and rendering counters, as JSON.
+
+        file is a dataset's path or its file name without extension, date defaults to the last date.
+        A column is prepared (ISO3 codes, world alignment, cube, colour scale) on its first request and kept.
+        Responses go to an LRU ResponseCache, and identical requests arriving while one is computed share it.
+        Frames are rendered by a pool of worker processes that each build a column's figure once.
+
+        Args:
+            files (list[str]): CSV files to serve, loaded by start.
+            host (str, optional): interface to listen on.
+            port (int, optional): port to listen on, 0 picks a free one.
+            workers (int, optional): number of rendering processes. Defaults to the number of CPUs;
+                0 renders on the server's loading thread instead.
+            cache_entries (int, optional): maximum number of cached responses.
+            cache_bytes (int, optional): maximum total size of the cached responses.
+            lod (str, optional): level of detail of the world polygons, see HeatMap.
+            figsize ((float, float), optional): size of the frames in inches.
+            dpi (int, optional): resolution of the frames.
+            compact_df (bool, optional): keep the datasets in their compact form, see Dataset.
+            iso_lookup (IsoLookup, optional): ISO2 to ISO3 lookup, see HeatMap.
+        """
+        self.files = list(files)
+        self.host = host
+        self.port = port
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.lod = lod
+        self.figsize = figsize
+        self.dpi = dpi
+        self.compact_df = compact_df
+        self.iso_lookup = iso_lookup
+        self.cache = ResponseCache(cache_entries, cache_bytes)
+        self.datasets = {}
+        self.layers = {}
+        self.rendered = 0
+        self._summaries = {}
+        self._pending = {}
+        self._preparing = {}
+        # loading, column preparation and in-process rendering share one thread, as pyplot is not thread-safe
+        self._loader = None
+        self._pool = None
+        self._tmp = None
+        self._server = None
+
+    def url(self, path='/'):
+        return f"http://{self.host}:{self.port}{path}"
+
+    def load(self, path):
+        """Reads and parses one file, blocking. start calls it for every file on the loading thread.
+
+        Args:
+            path (str): the CSV file.
+
+        Returns:
+            Dataset: the loaded dataset, also kept in self.datasets under the file name without extension.
+        """
+        dataset = Dataset(path, compact_df=self.compact_df)
+        name = os.path.splitext(os.path.basename(path))[0]
+        dates = None
+        if dataset.date_columns:
+            days = to_days(dataset.df[dataset.date_columns[0]]).dropna()
+            if len(days):
+                dates = [str(label) for label in format_days([days.min(), days.max()])]
+        self._summaries[name] = {
+            'path': path,
+            'rows': len(dataset.df),
+            'columns': dataset.number_columns,
+            'dates': dates,
+            'seconds': round(dataset.load_seconds, 3),
+        }
+        self.datasets[name] = dataset
+        return dataset
+
+    async def start(self):
+        """Loads every file, starts the rendering pool and starts listening.
+
+        Returns:
+            FrameServer: self, with port set to the port actually listened on.
+        """
+        loop = asyncio.get_running_loop()
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='frame-server')
+        self._tmp = tempfile.TemporaryDirectory(prefix='epispread-server-')
+        if self.workers:
+            # spawned, not forked: the server process runs threads, and the workers only need the layer files
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        for path in self.files:
+            await loop.run_in_executor(self._loader, self.load, path)
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        """Answers requests until cancelled, then closes the server."""
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Stops listening and shuts the loading thread and the rendering pool down."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for executor in (self._pool, self._loader):
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+        self._pool = self._loader = None
+        for layer in self.layers.values():
+            _renderers.pop(layer.id, None)
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
+
+    def _dataset_name(self, file):
+        if file in self.datasets:
+            return file
+        for name, summary in self._summaries.items():
+            if summary['path'] == file:
+                return name
+        raise HTTPError(404, f"unknown file {file!r}, the server has {sorted(self.datasets)}")
+
+    def _prepare_layer(self, name, column):
+        """Prepares one column for serving, blocking; runs on the loading thread."""
+        dataset = self.datasets[name]
+        if not (dataset.iso_columns and dataset.date_columns):
+            raise HTTPError(400, f"{name} has no ISO code and date columns to map")
+        # derived metrics such as New_cases_avg7 are computed by HeatMap
+        if column not in dataset.df.columns and not DerivedMetrics.parse(column):
+            raise HTTPError(404, f"{name} has no column {column!r}")
+        date_column = dataset.date_columns[0]
+        exporter = FrameExporter(
+            dataset.df,
+            dataset.world,
+            column,
+            dataset.iso_columns[0],
+            date_column,
+            lod=self.lod,
+            figsize=self.figsize,
+            dpi=self.dpi,
+            iso_lookup=self.iso_lookup,
+            date_index=dataset.date_indexes.get(date_column),
+        )
+        dataset.adopt(exporter.heat_map)
+        layer_id = next(_layer_ids)
+        style = exporter.style
+        values = exporter.cube.arrays[column]
+        if self._pool is None:
+            return Layer(layer_id, name, exporter, (values, exporter.world) + style)
+        # the workers memory-map the cube and read the world once per layer instead of receiving them per frame
+        stem = os.path.join(self._tmp.name, "layer-%d" % layer_id)
+        np.save(stem + ".npy", values)
+        exporter.world.to_pickle(stem + ".pkl")
+        return Layer(layer_id, name, exporter, (stem + ".npy", stem + ".pkl") + style)
+
+    async def layer(self, file, column):
+        """The prepared layer of a column, preparing it on the loading thread on first use.
+
+        Args:
+            file (str): the dataset's name or path.
+            column (str): the column, or a derived metric of one (see DerivedMetrics).
+
+        Returns:
+            Layer: the layer.
+        """
+        key = (self._dataset_name(file), column)
+        layer = self.layers.get(key)
+        if layer is not None:
+            return layer
+        future = self._preparing.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._preparing[key] = loop.run_in_executor(self._loader, self._prepare_layer, *key)
+        try:
+            layer = await future
+        finally:
+            self._preparing.pop(key, None)
+        self.layers[key] = layer
+        return layer
+
+    async def _cached(self, key, compute):
+        """Returns the cached response of key, or computes it once however many requests wait for it."""
+        response = self.cache.get(key)
+        if response is not None:
+            self.instrumentation.count('response_cache_hits')
+            return response
+        self.instrumentation.count('response_cache_misses')
+        future = self._pending.get(key)
+        if future is None:
+            future = self._pending[key] = asyncio.ensure_future(compute())
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        # a client hanging up must not cancel the work other clients are waiting for
+        response = await asyncio.shield(future)
+        self.cache.put(key, response)
+        return response
+
+    async def values(self, file, column, date=None):
+        """Values of a column on one date, aligned to the world regions.
+
+        Args:
+            file (str): the dataset's name or path.
+            column (str): the column.
+            date (str, optional): the date, formatted YYYY-MM-DD. Defaults to the last date.
+
+        Returns:
+            bytes: a JSON object with file, column, date, regions (ISO3 codes) and values (null where missing).
+        """
+        layer = await self.layer(file, column)
+        row = layer.row(date)
+
+        async def compute():
+            values = layer.cube.arrays[layer.column][row].astype(object)
+            values[pd.isna(values)] = None
+            body = {
+                'file': layer.name,
+                'column': layer.column,
+                'date': layer.labels[row],
+                'regions': layer.regions,
+                'values': values.tolist(),
+            }
+            return 'application/json', json.dumps(body).encode()
+
+        return (await self._cached(('values', layer.id, row), compute))[1]
+
+    async def frame(self, file, column, date=None):
+        """Rendered heat map of a column on one date.
+
+        Args:
+            file (str): the dataset's name or path.
+            column (str): the column.
+            date (str, optional): the date, formatted YYYY-MM-DD. Defaults to the last date.
+
+        Returns:
+            bytes: the PNG.
+        """
+        layer = await self.layer(file, column)
+        row = layer.row(date)
+
+        async def compute():
+            loop = asyncio.get_running_loop()
+            with self.instrumentation.stage('serve_render', histogram='render_latency'):
+                task = (layer.id, layer.setup, row, layer.labels[row])
+                png = await loop.run_in_executor(self._pool or self._loader, _render_png, task)
+            self.rendered += 1
+            return 'image/png', png
+
+        return (await self._cached(('frame', layer.id, row), compute))[1]
+
+    def stats(self):
+        """Counters of the server.
+
+        Returns:
+            dict: the response cache's stats, the number of rendered frames and the prepared layers.
+        """
+        return {
+            'cache': self.cache.stats(),
+            'rendered': self.rendered,
+            'layers': [f"{name}/{column}" for name, column in self.layers],
+        }
+
+    async def _dispatch(self, method, target):
+        """Answers one request.
+
+        Returns:
+            (int, str, bytes): status, content type and body.
+        """
+        if method not in ('GET', 'HEAD'):
+            raise HTTPError(405, f"method {method} is not allowed, use GET")
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if url.path in ('/', '/datasets'):
+            return 200, 'application/json', json.dumps(self._summaries).encode()
+        if url.path == '/stats':
+            return 200, 'application/json', json.dumps(self.stats()).encode()
+        if url.path in ('/values', '/frame', '/frame.png'):
+            missing = [name for name in ('file', 'column') if not query.get(name)]
+            if missing:
+                raise HTTPError(400, f"missing query parameter {', '.join(missing)}")
+            if url.path == '/values':
+                return 200, 'application/json', await self.values(query['file'], query['column'], query.get('date'))
+            return 200, 'image/png', await self.frame(query['file'], query['column'], query.get('date'))
+        raise HTTPError(404, f"no such path {url.path}")
+
+    async def _handle(self, reader, writer):
+        """Serves the requests of one connection, keeping it open between requests unless the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    header, _, value = line.decode('latin-1').partition(':')
+                    headers[header.strip().lower()] = value.strip()
+                parts = request_line.decode('latin-1').split()
+                method, target, version = parts if len(parts) == 3 else ('', '/', 'HTTP/1.0')
+                start = time.perf_counter()
+                try:
+                    if not method:
+                        raise HTTPError(400, "malformed request line")
+                    status, content_type, body = await self._dispatch(method, target)
+                except HTTPError as error:
+                    status, content_type = error.status, 'application/json'
+                    body = json.dumps({'error': str(error)}).encode()
+                except Exception as error:
+                    logger.exception("frame server: %s %s failed", method, target)
+                    status, content_type = 500, 'application/json'
+                    body = json.dumps({'error': f"{type(error).__name__}: {error}"}).encode()
+                self.instrumentation.observe('response_latency', time.perf_counter() - start)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                keep_alive = keep_alive and status != 405 and 'content-length' not in headers
+                head = (
+                    f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    "Access-Control-Allow-Origin: *\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                )
+                writer.write(head.encode('latin-1') + (body if method != 'HEAD' else b''))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
@@ -1,21 +1,36 @@
-import pandas as pd
-import numpy
-import geopandas as gpd
-import requests
 import os
 
+import pandas as pd
+
 try:
-    from graph_classes.heat_map import HeatMap
-    from graph_classes.time_series import TimeSeries  # this should work when running table.py directly
+    from data_classes.downloader import Downloader
+    from data_classes.incremental import IncrementalCache
+    from data_classes.world_cache import WorldCache
+    from data_classes.schema import SchemaInference
+    from data_classes.line_listing import LineListingAggregator
+    from data_classes.metrics import DerivedMetrics, world_population
+    from data_classes.instrumentation import Instrumentation
 except:
     # this should work when running main.py (it's a relative import)
-    from .graph_classes.heat_map import HeatMap
-    from .graph_classes.time_series import TimeSeries
+    from .data_classes.downloader import Downloader
+    from .data_classes.incremental import IncrementalCache
+    from .data_classes.world_cache import WorldCache
+    from .data_classes.schema import SchemaInference
+    from .data_classes.line_listing import LineListingAggregator
+    from .data_classes.metrics import DerivedMetrics, world_population
+    from .data_classes.instrumentation import Instrumentation
 
 # compatible with all data at https://covid19.who.int/data
 
 
 class EpiSpread:
+    data_dir = "data_files"
+    download_report = None
+    cache_dir = os.path.join(data_dir, ".cache")
+    columnar_cache = IncrementalCache(cache_dir)
+    world_cache = WorldCache.shared(cache_dir)
+    schema_inference = SchemaInference(cache_dir)
+    instrumentation = Instrumentation.shared()
     urls = [
         'https://covid19.who.int/WHO-COVID-19-global-data.csv',
         'https://covid19.who.int/WHO-COVID-19-global-table-data.csv',
@@ -27,51 +42,96 @@ class EpiSpread:
     def _get_files(cls, urls, file_path=""):
         """This function grabs 4 specified URLs from https://covid19.who.int/data \
             and stores them as CSV files in data_files/[file_name]
-        Returns 1 if failure, 0 if success
+        The URLs are fetched concurrently and streamed to disk. Files whose ETag/Last-Modified
+        validators show they are unchanged on the server are not downloaded again.
+        The full DownloadReport of the last call is kept in EpiSpread.download_report.
 
         Args:
             urls (list[str]): list of all website links to the files we want to download.
+            file_path (str, optional): path to store the download of a single URL in instead of data_files/.
 
         Returns:
-            list[str]: list of file names that get handed to the query. 
+            list[str]: list of file names that get handed to the query.
         """
+        if file_path and len(urls) != 1:
+            raise ValueError(f"file_path takes the download of a single URL, not of {len(urls)}")
+        with Downloader(dest_dir=cls.data_dir) as downloader, cls.instrumentation.stage('get_files'):
+            if not file_path:
+                cls.download_report = downloader.fetch(urls)
+                return cls.download_report.file_names
 
-        file_names = []
-
-        for url in urls:
-            r = requests.get(url, allow_redirects=True)
-            if r.status_code == 200:
-                if not file_path:
-                    file_name = url.split('/')[-1].replace(".csv", "")
-                    file_names.append(file_name)
-                    if not os.path.exists("data_files"):
-                        os.makedirs("data_files")
-                    open('data_files/' + file_name + '.csv', 'wb').write(r.content)
-                else:
-                    open(file_path, 'wb').write(r.content)
-
-        return file_names
+            cls.download_report = downloader.fetch(urls, [file_path])
+            return []
 
     @classmethod
-    def _read_data(cls, file_name):
+    def _read_data(cls, file_name, columns=None):
         """read_data takes in a csv file name containing a dataset and reads it into a pandas DataFrame.
         Also reads the inbuilt "world" file in the gpd library into a GeoDataFrame.
+        The CSV goes through EpiSpread.columnar_cache, so only the first load of each file version parses it,
+        and the world comes from EpiSpread.world_cache, so the shapefile is only parsed once.
 
         Args:
             file_name (str): name of file containing dataset
+            columns (list[str], optional): only load these columns of the dataset. Defaults to all columns.
 
         Returns:
             (DataFrame, GeoDataFrame): Tuple of the pandas DataFrame of the data you entered, and the world GeoDataFrame
         """
-        df = pd.read_csv(file_name, delimiter=",")
-        world = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
-        world = world[world.name != "Antarctica"]
+        with cls.instrumentation.stage('read_data'):
+            df = cls.columnar_cache.load(file_name, columns)
+        with cls.instrumentation.stage('load_world'):
+            world = cls.world_cache.load()
         return df, world
 
+    @classmethod
+    def _refresh_data(cls, file_name, date_column=None):
+        """Takes in a new download of a dataset that grows by dates, like the WHO global data, appending only its new
+        dates to the cached dataset. If rows of already cached dates changed, the cache is rebuilt instead.
+        The returned report's new_rows can be handed to HeatMap.extend to update a map without rebuilding it.
+
+        Args:
+            file_name (str): name of file containing dataset
+            date_column (str, optional): column the dataset grows by. Defaults to the first date column.
+
+        Returns:
+            RefreshReport: whether the cache was appended to, rebuilt or unchanged, and the new rows.
+        """
+        if date_column is None:
+            header = pd.read_csv(file_name, nrows=100)
+            date_column = cls._parse_columns(header)[1][0]
+        return cls.columnar_cache.refresh(file_name, date_column)
+
+    @classmethod
+    def _read_line_listing(
+        cls, file_name, date_column, region_column, sum_columns=(), chunk_size=1_000_000, progress=None
+    ):
+        """Reads a line listing (one row per case) that may be larger than memory, aggregated to one row per
+        (date, region) in a streaming pass, together with the world GeoDataFrame.
+        The result has the date and region columns, a Cases column and the sums, so it can be handed to HeatMap
+        (with region_column as iso column) and TimeSeries like any WHO file.
+
+        Args:
+            file_name (str): name of file containing the line listing
+            date_column (str): column holding the date of each case
+            region_column (str): column holding the region (country code) of each case
+            sum_columns (list[str], optional): numeric columns to sum per date and region as well
+            chunk_size (int, optional): number of rows read at a time
+            progress (callable, optional): called after every chunk with (rows read, seconds elapsed)
+
+        Returns:
+            (DataFrame, GeoDataFrame): Tuple of the aggregated DataFrame, and the world GeoDataFrame
+        """
+        aggregator = LineListingAggregator(
+            date_column, region_column, sum_columns, chunk_size=chunk_size, progress=progress
+        )
+        df = aggregator.aggregate(file_name)
+        return df, cls.world_cache.load()
+
     @classmethod
     def _find_time_series(cls, df, str_column, date_columns):
         """This function takes in a certain column of the dataframe and checks if it is eligible for a time series based on any of the date columns.
-        If so, it returns the first valid data column. If not, returns None
+        If so, it returns the first valid data column. If not, returns None.
+        A column is eligible if none of its (value, date) pairs occurs twice and some value has more than one date.
 
         Args:
             df (DataFrame): pandas DataFrame we're parsing
@@ -81,41 +141,34 @@ class EpiSpread:
         Returns:
             str: returns the name of the valid DataFrame column.
         """
-        first_country = df[str_column].iloc[0]
-        single_country = df.loc[df[str_column] == first_country]
-        for date_column in date_columns:
-            dates_of_country = list(single_country[date_column])
-            if len(set(dates_of_country)) == len(dates_of_country) and len(dates_of_country) > 1:
-                return date_column
-        return None
+        return cls.schema_inference.time_series_date(df, str_column, date_columns)
 
     @classmethod
-    def _parse_columns(cls, df):
+    def _parse_columns(cls, df, file_name=None):
         """This function parses the columns of a given DataFrame and seperates them into those with number values, those with dates, and those that are string entries
+        Types come from the column dtypes (and a bounded sample of object columns), not from the first row.
+        If the file the DataFrame was loaded from is given, the result is cached by file content and header,
+        so parsing the same file again is a lookup.
 
         Args:
             df (DataFrame): pandas DataFrame to be parsed
+            file_name (str, optional): file df was loaded from.
 
         Returns:
             list[str]: Names of columns with number values
             list[str]: Names of columns with date values
             list[str]: Names of columns with string values
+            list[list[str]]: [key column, date column] pairs that form a time series
         """
-        time_series_columns = []
-        number_columns = [
-            df.columns[i]
-            for i in range(0, len(df.columns))
-            if isinstance(df.iloc[0, i], numpy.int64) or isinstance(df.iloc[0, i], numpy.float64)
-        ]
-        date_columns = [column for column in df.columns if "date" in column.lower()]
-        iso_columns = [column for column in df.columns if "iso" in column.lower() or "code" in column.lower()]
-        str_columns = list(set(df.columns).difference(number_columns + date_columns + iso_columns))
-        for str_column in str_columns:
-            time_series_column = cls._find_time_series(df, str_column, date_columns)
-            if time_series_column:
-                time_series_columns.append([str_column, time_series_column])
-
-        return number_columns, date_columns, iso_columns, time_series_columns
+        with cls.instrumentation.stage('parse_columns'):
+            content_hash = cls.columnar_cache.content_key(file_name) if file_name else None
+            schema = cls.schema_inference.schema(df, content_hash)
+        return (
+            list(schema['number_columns']),
+            list(schema['date_columns']),
+            list(schema['iso_columns']),
+            [list(pair) for pair in schema['time_series_columns']],
+        )
 
     @classmethod
     def _find_available_graphs(cls, number_columns, iso_columns, time_series_columns):
@@ -149,6 +202,14 @@ class EpiSpread:
             HeatMap: returns instance of HeatMap class if a HeatMap was plotted
             TimeSeries: returns instance of TimeSeries class if a TimeSeries was plotted.
         """
+        # the graph classes pull in matplotlib, which the refresh and ingest paths never need
+        try:
+            from graph_classes.heat_map import HeatMap
+            from graph_classes.time_series import TimeSeries  # this should work when running table.py directly
+        except ImportError:
+            from .graph_classes.heat_map import HeatMap
+            from .graph_classes.time_series import TimeSeries
+
         file_names = cls._get_files(cls.urls)
         if not file_names:
             print("File retrieval failed.")
@@ -158,11 +219,12 @@ class EpiSpread:
         file_name = "data_files/" + input("Which file do you want to analyze? ") + ".csv"
         df, world = cls._read_data(file_name)
 
-        number_columns, date_columns, iso_columns, time_series_columns = cls._parse_columns(df)
+        number_columns, date_columns, iso_columns, time_series_columns = cls._parse_columns(df, file_name)
 
         print(cls._find_available_graphs(number_columns, iso_columns, time_series_columns))
         graph_type = input("What type of data visualization do you want to create?")
         print(number_columns)
+        print("or a derived metric, e.g.", DerivedMetrics.names(number_columns[:1]))
         indep_var = input("Which variable do you want to plot in your " + graph_type + "?")
         if graph_type == "heat map w/ time slider" or graph_type == "heat map":
             if graph_type == "heat map w/ time slider":
@@ -180,7 +242,10 @@ class EpiSpread:
             print(time_series_columns)
             my_time_series = input("Which time series would you like to plot?")
             time_series_list = my_time_series.strip("]").strip("[").replace("'", "").replace(",", "").split(" ")
-            graph_inst = TimeSeries(df, time_series_list[1], time_series_list[0], indep_var)
+            population = None
+            if iso_columns and indep_var.endswith("_per100k"):
+                population = world_population(world, df, time_series_list[0], iso_columns[0])
+            graph_inst = TimeSeries(df, time_series_list[1], time_series_list[0], indep_var, population=population)
 
         graph_inst.plot()
         return graph_inst
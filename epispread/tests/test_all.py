@@ -5,14 +5,60 @@ from unittest.mock import MagicMock, patch
 from epispread import EpiSpread
 from epispread.graph_classes.heat_map import HeatMap
 from epispread.graph_classes.time_series import TimeSeries
+from epispread.graph_classes.date_index import DateIndex
+from epispread.graph_classes.frame_cache import FrameCache
+from epispread.graph_classes.export import FrameExporter
+from epispread.graph_classes.choropleth import RasterChoropleth
+from epispread.graph_classes.decimation import lttb_indices, minmax_indices
+from epispread.data_classes.downloader import Downloader
+from epispread.data_classes.columnar_cache import ColumnarCache
+from epispread.data_classes.iso_lookup import IsoLookup
+from epispread.data_classes.world_cache import WorldCache
+from epispread.data_classes.cube import DataCube
+from epispread.data_classes.schema import SchemaInference
+from epispread.data_classes.line_listing import LineListingAggregator
+from epispread.data_classes.incremental import IncrementalCache, partition_checksums
+from epispread.data_classes.metrics import DerivedMetrics
+from epispread.data_classes.instrumentation import Instrumentation
+from epispread.data_classes.regions import RegionLocator
+from epispread.data_classes.rollup import Rollup, bucket_labels, bucket_starts
+from epispread.data_classes.compact import compact, format_days, memory_report, to_day, to_days
+from epispread.batch import BatchRunner
+from epispread.server import FrameServer, ResponseCache
 from matplotlib.widgets import Slider
+import numpy as np
+import shapely
 import pandas as pd
 from pandas import DataFrame
 from geopandas import GeoDataFrame
+import asyncio
+import http.client
+import json
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 mock_df_index = MagicMock(spec=list)
 
+
+def stub_lookup():
+    """IsoLookup with the ISO3 codes of the countries in test-db.csv, so no test resolves them online."""
+    lookup = IsoLookup()
+    lookup.table = {'AF': 'AFG', 'AL': 'ALB', 'DZ': 'DZA'}
+    return lookup
+
+
+def load_test_db():
+    """test-db.csv and the world, as EpiSpread._read_data loads them."""
+    return EpiSpread._read_data("epispread/tests/test-db.csv")
+
+
 print(os.getcwd())
 
 
@@ -35,6 +81,10 @@ class EpiSpreadTests(unittest.TestCase):
             # Assert the content of the downloaded file
             self.assertEqual(downloaded_content, mock_response)
 
+    def test_get_files_into_one_path_takes_one_url(self):
+        with self.assertRaises(ValueError):
+            EpiSpread._get_files(EpiSpread.urls, 'epispread/tests/data_files/file.csv')
+
     def test_read_data(self):
         df, world = EpiSpread._read_data("epispread/tests/test-db.csv")
         self.assertIsInstance(df, DataFrame)
@@ -45,16 +95,13 @@ class EpiSpreadTests(unittest.TestCase):
         result = EpiSpread._find_time_series(test_df, "Country", ["Date_reported"])
         self.assertEqual(result, "Date_reported")
 
-    @patch('epispread.skeleton.EpiSpread._find_time_series')
-    def test_parse_columns(self, mock_function):
-        mock_function.return_value = "Time_series"
-
+    def test_parse_columns(self):
         test_df = pd.read_csv("epispread/tests/test-db.csv")
         number_columns, date_columns, iso_columns, time_series_columns = EpiSpread._parse_columns(test_df)
         self.assertEqual(number_columns[0], "New_cases")
         self.assertEqual(date_columns[0], "Date_reported")
         self.assertEqual(iso_columns[0], "Country_code")
-        self.assertEqual(time_series_columns[0][1], "Time_series")
+        self.assertEqual(time_series_columns[0], ["Country", "Date_reported"])
 
     def test_find_available_graphs(self):
         result = EpiSpread._find_available_graphs(1, 1, 1)
@@ -97,7 +144,9 @@ class HeatMapTests(unittest.TestCase):
     iso_column = "Country_code"
     date_column = "Date_reported"
     start_date = "2020-01-03"
-    test_HeatMap = HeatMap(mock_df, mock_world, plot_column, start_date, iso_column, date_column)
+    test_HeatMap = HeatMap(
+        mock_df, mock_world, plot_column, start_date, iso_column, date_column, iso_lookup=IsoLookup()
+    )
 
     def test_slider_setup(self):
         result = self.test_HeatMap._slider_setup()
@@ -138,6 +187,363 @@ class HeatMapTests(unittest.TestCase):
         mock_merge.assert_called_once()
 
 
+class DateIndexTests(unittest.TestCase):
+    def test_frame_matches_boolean_filter(self):
+        test_df = pd.read_csv("epispread/tests/test-db.csv")
+        test_df.loc[len(test_df)] = [None, 'AF', 'Afghanistan', 'EMRO', 3]
+        index = DateIndex(test_df, "Date_reported")
+        self.assertEqual(index.dates, ['2020-01-03', '2020-01-04'])
+        for date in index.dates:
+            expected = test_df.loc[test_df["Date_reported"] == date]
+            pd.testing.assert_frame_equal(index.frame(date), expected)
+        self.assertTrue(index.frame('1999-01-01').empty)
+        self.assertNotIn('1999-01-01', index)
+
+
+class IsoLookupTests(unittest.TestCase):
+    def test_map_resolves_each_code_once_and_persists(self):
+        resolver = MagicMock(side_effect=lambda codes: [{'AF': 'AFG', 'AL': 'ALB'}.get(c, 'not found') for c in codes])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'iso.json')
+            lookup = IsoLookup(path)
+            codes = pd.Series(['AF', 'AL', 'AF', None, 'XX', 'AL'])
+            result = lookup.map(codes, resolver)
+            self.assertEqual(list(result), ['AFG', 'ALB', 'AFG', None, None, 'ALB'])
+            resolver.assert_called_once_with(['AF', 'AL', 'XX'])
+
+            lookup.map(codes, resolver)
+            IsoLookup(path).map(codes, resolver)
+            resolver.assert_called_once()
+
+    def test_heat_map_attaches_iso3_once(self):
+        test_df = pd.read_csv("epispread/tests/test-db.csv")
+        lookup = stub_lookup()
+        with patch('country_converter.convert') as mock_convert:
+            heat_map = HeatMap(
+                test_df, None, "New_cases", "2020-01-03", "Country_code", "Date_reported", 1, lookup, lod=None
+            )
+            frame = heat_map._filter_single_date("2020-01-04")
+        mock_convert.assert_not_called()
+        self.assertEqual(list(frame[HeatMap.iso3_column]), ['AFG', 'ALB', 'DZA'])
+        self.assertNotIn(HeatMap.iso3_column, test_df.columns)
+        plt.close(heat_map.fig)
+
+
+class WorldCacheTests(unittest.TestCase):
+    def test_variants_are_cached_on_disk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            high = WorldCache(tmp).load('high')
+            self.assertNotIn("Antarctica", list(high.name))
+            self.assertEqual(len([name for name in os.listdir(tmp) if name.endswith('.feather')]), 3)
+
+            with patch('geopandas.read_file') as mock_read_file:
+                low = WorldCache(tmp).load('low')
+            mock_read_file.assert_not_called()
+            self.assertEqual(list(low.iso_a3), list(high.iso_a3))
+            vertices = [shapely.get_num_coordinates(np.asarray(world.geometry)).sum() for world in (high, low)]
+            self.assertLess(vertices[1], vertices[0])
+
+    def test_select_level(self):
+        self.assertEqual(WorldCache.select_level(500), 'low')
+        self.assertEqual(WorldCache.select_level(2000), 'medium')
+        self.assertEqual(WorldCache.select_level(10000), 'high')
+
+
+class DataCubeTests(unittest.TestCase):
+    def test_build_aligned_to_keys(self):
+        test_df = pd.read_csv("epispread/tests/test-db.csv")
+        test_df['Deaths'] = test_df['New_cases'] * 2
+        cube = DataCube.build(
+            test_df, "Date_reported", "Country_code", ["New_cases", "Deaths"], ['DZ', 'XX', 'AF', 'AF']
+        )
+        self.assertEqual(cube.arrays["New_cases"].shape, (2, 4))
+        self.assertEqual(cube.arrays["New_cases"].dtype, np.float32)
+        np.testing.assert_array_equal(cube.frame("2020-01-04", "Deaths"), [2, np.nan, 2, np.nan])
+        np.testing.assert_array_equal(cube.aggregate("New_cases", 'sum'), [1, 0, 1, 0])
+        np.testing.assert_array_equal(cube.range("New_cases", end="2020-01-03"), [[0, np.nan, 0, np.nan]])
+        self.assertEqual(cube.nbytes, 2 * 2 * 4 * 4)
+        self.assertTrue(np.isnan(cube.frame("1999-01-01", "New_cases")).all())
+
+
+class FrameCacheTests(unittest.TestCase):
+    def test_lru_eviction_and_counters(self):
+        compute = MagicMock(side_effect=lambda key: (np.zeros(10), str(key)))
+        cache = FrameCache(compute, max_frames=2, workers=0)
+        cache.get(1)
+        cache.get(2)
+        cache.get(1)
+        cache.get(3)
+        self.assertNotIn(2, cache)
+        self.assertIn(1, cache)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 3, 2))
+
+        capped = FrameCache(compute, max_bytes=200, workers=0)
+        for key in range(5):
+            capped.get(key)
+        self.assertEqual(capped.nbytes, 160)
+
+    def test_prefetch(self):
+        cache = FrameCache(lambda key: (np.full(3, key), str(key)), workers=2)
+        cache.prefetch([20, 40])
+        self.assertEqual(cache.get(20)[1], '20')
+        self.assertEqual(cache.get(40)[1], '40')
+        cache.close()
+        self.assertEqual(cache.stats()['prefetched'], 2)
+
+    def test_clear_drops_frames_prefetched_from_old_data(self):
+        data = {'version': 'old'}
+        started, release = threading.Event(), threading.Event()
+
+        def compute(key):
+            version = data['version']
+            if key == 20:
+                started.set()
+                release.wait(5)
+            return np.full(3, key), version
+
+        cache = FrameCache(compute, workers=1)
+        cache.prefetch([20, 40])
+        self.assertTrue(started.wait(5))
+        data['version'] = 'new'
+        cache.clear()
+        release.set()
+        cache.close()
+        self.assertNotIn(20, cache)
+        self.assertNotIn(40, cache)
+        self.assertEqual(cache.get(20)[1], 'new')
+
+    def test_get_computes_a_frame_cancelled_while_waiting(self):
+        started, release = threading.Event(), threading.Event()
+
+        def compute(key):
+            if key == 20:
+                started.set()
+                release.wait(5)
+            return np.full(3, key), str(key)
+
+        cache = FrameCache(compute, workers=1)
+        cache.prefetch([20, 40])
+        self.assertTrue(started.wait(5))
+        frames = []
+        waiter = threading.Thread(target=lambda: frames.append(cache.get(40)))
+        waiter.start()
+        # let get start waiting for the queued prefetch of 40 before clear cancels it
+        time.sleep(0.1)
+        cache.clear()
+        release.set()
+        waiter.join(5)
+        cache.close()
+        self.assertEqual(frames[0][1], '40')
+
+
+class ChoroplethTests(unittest.TestCase):
+    def test_update_only_swaps_colours(self):
+        plt.switch_backend('Agg')
+        test_df, world = load_test_db()
+        lookup = stub_lookup()
+        heat_map = HeatMap(test_df, world, "New_cases", "2020-01-03", "Country_code", "Date_reported", 1, lookup)
+
+        collection = heat_map._render("2020-01-03")
+        n_collections = len(heat_map.ax.collections)
+        heat_map._update(1)
+        self.assertIs(heat_map._render("2020-01-04"), collection)
+        self.assertEqual(len(heat_map.ax.collections), n_collections)
+        self.assertEqual((collection.norm.vmin, collection.norm.vmax), (0, 1))
+
+        values = heat_map._frame_values("2020-01-04")
+        afghanistan = int(np.flatnonzero(world.iso_a3.to_numpy() == 'AFG')[0])
+        self.assertEqual(values[afghanistan], 1)
+        self.assertEqual(np.count_nonzero(~np.isnan(values)), 3)
+        plt.close(heat_map.fig)
+
+        cube_map = HeatMap(
+            test_df, world, "New_cases", "2020-01-03", "Country_code", "Date_reported", 1, lookup, engine='cube'
+        )
+        cube_map._render("2020-01-04")
+        np.testing.assert_array_equal(cube_map._frame_values("2020-01-04"), values)
+        plt.close(cube_map.fig)
+
+    def test_missing_regions_are_hatched(self):
+        plt.switch_backend('Agg')
+        test_df, world = load_test_db()
+        lookup = stub_lookup()
+        heat_map = HeatMap(test_df, world, "New_cases", "2020-01-03", "Country_code", "Date_reported", 1, lookup)
+        heat_map._render("2020-01-04")
+        choropleth = heat_map.choropleth
+        self.assertEqual(choropleth.missing.get_hatch(), '///')
+        with_values = np.isin(choropleth.owners, np.flatnonzero(~np.isnan(heat_map._frame_values("2020-01-04"))))
+        self.assertEqual(len(choropleth.missing.get_paths()), np.count_nonzero(~with_values))
+        plt.close(heat_map.fig)
+
+    def test_slider_uses_frame_cache(self):
+        plt.switch_backend('Agg')
+        test_df, world = load_test_db()
+        lookup = stub_lookup()
+        heat_map = HeatMap(test_df, world, "New_cases", "2020-01-03", "Country_code", "Date_reported", 1, lookup)
+        heat_map._prepare()
+        heat_map.time_slider.set_val(20)
+        heat_map.time_slider.set_val(0)
+        heat_map.time_slider.set_val(20)
+        heat_map.frame_cache.close()
+        self.assertEqual(heat_map.time_slider.valtext.get_text(), '2020-01-23')
+        self.assertGreaterEqual(heat_map.frame_cache.hits, 1)
+        plt.close(heat_map.fig)
+
+
+class SubnationalTests(unittest.TestCase):
+    @staticmethod
+    def grid(columns=4, rows=3):
+        # unit squares R00, R01, ... with their lower left corners at (column, row)
+        cells = [shapely.box(x, y, x + 1, y + 1) for x in range(columns) for y in range(rows)]
+        codes = ['R%d%d' % (x, y) for x in range(columns) for y in range(rows)]
+        return GeoDataFrame({'code': codes}, geometry=cells, crs=4326)
+
+    def test_boundary_file_is_cached_in_lon_lat(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'admin.geojson')
+            self.grid().to_crs(3857).to_file(path, driver='GeoJSON')
+            cache_dir = os.path.join(tmp, 'cache')
+            boundaries = WorldCache(cache_dir, source=path).load('high')
+            self.assertTrue(boundaries.crs.is_geographic)
+            self.assertEqual(len(boundaries), 12)
+            np.testing.assert_allclose(boundaries.total_bounds, [0, 0, 4, 3], atol=1e-6)
+            self.assertEqual(len(os.listdir(cache_dir)), len(WorldCache.levels))
+            with patch('geopandas.read_file') as read_file:
+                WorldCache(cache_dir, source=path).load('low')
+            read_file.assert_not_called()
+
+    def test_heat_map_on_boundaries_with_raster_choropleth(self):
+        plt.switch_backend('Agg')
+        boundaries = self.grid()
+        df = DataFrame(
+            {
+                'Date': ['2020-01-01'] * 12 + ['2020-01-02'] * 2,
+                'Region': list(boundaries['code']) + ['R00', 'R31'],
+                'Cases': list(range(12)) + [50, 60],
+            }
+        )
+        heat_map = HeatMap(
+            df,
+            boundaries,
+            'Cases',
+            '2020-01-01',
+            'Region',
+            'Date',
+            1,
+            region_key='code',
+            lod=None,
+            engine='cube',
+            raster_threshold=0,
+        )
+        heat_map._render('2020-01-02')
+        self.assertIsInstance(heat_map.choropleth, RasterChoropleth)
+        values = heat_map._frame_values('2020-01-02')
+        self.assertEqual(np.count_nonzero(~np.isnan(values)), 2)
+        self.assertEqual(values[list(boundaries['code']).index('R31')], 60)
+
+        heat_map.fig.canvas.draw()
+        choropleth = heat_map.choropleth
+        self.assertEqual(choropleth.value_at(3.5, 1.5), 60)
+        self.assertTrue(np.isnan(choropleth.value_at(1.5, 1.5)))
+        self.assertEqual(choropleth.collection.norm.vmax, 60)
+        heat_map._render('2020-01-01')
+        self.assertEqual(choropleth.value_at(1.5, 2.5), 5)
+        plt.close(heat_map.fig)
+
+        vector_map = HeatMap(
+            df,
+            boundaries,
+            'Cases',
+            '2020-01-01',
+            'Region',
+            'Date',
+            1,
+            region_key='code',
+            lod=None,
+            raster_threshold=None,
+        )
+        vector_map._render('2020-01-02')
+        self.assertNotIsInstance(vector_map.choropleth, RasterChoropleth)
+        np.testing.assert_array_equal(vector_map._frame_values('2020-01-02'), values)
+        plt.close(vector_map.fig)
+
+    def test_points_in_regions(self):
+        locator = RegionLocator(self.grid(), 'code')
+        keys = locator.keys_of([0.5, 3.2, 9.0, np.nan, 1.0], [0.5, 2.9, 0.5, 1.0, 1.5])
+        self.assertEqual(list(keys[:4]), ['R00', 'R32', None, None])
+        # a point on the border of R01 and R11 goes to the region listed first
+        self.assertEqual(keys[4], 'R01')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cases.csv')
+            DataFrame(
+                {
+                    'Onset': ['2020-01-01 10:00', '2020-01-01 11:00', '2020-01-02 09:00', '2020-01-02 09:30'],
+                    'Lon': [0.5, 0.7, 3.5, 20.0],
+                    'Lat': [0.5, 0.2, 2.5, 20.0],
+                }
+            ).to_csv(path, index=False)
+            aggregator = LineListingAggregator(
+                'Onset', 'Region', chunk_size=2, locator=locator, coordinate_columns=('Lon', 'Lat')
+            )
+            df = aggregator.aggregate(path)
+        self.assertEqual(df.values.tolist(), [['2020-01-01', 'R00', 2], ['2020-01-02', 'R32', 1]])
+        self.assertEqual(aggregator.skipped, 1)
+
+
+class FrameExporterTests(unittest.TestCase):
+    def test_render_frames_and_gif(self):
+        plt.switch_backend('Agg')
+        test_df, world = load_test_db()
+        lookup = stub_lookup()
+        exporter = FrameExporter(
+            test_df, world, "New_cases", "Country_code", "Date_reported", figsize=(4, 2), iso_lookup=lookup
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            frames = exporter.render_frames(os.path.join(tmp, 'frames'), workers=1)
+            self.assertEqual([os.path.basename(frame) for frame in frames], ['frame_00000.png', 'frame_00001.png'])
+            gif = FrameExporter.assemble(frames, os.path.join(tmp, 'map.gif'))
+            self.assertGreater(os.path.getsize(gif), 0)
+            with self.assertRaises(ValueError):
+                FrameExporter.assemble(frames, os.path.join(tmp, 'map.avi'))
+
+
+class BatchRunnerTests(unittest.TestCase):
+    def test_run_loads_each_file_once(self):
+        plt.switch_backend('Agg')
+        with tempfile.TemporaryDirectory() as tmp:
+            shutil.copy("epispread/tests/test-db.csv", tmp)
+            spec = {
+                'output_dir': 'out',
+                'jobs': [
+                    {'name': 'map', 'type': 'heat map', 'file': 'test-db.csv', 'column': 'New_cases', 'lod': None},
+                    {
+                        'name': 'slider',
+                        'type': 'heat map w/ time slider',
+                        'file': 'test-db.csv',
+                        'column': 'New_cases',
+                        'workers': 1,
+                    },
+                    {'name': 'lines', 'type': 'time series', 'file': 'test-db.csv', 'column': 'New_cases'},
+                    {'name': 'broken', 'type': 'pie chart', 'file': 'test-db.csv', 'column': 'New_cases'},
+                ],
+            }
+            spec_path = os.path.join(tmp, 'jobs.json')
+            with open(spec_path, 'w') as f:
+                json.dump(spec, f)
+            runner = BatchRunner.from_file(spec_path)
+            with patch.object(EpiSpread, '_read_data', wraps=EpiSpread._read_data) as read_data:
+                results = runner.run()
+            self.assertEqual(read_data.call_count, 1)
+            self.assertEqual([result['status'] for result in results[:3]], ['ok'] * 3)
+            self.assertTrue(results[3]['status'].startswith('failed'))
+            for name in ('map.png', 'slider.gif', 'lines.png', 'summary.json'):
+                self.assertTrue(os.path.exists(os.path.join(tmp, 'out', name)), name)
+            with open(os.path.join(tmp, 'out', 'summary.json')) as f:
+                self.assertEqual(len(json.load(f)['loads']), 1)
+            self.assertIn('total', runner.format_summary())
+
+
 class TimeSeriesTests(unittest.TestCase):
     @patch('pandas.to_datetime')
     @patch('pandas.pivot_table')
@@ -149,6 +555,806 @@ class TimeSeriesTests(unittest.TestCase):
         self.assertGreater(len(test_TimeSeries.df), 0)
         self.assertIsInstance(test_TimeSeries, TimeSeries)
 
+    def test_wide_is_cached_and_input_untouched(self):
+        test_df = pd.read_csv("epispread/tests/test-db.csv")
+        before = test_df.copy()
+        series = TimeSeries(test_df, "Date_reported", "Country", "New_cases")
+        wide = series.wide
+        self.assertIs(series.wide, wide)
+        self.assertEqual(list(wide.columns), ['Afghanistan', 'Albania', 'Algeria'])
+        self.assertEqual(wide.loc['2020-01-04'].tolist(), [1, 1, 1])
+        plt.switch_backend('Agg')
+        with tempfile.TemporaryDirectory() as tmp, patch('pandas.DataFrame.pivot_table') as pivot_table:
+            series.save(os.path.join(tmp, 'lines.png'))
+            pivot_table.assert_not_called()
+        pd.testing.assert_frame_equal(test_df, before)
+
+    def test_series_filters(self):
+        test_df = pd.read_csv("epispread/tests/test-db.csv")
+        test_df.loc[test_df['Country'] == 'Albania', 'New_cases'] = [5, 7]
+        top = TimeSeries(test_df, "Date_reported", "Country", "New_cases", top_n=1)
+        self.assertEqual(top.selected_columns(), ['Albania'])
+        selected = TimeSeries(test_df, "Date_reported", "Country", "New_cases", series=['Algeria', 'Afghanistan'])
+        self.assertEqual(selected.selected_columns(), ['Afghanistan', 'Algeria'])
+        with self.assertRaises(ValueError):
+            TimeSeries(test_df, "Date_reported", "Country", "New_cases", decimation='every other')
+
+    def test_decimation_keeps_extremes(self):
+        values = np.random.default_rng(0).random((1000, 3))
+        values[500, 1] = 5.0
+        values[100:200, 2] = np.nan
+        kept = minmax_indices(values, 50)
+        self.assertEqual(kept.shape, (100, 3))
+        self.assertIn(500, kept[:, 1])
+        self.assertTrue((np.diff(kept, axis=0) >= 0).all())
+        kept = lttb_indices(np.arange(1000.0), values, 100)
+        self.assertEqual(kept.shape, (100, 3))
+        self.assertEqual((kept[0, 0], kept[-1, 0]), (0, 999))
+        self.assertIn(500, kept[:, 1])
+        self.assertTrue((np.diff(kept, axis=0) > 0).all())
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves StandInHandler.files from memory with an ETag, answering 304 to matching If-None-Match."""
+
+    files = {}
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append(self.path)
+        body = self.files.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = '"%x"' % hash(body)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SchemaInferenceTests(unittest.TestCase):
+    def test_first_row_nan(self):
+        df = pd.DataFrame(
+            {
+                'Date_reported': ['2020-01-03', '2020-01-04'] * 2,
+                'Country': ['A', 'A', 'B', 'B'],
+                'New_deaths': [np.nan, 1.0, 2.0, 3.0],
+                'Mixed': [None, 1, 2, 3],
+                'Flag': [True, False, True, False],
+            }
+        )
+        schema = SchemaInference(sample_rows=2).infer(df)
+        self.assertEqual(schema['number_columns'], ['New_deaths', 'Mixed'])
+        self.assertEqual(schema['time_series_columns'], [['Country', 'Date_reported']])
+
+    def test_duplicate_dates_are_not_a_time_series(self):
+        df = pd.DataFrame({'Date': ['2020-01-03', '2020-01-03', '2020-01-04'], 'Region': ['X', 'X', 'Y']})
+        inference = SchemaInference()
+        self.assertIsNone(inference.time_series_date(df, 'Region', ['Date']))
+        # one date per key is not a series either
+        self.assertIsNone(inference.time_series_date(df.iloc[1:], 'Region', ['Date']))
+
+    def test_schema_is_cached_by_content_and_header(self):
+        test_df = pd.read_csv("epispread/tests/test-db.csv")
+        with tempfile.TemporaryDirectory() as tmp:
+            inference = SchemaInference(tmp)
+            first = inference.schema(test_df, 'abc')
+            with patch.object(SchemaInference, 'infer') as infer:
+                self.assertEqual(SchemaInference(tmp).schema(test_df, 'abc'), first)
+                infer.assert_not_called()
+            inference.schema(test_df[['Country', 'Date_reported']], 'abc')
+            inference.schema(test_df, 'def')
+            self.assertEqual((inference.hits, inference.misses), (0, 3))
+
+
+class LineListingTests(unittest.TestCase):
+    rows = [
+        ('2020-01-03T08:00', 'AF', 30),
+        ('2020-01-03T21:15', 'AF', 40),
+        ('2020-01-03T09:00', 'AL', 50),
+        ('2020-01-04T10:30', 'AF', 20),
+        ('', 'AL', 60),
+        ('2020-01-04T11:00', 'AL', 70),
+        ('2020-01-04T12:00', 'AL', 80),
+    ]
+
+    def write_listing(self, directory):
+        path = os.path.join(directory, 'cases.csv.gz')
+        pd.DataFrame(self.rows, columns=['Onset', 'Country_code', 'Age']).to_csv(path, index=False)
+        return path
+
+    def test_chunks_merge_to_whole_file_aggregate(self):
+        progress = []
+        with tempfile.TemporaryDirectory() as tmp:
+            aggregator = LineListingAggregator(
+                'Onset', 'Country_code', ['Age'], chunk_size=2, progress=lambda rows, seconds: progress.append(rows)
+            )
+            df = aggregator.aggregate(self.write_listing(tmp))
+        self.assertEqual(list(df.columns), ['Onset', 'Country_code', 'Cases', 'Age'])
+        self.assertEqual(df['Onset'].tolist(), ['2020-01-03', '2020-01-03', '2020-01-04', '2020-01-04'])
+        self.assertEqual(df['Country_code'].tolist(), ['AF', 'AL', 'AF', 'AL'])
+        self.assertEqual(df['Cases'].tolist(), [2, 1, 1, 2])
+        self.assertEqual(df['Age'].tolist(), [70, 50, 20, 150])
+        self.assertEqual((aggregator.rows, aggregator.skipped, aggregator.chunks), (7, 1, 4))
+        self.assertEqual(progress, [2, 4, 6, 7])
+        self.assertGreater(aggregator.rows_per_second, 0)
+
+    def test_aggregate_feeds_heat_map(self):
+        plt.switch_backend('Agg')
+        with tempfile.TemporaryDirectory() as tmp:
+            df, world = EpiSpread._read_line_listing(self.write_listing(tmp), 'Onset', 'Country_code', chunk_size=3)
+        lookup = stub_lookup()
+        heat_map = HeatMap(
+            df, world, 'Cases', '2020-01-04', 'Country_code', 'Onset', 1, lookup, engine='cube', lod=None
+        )
+        heat_map._choropleth_setup()
+        self.assertEqual(heat_map.cube.frame(to_day('2020-01-04'), 'Cases')[heat_map.cube.keys.index('ALB')], 2)
+        plt.close(heat_map.fig)
+
+
+class IncrementalCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'global.csv')
+        with open("epispread/tests/test-db.csv") as f:
+            self.text = f.read()
+        self.write(self.text)
+        self.cache = IncrementalCache(os.path.join(self.tmp.name, 'cache'))
+        self.assertEqual(self.cache.refresh(self.path, 'Date_reported').mode, 'initial')
+
+    def write(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+
+    def test_appended_dates_are_parsed_alone(self):
+        self.assertEqual(self.cache.refresh(self.path, 'Date_reported').mode, 'unchanged')
+        self.write(self.text + "\n2020-01-05,AF,Afghanistan,EMRO,4\n2020-01-05,AL,Albania,EURO,2")
+        with patch('pandas.read_csv', wraps=pd.read_csv) as read_csv:
+            report = self.cache.refresh(self.path, 'Date_reported')
+        self.assertEqual(report.mode, 'append')
+        self.assertEqual(report.new_rows['New_cases'].tolist(), [4, 2])
+        # only the appended bytes were handed to the parser
+        self.assertNotIsInstance(read_csv.call_args[0][0], str)
+        df = self.cache.load(self.path)
+        self.assertEqual(len(df), 8)
+        self.assertEqual(df['Date_reported'].iloc[-1], '2020-01-05')
+
+    def test_interleaved_new_dates_are_appended(self):
+        lines = self.text.splitlines()
+        lines.insert(3, "2020-01-05,AF,Afghanistan,EMRO,4.0")
+        self.write("\n".join(lines))
+        report = self.cache.refresh(self.path, 'Date_reported')
+        self.assertEqual((report.mode, report.rows_added), ('append', 1))
+        self.assertEqual(len(self.cache.load(self.path)), 7)
+
+    def test_changed_history_rebuilds(self):
+        self.write(self.text.replace("2020-01-04,AL,Albania,EURO,1", "2020-01-04,AL,Albania,EURO,5"))
+        report = self.cache.refresh(self.path, 'Date_reported')
+        self.assertEqual(report.mode, 'rebuild')
+        self.assertIn('2020-01-04', report.reason)
+        self.assertEqual(self.cache.load(self.path)['New_cases'].sum(), 7)
+
+    def test_rows_appended_to_header_only_file(self):
+        header = self.text.splitlines()[0]
+        self.write(header + "\n")
+        self.assertEqual(self.cache.refresh(self.path, 'Date_reported').mode, 'rebuild')
+        self.assertEqual(len(self.cache.load(self.path)), 0)
+        self.write(header + "\n2020-01-05,AF,Afghanistan,EMRO,9\n")
+        report = self.cache.refresh(self.path, 'Date_reported')
+        self.assertEqual(report.mode, 'initial')
+        self.assertEqual(self.cache.load(self.path)['New_cases'].tolist(), [9])
+
+    def test_load_of_a_changed_file_keeps_the_manifest_valid(self):
+        self.write(self.text + "\n2020-01-05,AF,Afghanistan,EMRO,4")
+        self.assertEqual(len(self.cache.load(self.path)), 7)
+        self.write(self.text + "\n2020-01-05,AF,Afghanistan,EMRO,4\n2020-01-06,AF,Afghanistan,EMRO,5")
+        report = self.cache.refresh(self.path, 'Date_reported')
+        self.assertEqual((report.mode, report.new_rows['New_cases'].tolist()), ('append', [5]))
+        self.assertEqual(self.cache.load(self.path)['New_cases'].tolist()[-2:], [4, 5])
+
+    def test_missing_part_rebuilds(self):
+        self.write(self.text + "\n2020-01-05,AF,Afghanistan,EMRO,4")
+        for name in os.listdir(self.cache.cache_dir):
+            if name.endswith('.feather'):
+                os.remove(os.path.join(self.cache.cache_dir, name))
+        report = self.cache.refresh(self.path, 'Date_reported')
+        self.assertEqual((report.mode, report.reason), ('rebuild', "the cached base file could not be read"))
+        self.assertEqual(len(self.cache.load(self.path)), 7)
+
+    def test_checksums_ignore_int_float_parsing(self):
+        df = pd.read_csv("epispread/tests/test-db.csv")
+        as_float = df.assign(New_cases=df['New_cases'].astype(float))
+        self.assertEqual(partition_checksums(df, 'Date_reported'), partition_checksums(as_float, 'Date_reported'))
+
+    def test_heat_map_extend(self):
+        plt.switch_backend('Agg')
+        df = self.cache.load(self.path)
+        lookup = stub_lookup()
+        heat_map = HeatMap(
+            df,
+            self.world(),
+            'New_cases',
+            '2020-01-03',
+            'Country_code',
+            'Date_reported',
+            1,
+            lookup,
+            engine='cube',
+            lod=None,
+        )
+        heat_map._choropleth_setup()
+        self.write(self.text + "\n2020-01-05,AF,Afghanistan,EMRO,9")
+        heat_map.extend(self.cache.refresh(self.path, 'Date_reported').new_rows)
+        self.assertEqual(heat_map.date_index.dates[-1], to_day('2020-01-05'))
+        self.assertEqual(len(heat_map.date_index.frame(to_day('2020-01-05'))), 1)
+        self.assertEqual(heat_map.cube.frame(to_day('2020-01-05'), 'New_cases')[heat_map.cube.keys.index('AFG')], 9)
+        self.assertEqual(heat_map.choropleth.collection.norm.vmax, 9)
+        self.assertEqual(heat_map._frame_values('2020-01-05').shape, (heat_map.choropleth.n_regions,))
+        plt.close(heat_map.fig)
+
+    def world(self):
+        return load_test_db()[1]
+
+
+class DerivedMetricsTests(unittest.TestCase):
+    def make_frame(self):
+        dates = pd.date_range('2020-01-03', periods=30).strftime('%Y-%m-%d')
+        df = pd.DataFrame(
+            {
+                'Date_reported': np.tile(dates, 2),
+                'Country_code': np.repeat(['AFG', 'ALB'], 30),
+                'New_cases': np.random.default_rng(0).integers(1, 100, 60).astype(float),
+            }
+        )
+        df.loc[40, 'New_cases'] = np.nan
+        # shuffled rows: the metrics must not depend on the row order
+        return df.sample(frac=1, random_state=0)
+
+    def expected(self, df, function):
+        ordered = df.sort_values(['Country_code', 'Date_reported'])
+        return function(ordered.groupby('Country_code')['New_cases']).reindex(df.index).to_numpy()
+
+    def test_matches_pandas(self):
+        df = self.make_frame()
+        metrics = DerivedMetrics(df, 'Date_reported', 'Country_code', population={'AFG': 2e5, 'ALB': 1e5})
+        np.testing.assert_allclose(
+            metrics.values('New_cases_avg7'),
+            self.expected(df, lambda grouped: grouped.transform(lambda s: s.rolling(7).mean())),
+        )
+        weekly = lambda s: s.rolling(7).sum()  # noqa: E731
+        np.testing.assert_allclose(
+            metrics.values('New_cases_wow'),
+            self.expected(df, lambda grouped: grouped.transform(lambda s: weekly(s) / weekly(s).shift(7) - 1)),
+        )
+        rates = metrics.values('New_cases_avg14_per100k')
+        expected = self.expected(df, lambda grouped: grouped.transform(lambda s: s.rolling(14).mean()))
+        np.testing.assert_allclose(rates, expected / np.where(df['Country_code'] == 'AFG', 2, 1))
+
+    def test_memoized_per_column_metric_window(self):
+        df = self.make_frame()
+        metrics = DerivedMetrics(df, 'Date_reported', 'Country_code')
+        with patch.object(DerivedMetrics, '_compute', wraps=metrics._compute) as compute:
+            first = metrics.values('New_cases_avg7')
+            self.assertIs(metrics.values('New_cases_avg7'), first)
+            metrics.values('New_cases_avg14')
+        self.assertEqual(compute.call_count, 2)
+        self.assertEqual(DerivedMetrics.parse('New_cases_avg7'), ('New_cases', 'avg', 7))
+        self.assertIsNone(DerivedMetrics.parse('New_cases_avg'))
+        with self.assertRaises(ValueError):
+            metrics.values('New_cases_per100k')
+        with self.assertRaises(KeyError):
+            metrics.values('New_cases_median')
+
+    def test_plot_classes_take_metric_names(self):
+        plt.switch_backend('Agg')
+        df = self.make_frame()
+        columns = list(df.columns)
+        series = TimeSeries(df, 'Date_reported', 'Country_code', 'New_cases_avg7')
+        afg_cases = df[df['Country_code'] == 'AFG'].sort_values('Date_reported')['New_cases']
+        self.assertEqual(series.wide['AFG'].iloc[6], afg_cases.iloc[:7].mean())
+        world = load_test_db()[1]
+        heat_map = HeatMap(df, world, 'New_cases_per100k', '2020-01-10', 'Country_code', 'Date_reported', 1, lod=None)
+        afg = heat_map.df['Country_code'] == 'AFG'
+        population = world.loc[world['iso_a3'] == 'AFG', 'pop_est'].iloc[0]
+        rates = heat_map.df.loc[afg, 'New_cases_per100k']
+        np.testing.assert_allclose(rates, df.loc[afg, 'New_cases'] / population * 1e5)
+        self.assertEqual(list(df.columns), columns)
+        plt.close(heat_map.fig)
+
+
+class CompactTests(unittest.TestCase):
+    def test_compact_dtypes_and_memory(self):
+        df = pd.DataFrame(
+            {
+                'Date_reported': ['2020-01-03', '2020-01-04', None, '2020-01-04'] * 50,
+                'Country_code': ['AF', 'AL', 'DZ', 'AF'] * 50,
+                'New_cases': [1, 300, 2, 70000] * 50,
+                'Rate': [0.5, 1.0, np.nan, 2.0] * 50,
+            }
+        )
+        small = compact(df)
+        self.assertEqual(str(small['Date_reported'].dtype), 'Int32')
+        self.assertEqual(str(small['Country_code'].dtype), 'category')
+        self.assertEqual(small['New_cases'].dtype, np.int32)
+        self.assertEqual(small['Rate'].dtype, np.float64)
+        self.assertEqual(list(format_days(small['Date_reported'].iloc[:2])), ['2020-01-03', '2020-01-04'])
+        self.assertTrue(small['Date_reported'].isna().iloc[2])
+        self.assertEqual(df['Date_reported'].dtype, object)
+        report = memory_report(df, small)
+        self.assertLess(report.loc['total', 'bytes_after'], report.loc['total', 'bytes_before'] / 3)
+
+        days = to_days(pd.Series(pd.to_datetime(['2020-01-03', '2020-01-04'])))
+        self.assertEqual(days.tolist(), [to_day('2020-01-03'), to_day('2020-01-03') + 1])
+        self.assertEqual(days.dtype, np.int32)
+
+    def test_heat_map_on_compact_data(self):
+        plt.switch_backend('Agg')
+        test_df, world = load_test_db()
+        lookup = stub_lookup()
+        small = compact(test_df)
+        self.assertEqual(small['Date_reported'].dtype, np.int32)
+        text_map = HeatMap(test_df, world, "New_cases", "2020-01-03", "Country_code", "Date_reported", 1, lookup)
+        small_map = HeatMap(small, world, "New_cases", "2020-01-03", "Country_code", "Date_reported", 1, lookup)
+        for heat_map in (text_map, small_map):
+            heat_map._prepare()
+            heat_map.frame_cache.close()
+        expected = text_map._frame_values("2020-01-04")
+        np.testing.assert_array_equal(small_map._frame_values(to_day("2020-01-03") + 1), expected)
+        values, label = small_map._compute_frame(20)
+        self.assertEqual(label, '2020-01-23')
+        self.assertEqual(small_map._labels[small_map.start_day + 20], '2020-01-23')
+        plt.close(text_map.fig)
+        plt.close(small_map.fig)
+
+
+class RollupTests(unittest.TestCase):
+    def make_frame(self):
+        # 10 countries in 3 regions over 45 days from a Sunday, some rows and values missing
+        days = pd.date_range('2020-12-27', periods=45).strftime('%Y-%m-%d')
+        codes = ['C%d' % i for i in range(10)]
+        df = pd.DataFrame(
+            {
+                'Date_reported': np.repeat(days, len(codes)),
+                'Country_code': np.tile(codes, len(days)),
+                'WHO_region': np.tile(['R%d' % (i % 3) for i in range(len(codes))], len(days)),
+            }
+        )
+        rng = np.random.default_rng(0)
+        df['New_cases'] = rng.integers(0, 100, len(df)).astype(float)
+        df['Positivity_rate'] = rng.random(len(df))
+        df.loc[rng.random(len(df)) < 0.1, 'New_cases'] = np.nan
+        return df.sample(frac=0.9, random_state=0).sort_values('Date_reported', kind='stable')
+
+    def expected(self, df, level, bucket, column, how):
+        starts = bucket_starts(to_days(df['Date_reported']).to_numpy(), bucket)
+        keys = df[level] if level != 'global' else 'global'
+        grouped = df.assign(start=starts, key=keys).groupby(['start', 'key'])[column]
+        return (grouped.mean() if how == 'mean' else grouped.sum(min_count=1)).unstack()
+
+    def assert_matches(self, rollup, df):
+        for level in rollup.levels:
+            for bucket in Rollup.buckets:
+                for column, how in (('New_cases', 'sum'), ('Positivity_rate', 'sum'), ('Positivity_rate', 'mean')):
+                    if column not in rollup.columns:
+                        continue
+                    cube = rollup.cube(level, bucket, [column], how)
+                    expected = self.expected(df, level, bucket, column, how)
+                    expected = expected.reindex(index=cube.dates, columns=cube.keys).to_numpy()
+                    np.testing.assert_allclose(cube.arrays[column], expected, rtol=1e-5, err_msg=level + bucket)
+
+    def test_matches_pandas_at_every_level_and_bucket(self):
+        df = self.make_frame()
+        rollup = Rollup(df, 'Date_reported', 'Country_code', ['New_cases', 'Positivity_rate'], ['WHO_region'])
+        self.assertEqual(rollup.levels, ('Country_code', 'WHO_region', 'global'))
+        self.assertEqual(rollup.rate_columns, ['Positivity_rate'])
+        self.assert_matches(rollup, df)
+        self.assert_matches(Rollup(compact(df), 'Date_reported', 'Country_code', ['New_cases'], ['WHO_region']), df)
+        wide = rollup.wide('New_cases', 'WHO_region', 'week')
+        self.assertEqual(wide.index[0], pd.Timestamp('2020-12-21'))
+        self.assertEqual(list(wide.columns), ['R0', 'R1', 'R2'])
+        months = [to_day('2020-12-01'), to_day('2021-01-01'), to_day('2021-02-01')]
+        self.assertEqual(rollup.cube('global', 'month').dates, months)
+        regions = rollup.cube('WHO_region', 'week', ['New_cases'], keys=['C4', 'XX', 'C1'])
+        np.testing.assert_array_equal(regions.arrays['New_cases'][:, 0], regions.arrays['New_cases'][:, 2])
+        self.assertTrue(np.isnan(regions.arrays['New_cases'][:, 1]).all())
+        weeks = bucket_labels([to_day('2021-01-01'), to_day('2021-01-04')], 'week')
+        self.assertEqual(list(weeks), ['2020-W53', '2021-W01'])
+        with self.assertRaises(ValueError):
+            rollup.cube('WHO_region', 'week', ['New_cases'], 'mean')
+        with self.assertRaises(ValueError):
+            rollup.cube('Country', 'week')
+
+    def test_extend_adds_only_new_rows(self):
+        df = self.make_frame()
+        # cut on a Wednesday, so the rows of one week and one month are split; C9 only appears after the cut
+        early = (df['Date_reported'] < '2021-01-13') & (df['Country_code'] != 'C9')
+        rollup = Rollup(df[early], 'Date_reported', 'Country_code', ['New_cases', 'Positivity_rate'], ['WHO_region'])
+        late = df[df['Date_reported'] >= '2021-01-13']
+        self.assertIs(rollup.extend(late), rollup)
+        self.assert_matches(rollup, pd.concat([df[early], late]))
+        with self.assertRaises(ValueError):
+            rollup.extend(df[early])
+
+    def test_plots_take_level_and_bucket(self):
+        plt.switch_backend('Agg')
+        test_df, world = load_test_db()
+        lookup = stub_lookup()
+        heat_map = HeatMap(
+            test_df,
+            world,
+            "New_cases",
+            "2020-01-03",
+            "Country_code",
+            "Date_reported",
+            1,
+            lookup,
+            level='global',
+            bucket='week',
+        )
+        heat_map._prepare()
+        heat_map.frame_cache.close()
+        values = heat_map._frame_values("2020-01-04")
+        self.assertEqual(np.nanmax(values), 3)
+        self.assertEqual(np.isfinite(values).sum(), 3)
+        self.assertEqual(heat_map._labels[heat_map.start_day], '2020-W01')
+        plt.close(heat_map.fig)
+        with self.assertRaises(ValueError):
+            HeatMap(
+                test_df,
+                world,
+                "New_cases",
+                "2020-01-03",
+                "Country_code",
+                "Date_reported",
+                level='global',
+                render_mode='merge',
+            )
+
+        series = TimeSeries(test_df, 'Date_reported', 'Country', 'New_cases', level='WHO_region', bucket='month')
+        self.assertEqual(series.wide.loc['2020-01-01', 'EMRO'], 1)
+        series = TimeSeries(test_df, 'Date_reported', 'Country', 'New_cases', level='global')
+        self.assertEqual(series.wide['global'].tolist(), [0, 3])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            shutil.copy("epispread/tests/test-db.csv", tmp)
+            jobs = [
+                {'type': 'time series', 'file': 'test-db.csv', 'column': 'New_cases', 'level': 'WHO_region'},
+                {'type': 'time series', 'file': 'test-db.csv', 'column': 'New_cases', 'bucket': 'week'},
+            ]
+            runner = BatchRunner({'jobs': jobs}, base_dir=tmp)
+            results = runner.run()
+            self.assertEqual([result['status'] for result in results], ['ok', 'ok'])
+            # both jobs read the one rollup of the file by country
+            (dataset,) = runner.datasets.values()
+            self.assertEqual(list(dataset.rollups), [('Country', 'Date_reported')])
+
+
+class BenchmarkSuiteTests(unittest.TestCase):
+    def test_synthetic_data_and_compare(self):
+        from benchmarks.bench_end_to_end import compare
+        from benchmarks.synthetic import who_frame, write_line_listing
+
+        df = who_frame(5, 20, extra_columns=2, codes=['AFG', 'ALB', '-99'])
+        self.assertEqual(len(df), 100)
+        self.assertEqual(list(df['Country_code'].unique()), ['AFG', 'ALB', 'Q000', 'Q001', 'Q002'])
+        self.assertIn('Metric_01', df.columns)
+        self.assertTrue((df.groupby('Country_code')['Cumulative_cases'].diff().dropna() >= 0).all())
+        with tempfile.TemporaryDirectory() as tmp:
+            path = write_line_listing(os.path.join(tmp, 'listing.csv'), 2500, ['AFG', 'ALB'], 20, block=1000)
+            listing = pd.read_csv(path)
+        self.assertEqual(len(listing), 2500)
+        self.assertEqual(listing['Onset'].str[:7].unique().tolist(), ['2020-01'])
+
+        base = {'scale': {}, 'stages': {'load': {'seconds': 1.0}, 'fetch': {'seconds': 0.0001}}}
+        current = {'scale': {}, 'stages': {'load': {'seconds': 1.5}, 'fetch': {'seconds': 0.0003}}}
+        self.assertEqual(compare(base, current)[1], ['load'])
+
+
+class InstrumentationTests(unittest.TestCase):
+    def test_disabled_collects_nothing(self):
+        instrumentation = Instrumentation()
+        self.assertIs(instrumentation.stage('read_data'), instrumentation.stage('parse_columns'))
+        with instrumentation.stage('read_data'):
+            instrumentation.count('hits')
+            instrumentation.observe('frame_latency', 0.01)
+        self.assertEqual(instrumentation.to_dict()['stages'], {})
+        self.assertEqual(instrumentation.to_dict()['counters'], {})
+
+    def test_stages_histograms_profiles_and_memory(self):
+        plt.switch_backend('Agg')
+        instrumentation = Instrumentation(enabled=True, profile=['choropleth_setup'], trace_memory=['update'])
+        test_df, world = load_test_db()
+        lookup = stub_lookup()
+        with patch.object(HeatMap, 'instrumentation', instrumentation):
+            heat_map = HeatMap(test_df, world, "New_cases", "2020-01-03", "Country_code", "Date_reported", 1, lookup)
+            heat_map._prepare()
+            for offset in (20, 0, 20):
+                heat_map.time_slider.set_val(offset)
+            heat_map.frame_cache.close()
+        plt.close(heat_map.fig)
+
+        metrics = instrumentation.to_dict()
+        self.assertEqual(metrics['stages']['update']['calls'], 3)
+        self.assertEqual(metrics['stages']['iso_conversion']['calls'], 1)
+        self.assertEqual(metrics['histograms']['frame_latency']['count'], 3)
+        self.assertEqual(sum(metrics['histograms']['frame_latency']['buckets'].values()), 3)
+        self.assertEqual(sum(metrics['counters'].values()), 3)
+        self.assertIn('choropleth.py', metrics['profiles']['choropleth_setup'])
+        self.assertGreater(metrics['peak_bytes']['update'], 0)
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(instrumentation.dump(os.path.join(tmp, 'metrics.json'))) as f:
+                self.assertEqual(json.load(f)['stages']['update']['calls'], 3)
+        with self.assertLogs('epispread', level='INFO') as logs:
+            instrumentation.log()
+        self.assertTrue(any('stage update: 3 calls' in line for line in logs.output))
+
+    def test_nested_traced_stages_have_their_own_peaks(self):
+        instrumentation = Instrumentation(enabled=True, trace_memory=['outer', 'inner'])
+        with instrumentation.stage('outer'):
+            big = bytearray(8 * 2**20)
+            del big
+            with instrumentation.stage('inner'):
+                small = bytearray(2**20)
+                del small
+        peaks = instrumentation.to_dict()['peak_bytes']
+        self.assertGreater(peaks['outer'], 8 * 2**20)
+        self.assertGreater(peaks['inner'], 2**20)
+        self.assertLess(peaks['inner'], 4 * 2**20)
+
+    def test_traced_stages_on_two_threads(self):
+        instrumentation = Instrumentation(enabled=True, profile=['loader'], trace_memory=['main', 'loader'])
+        opened, closed = threading.Event(), threading.Event()
+
+        def loader():
+            with instrumentation.stage('loader'):
+                opened.set()
+                closed.wait(5)
+                big = bytearray(8 * 2**20)
+                del big
+
+        thread = threading.Thread(target=loader)
+        with instrumentation.stage('main'):
+            thread.start()
+            self.assertTrue(opened.wait(5))
+        # the stage that started tracing is done, the other one is still traced
+        closed.set()
+        thread.join(5)
+        self.assertGreater(instrumentation.to_dict()['peak_bytes']['loader'], 8 * 2**20)
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+class ImportTimeTests(unittest.TestCase):
+    heavy = ('pandas', 'geopandas', 'matplotlib', 'country_converter', 'requests', 'pyarrow')
+    # seconds of cumulative import time allowed for the epispread package itself, well above the ~1 ms it takes
+    # with lazy imports and far below the second it took when pandas, geopandas and matplotlib came eagerly
+    budget = 0.3
+
+    @staticmethod
+    def run_python(*args):
+        return subprocess.run([sys.executable, *args], capture_output=True, text=True, check=True)
+
+    @staticmethod
+    def import_seconds(stderr, top_level):
+        # -X importtime lines are "import time: self [us] | cumulative | name", nested imports indented by depth
+        seconds = 0.0
+        for line in stderr.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].rstrip() == ' ' + top_level:
+                seconds += int(fields[1]) / 1e6
+        return seconds
+
+    def test_import_loads_no_heavy_dependency(self):
+        code = (
+            "import sys, epispread, epispread.cli; epispread.cli.build_parser().format_help(); "
+            f"print(','.join(name for name in {self.heavy!r} if name in sys.modules))"
+        )
+        self.assertEqual(self.run_python('-c', code).stdout.strip(), '')
+
+    def test_import_time_budget(self):
+        runs = ((('-c', 'import epispread'), 'epispread'), (('-m', 'epispread', '--help'), 'epispread.cli'))
+        for args, top_level in runs:
+            result = self.run_python('-X', 'importtime', *args)
+            seconds = self.import_seconds(result.stderr, top_level)
+            self.assertGreater(seconds, 0, args)
+            self.assertLess(seconds, self.budget, args)
+
+    def test_lazy_attributes(self):
+        import epispread
+
+        self.assertIs(epispread.HeatMap, HeatMap)
+        self.assertIs(epispread.TimeSeries, TimeSeries)
+        self.assertIn('EpiSpread', dir(epispread))
+        with self.assertRaises(AttributeError):
+            epispread.NoSuchClass
+
+
+class FrameServerTests(unittest.TestCase):
+    def serve(self, check, workers=0):
+        plt.switch_backend('Agg')
+
+        async def run():
+            server = FrameServer(
+                ["epispread/tests/test-db.csv"], port=0, workers=workers, figsize=(4, 2), iso_lookup=stub_lookup()
+            )
+            await server.start()
+            try:
+                await check(server)
+            finally:
+                await server.close()
+
+        asyncio.run(run())
+
+    def test_values_frames_and_errors_over_http(self):
+        async def check(server):
+            def get(connection, path):
+                connection.request('GET', path)
+                response = connection.getresponse()
+                return response.status, response.getheader('Content-Type'), response.read()
+
+            def session():
+                # one keep-alive connection for every request
+                connection = http.client.HTTPConnection(server.host, server.port, timeout=30)
+                try:
+                    return [
+                        get(connection, path)
+                        for path in (
+                            '/datasets',
+                            '/values?file=test-db&column=New_cases&date=2020-01-04',
+                            '/frame.png?file=epispread/tests/test-db.csv&column=New_cases',
+                            '/frame.png?file=test-db&column=New_cases&date=2020-01-04',
+                            '/values?file=test-db&column=Nope',
+                            '/values?file=other&column=New_cases',
+                            '/values?file=test-db&column=New_cases&date=2019-01-01',
+                            '/values?file=test-db&column=New_cases&date=soon',
+                            '/values?column=New_cases',
+                            '/stats',
+                        )
+                    ]
+                finally:
+                    connection.close()
+
+            responses = await asyncio.to_thread(session)
+            datasets = json.loads(responses[0][2])
+            self.assertEqual(datasets['test-db']['dates'], ['2020-01-03', '2020-01-04'])
+            self.assertEqual(datasets['test-db']['columns'], ['New_cases'])
+            values = json.loads(responses[1][2])
+            self.assertEqual(values['date'], '2020-01-04')
+            by_region = dict(zip(values['regions'], values['values']))
+            self.assertEqual((by_region['AFG'], by_region['ALB'], by_region['DZA']), (1, 1, 1))
+            self.assertIsNone(by_region['FRA'])
+            self.assertEqual(responses[2][1], 'image/png')
+            self.assertTrue(responses[2][2].startswith(b'\x89PNG'))
+            # the last date is the default, so both frame requests are one cached response
+            self.assertEqual(responses[2][2], responses[3][2])
+            self.assertEqual([status for status, _, _ in responses[4:9]], [404, 404, 404, 400, 400])
+            stats = json.loads(responses[9][2])
+            self.assertEqual(stats['rendered'], 1)
+            self.assertEqual(stats['layers'], ['test-db/New_cases'])
+
+        self.serve(check)
+
+    def test_concurrent_requests_share_one_render(self):
+        async def check(server):
+            frames = await asyncio.gather(*[server.frame('test-db', 'New_cases', '2020-01-03') for _ in range(4)])
+            self.assertEqual(len(set(frames)), 1)
+            self.assertEqual(server.rendered, 1)
+            self.assertEqual(len(server.layers), 1)
+            await server.frame('test-db', 'New_cases', '2020-01-04')
+            self.assertEqual(server.rendered, 2)
+
+        self.serve(check)
+
+    def test_render_in_worker_process(self):
+        async def check(server):
+            png = await server.frame('test-db', 'New_cases')
+            self.assertTrue(png.startswith(b'\x89PNG'))
+
+        self.serve(check, workers=1)
+
+    def test_response_cache_evicts_least_recently_used(self):
+        cache = ResponseCache(max_entries=2)
+        cache.put('a', ('text/plain', b'1'))
+        cache.put('b', ('text/plain', b'22'))
+        cache.get('a')
+        cache.put('c', ('text/plain', b'333'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), ('text/plain', b'1'))
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'responses': 2, 'nbytes': 4})
+
+
+class DownloaderTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        StandInHandler.files = {'/a.csv': b'x,y\n1,2\n' * 1000, '/b.csv': b'x,y\n3,4\n'}
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = 'http://127.0.0.1:%d' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_fetch_then_conditional_hit(self):
+        urls = [self.base + '/a.csv', self.base + '/b.csv']
+        with tempfile.TemporaryDirectory() as tmp:
+            downloader = Downloader(dest_dir=tmp, chunk_size=1024)
+            first = downloader.fetch(urls)
+            # the mode open() gives new files, not mkstemp's 0600
+            with open(os.path.join(tmp, 'plain'), 'wb'):
+                pass
+            self.assertEqual(os.stat(os.path.join(tmp, 'a.csv')).st_mode, os.stat(os.path.join(tmp, 'plain')).st_mode)
+            os.remove(os.path.join(tmp, 'plain'))
+            self.assertEqual(first.file_names, ['a', 'b'])
+            self.assertEqual(first.cache_hits, [])
+            self.assertEqual(first.bytes_transferred, sum(len(body) for body in StandInHandler.files.values()))
+            with open(os.path.join(tmp, 'a.csv'), 'rb') as f:
+                self.assertEqual(f.read(), StandInHandler.files['/a.csv'])
+
+            second = downloader.fetch(urls)
+            self.assertEqual(second.cache_hits, ['a', 'b'])
+            self.assertEqual(second.bytes_transferred, 0)
+            self.assertFalse([name for name in os.listdir(tmp) if name.endswith('.part')])
+            with patch.object(downloader.session, 'close') as close, downloader:
+                pass
+            close.assert_called_once_with()
+
+    def test_fetch_reports_failures(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            report = Downloader(dest_dir=tmp).fetch([self.base + '/missing.csv'])
+        self.assertEqual(report.failures, [self.base + '/missing.csv'])
+        self.assertEqual(report.file_names, [])
+
+
+class ColumnarCacheTests(unittest.TestCase):
+    def test_load_hits_cache_and_invalidates(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            csv = os.path.join(tmp, 'data.csv')
+            with open('epispread/tests/test-db.csv') as src, open(csv, 'w') as dst:
+                dst.write(src.read())
+            cache = ColumnarCache(os.path.join(tmp, 'cache'))
+
+            first = cache.load(csv)
+            second = cache.load(csv, columns=['Country', 'New_cases'])
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            self.assertEqual(list(second.columns), ['Country', 'New_cases'])
+            pd.testing.assert_frame_equal(first[['Country', 'New_cases']], second)
+
+            with open(csv, 'a') as dst:
+                dst.write('\n2020-01-05,AF,Afghanistan,EMRO,7')
+            third = cache.load(csv)
+            self.assertEqual(cache.misses, 2)
+            self.assertEqual(len(third), len(first) + 1)
+            feathers = [name for name in os.listdir(cache.cache_dir) if name.endswith('.feather')]
+            self.assertEqual(len(feathers), 1)
+
+    def test_same_file_name_in_two_directories(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            csvs = [os.path.join(tmp, directory, 'data.csv') for directory in ('a', 'b')]
+            for csv in csvs:
+                os.makedirs(os.path.dirname(csv))
+                shutil.copy('epispread/tests/test-db.csv', csv)
+            with open(csvs[1], 'a') as dst:
+                dst.write('\n2020-01-05,AF,Afghanistan,EMRO,7')
+            cache = ColumnarCache(os.path.join(tmp, 'cache'))
+            for csv in csvs + csvs:
+                cache.load(csv)
+            self.assertEqual((cache.hits, cache.misses), (2, 2))
+            self.assertEqual([len(cache.load(csv)) for csv in csvs], [6, 7])
+
 
 """
 
@@ -3,5 +3,5 @@ from setuptools import setup
 
 setup(
     # ...
-    packages=['epispread', 'epispread.graph_classes']
+    packages=['epispread', 'epispread.graph_classes', 'epispread.data_classes']
 )